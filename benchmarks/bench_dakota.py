@@ -0,0 +1,253 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Benchmarks of the carolina binding and of the dispatch in dakota.py.
+
+Each benchmark yields named measurements with a unit and the direction in
+which they improve. The results are written as JSON and can be compared
+against a stored baseline:
+
+    python benchmarks/bench_dakota.py --output results.json
+    python benchmarks/bench_dakota.py --baseline results.json --tolerance 0.2
+
+The comparison exits with status 1 if a measurement got worse than the
+baseline by more than the tolerance.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from dakota import DakotaBase, DakotaInput
+from dakota_profile import RunProfile
+
+
+def study_input(method, variables, responses=('no_gradients', 'no_hessians'), nfns=1,
+                evaluation_concurrency=None, kind='continuous_design'):
+    return DakotaInput(
+        evaluation_concurrency=evaluation_concurrency,
+        environment=[],
+        method=method,
+        model=["single"],
+        variables=[f"{kind} = {variables}",
+                   "  lower_bounds " + " -1.0" * variables,
+                   "  upper_bounds " + " 1.0" * variables],
+        responses=[f"num_objective_functions = {nfns}"] + list(responses),
+    )
+
+
+class NoopDriver(DakotaBase):
+    """ Returns zero responses, through the keyword, batch or fast path. """
+
+    def __init__(self, dakota_input, mode='callback'):
+        super().__init__(dakota_input)
+        self.mode = mode
+        self.evaluations = 0
+
+    def dakota_callback(self, **kwargs):
+        self.evaluations += 1
+        nfns, nder = kwargs['functions'], len(kwargs['dvv'])
+        response = dict(fns=numpy.zeros(nfns))
+        if kwargs['asv'][0] & 2:
+            response['fnGrads'] = numpy.zeros((nfns, nder))
+        if kwargs['asv'][0] & 4:
+            response['fnHessians'] = numpy.zeros((nfns, nder, nder))
+        return response
+
+    def dakota_batch_callback(self, **kwargs):
+        self.evaluations += len(kwargs['currEvalId'])
+        return dict(fns=numpy.zeros((len(kwargs['currEvalId']), kwargs['functions'])))
+
+    def dakota_bind(self, metadata):
+        return self.evaluate if self.mode == 'fast' else None
+
+    def evaluate(self, evaluation):
+        self.evaluations += 1 if numpy.ndim(evaluation.eval_id) == 0 else len(evaluation.eval_id)
+        return None
+
+
+def run(driver, workdir, **kwargs):
+    return driver.run_dakota(infile=os.path.join(workdir, 'dakota.in'), write_restart=False,
+                             stdout=os.path.join(workdir, 'dakota.out'), **kwargs)
+
+
+def measure(name, value, unit, better):
+    return name, dict(value=float(value), unit=unit, better=better)
+
+
+def bench_import(repeat, **_):
+    """ Cold start time of ``import carolina`` and ``import dakota`` in a new interpreter. """
+    for module in ('carolina', 'dakota'):
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        times = [float(subprocess.check_output([sys.executable, '-c', code], text=True))
+                 for _ in range(repeat)]
+        yield measure(f'import_{module}', statistics.median(times), 's', 'lower')
+
+
+def bench_environment(repeat, workdir, **_):
+    """ Time from the start of a run to its first evaluation, dominated by the LibraryEnvironment construction. """
+    times = []
+    for _ in range(repeat):
+        driver = NoopDriver(study_input(["list_parameter_study", "  list_of_points = 0.0"], 1))
+        profile = RunProfile()
+        run(driver, workdir, profile=profile)
+        times.append(profile.records[0].start - profile.run_start)
+    yield measure('environment_construction', statistics.median(times), 's', 'lower')
+
+
+def bench_throughput(size, workdir, **_):
+    """ Evaluations per second of a no-op driver over large parameter studies and sampling. """
+    partitions = int(round(size ** 0.5)) - 1
+    studies = {
+        'multidim': (["multidim_parameter_study", f"  partitions = {partitions} {partitions}"],
+                     'continuous_design'),
+        'sampling': (["sampling", f"  samples = {size}", "  seed = 1234"], 'uniform_uncertain'),
+    }
+    for study, (method, kind) in studies.items():
+        for mode, concurrency in (('callback', None), ('batch', 256), ('fast', None)):
+            driver = NoopDriver(study_input(method, 2, evaluation_concurrency=concurrency, kind=kind), mode)
+            start = time.perf_counter()
+            run(driver, workdir)
+            wall = time.perf_counter() - start
+            yield measure(f'throughput_{study}_{mode}', driver.evaluations / wall, 'evaluations/s', 'higher')
+
+
+def bench_payload(size, workdir, **_):
+    """ Evaluations per second with analytic gradients and Hessians of growing size. """
+    points = max(size // 100, 10)
+    for variables in (10, 50, 200):
+        method = ["list_parameter_study",
+                  "  list_of_points = " + " ".join(["0.5"] * (variables * points))]
+        for mode in ('callback', 'fast'):
+            driver = NoopDriver(study_input(method, variables, ('analytic_gradients', 'analytic_hessians')),
+                                mode)
+            start = time.perf_counter()
+            run(driver, workdir)
+            wall = time.perf_counter() - start
+            yield measure(f'payload_{variables}_{mode}', driver.evaluations / wall, 'evaluations/s', 'higher')
+        yield measure(f'payload_{variables}_bytes', 8 * (1 + variables + variables * variables),
+                      'bytes/evaluation', 'lower')
+
+
+def rss():
+    """ Resident set size of this process in bytes. """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def bench_memory(repeat, workdir, **_):
+    """ Growth of the resident memory over repeated runs of a small study. """
+    runs = 10 * repeat
+    method = ["multidim_parameter_study", "  partitions = 9 9"]
+    run(NoopDriver(study_input(method, 2)), workdir)
+    gc.collect()
+    before = rss()
+    for _ in range(runs):
+        run(NoopDriver(study_input(method, 2)), workdir)
+    gc.collect()
+    yield measure('memory_growth_per_run', (rss() - before) / runs, 'bytes/run', 'lower')
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'environment': bench_environment,
+    'throughput': bench_throughput,
+    'payload': bench_payload,
+    'memory': bench_memory,
+}
+
+
+def run_benchmarks(names, size, repeat):
+    """ Run the named benchmarks and return their measurements by name. """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            for key, result in BENCHMARKS[name](size=size, repeat=repeat, workdir=workdir):
+                print(f"{key:40s} {result['value']:14.6g} {result['unit']}", flush=True)
+                results[key] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the measurements worse than the baseline by more than `tolerance`,
+    as (name, baseline value, value, relative change) tuples.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]['value']
+        if reference == 0:
+            continue
+        change = (result['value'] - reference) / abs(reference)
+        worse = -change if result['better'] == 'higher' else change
+        if worse > tolerance:
+            regressions.append((name, reference, result['value'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"the benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--size', type=int, default=10000, help='number of evaluations of the large studies')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of the short measurements')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown tolerated before a measurement is a regression')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.benchmarks or list(BENCHMARKS), args.size, args.repeat)
+    document = dict(
+        meta=dict(python=platform.python_version(), platform=platform.platform(),
+                  machine=platform.machine(), time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  size=args.size, repeat=args.repeat),
+        results=results,
+    )
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(document, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.tolerance)
+        for name, reference, value, change in regressions:
+            print(f"REGRESSION {name}: {reference:.6g} -> {value:.6g} ({change:+.1%})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -130,7 +130,11 @@ def get_carolina_extension():
         library_dirs.append(boost_lib)
         library_dirs.append(boost_lib64)
 
-    sources = ["src/dakface.cpp", "src/dakota_python_binding.cpp"]
+    sources = [
+        "src/dakface.cpp",
+        "src/carolina_interface.cpp",
+        "src/dakota_python_binding.cpp",
+    ]
 
     external_libs = [
         "boost_regex",
@@ -175,7 +179,9 @@ setup(
     description="A Python wrapper for DAKOTA",
     long_description=Path("README.md").read_text(encoding="utf-8"),
     long_description_content_type="text/markdown",
-    py_modules=["dakota"],
+    py_modules=["dakota", "dakota_cache", "dakota_profile", "dakota_stream", "dakota_gradients",
+                "dakota_output", "dakota_remote", "dakota_store", "dakota_failures",
+                "dakota_budget", "dakota_service"],
     ext_modules=[CAROLINA],
     package_dir={"": "src"},
     zip_safe=False,
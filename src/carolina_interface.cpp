@@ -0,0 +1,1067 @@
+// Copyright 2023 Equinor ASA
+//
+//    Licensed under the Apache License, Version 2.0 (the "License");
+//    you may not use this file except in compliance with the License.
+//    You may obtain a copy of the License at
+//
+//        http://www.apache.org/licenses/LICENSE-2.0
+//
+//    Unless required by applicable law or agreed to in writing, software
+//    distributed under the License is distributed on an "AS IS" BASIS,
+//    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+//    See the License for the specific language governing permissions and
+//    limitations under the License.
+//
+// ++==++==++==++==++==++==++==++==++==++==
+// Direct application interface plugged into the Dakota environment in place
+// of Dakota's own Python interface.  Queued asynchronous evaluations are
+// marshalled into stacked NumPy arrays so that a whole batch crosses the
+// C++/Python boundary in one call.
+
+#include "carolina_interface.hpp"
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <fstream>
+#include <iostream>
+#include <memory>
+#include <vector>
+
+#include <boost/archive/binary_iarchive.hpp>
+#include <boost/python.hpp>
+namespace bp = boost::python;
+
+// The NumPy C-API table is imported in dakota_python_binding.cpp.
+#define PY_ARRAY_UNIQUE_SYMBOL CAROLINA_ARRAY_API
+#define NO_IMPORT_ARRAY
+#include <numpy/arrayobject.h>
+
+#include "DakotaModel.hpp"
+#include "DakotaResponse.hpp"
+#include "DakotaVariables.hpp"
+#include "dakota_global_defs.hpp"
+#include "ParamResponsePair.hpp"
+#include "PRPMultiIndex.hpp"
+#include "ProblemDescDB.hpp"
+
+namespace Dakota {
+  extern PRPCache data_pairs;
+}
+using namespace Dakota;
+
+namespace carolina {
+
+const char *DRIVER_NAME = "carolina";
+
+namespace {
+
+typedef std::chrono::steady_clock Clock;
+
+/// One evaluation: inputs are read from Dakota, outputs are written straight
+/// into the (shallow copied) response.
+struct Point
+{
+  const Variables *vars;
+  const ActiveSet *set;
+  Response response;
+  int evalId;
+  /// the evaluation failed in Python, its response is not set
+  bool failed = false;
+};
+
+bp::object to_object(PyObject *obj)
+{
+  if (!obj)
+    bp::throw_error_already_set();
+  return bp::object(bp::handle<>(obj));
+}
+
+[[noreturn]] void raise(PyObject *type, const std::string& msg)
+{
+  PyErr_SetString(type, msg.c_str());
+  throw bp::error_already_set();
+}
+
+/// Clear the pending Python error and return true if it is an
+/// dakota_failures.EvaluationFailure, leave it pending otherwise.
+bool evaluation_failed()
+{
+  PyObject *type, *value, *traceback;
+  PyErr_Fetch(&type, &value, &traceback);
+  static PyObject *failure = NULL;
+  if (!failure) {
+    PyObject *module = PyImport_ImportModule("dakota_failures");
+    if (module) {
+      failure = PyObject_GetAttrString(module, "EvaluationFailure");
+      Py_DECREF(module);
+    }
+    PyErr_Clear();
+  }
+
+  if (failure && PyErr_GivenExceptionMatches(type, failure)) {
+    Py_XDECREF(type);
+    Py_XDECREF(value);
+    Py_XDECREF(traceback);
+    return true;
+  }
+  PyErr_Restore(type, value, traceback);
+  return false;
+}
+
+template <typename T>
+size_t size_of(const std::vector<T>& values) { return values.size(); }
+
+template <typename O, typename T>
+size_t size_of(const Teuchos::SerialDenseVector<O, T>& values)
+{ return (size_t)values.length(); }
+
+bp::list labels(StringMultiArrayConstView names)
+{
+  bp::list out;
+  for (size_t i = 0; i < names.size(); ++i)
+    out.append(bp::str(names[i].c_str()));
+  return out;
+}
+
+/// Stack one value vector per point into an array of shape (npts, n), or
+/// (n,) when not stacked.
+template <typename VecT, typename GetT>
+bp::object pack(const std::vector<Point>& batch, bool stacked, int type,
+                size_t n, GetT get)
+{
+  npy_intp dims[2] = {(npy_intp)batch.size(), (npy_intp)n};
+  PyObject *arr = stacked ? PyArray_ZEROS(2, dims, type, 0)
+                          : PyArray_ZEROS(1, dims + 1, type, 0);
+  bp::object out = to_object(arr);
+  char *data = (char *)PyArray_DATA((PyArrayObject *)arr);
+  npy_intp itemsize = PyArray_ITEMSIZE((PyArrayObject *)arr);
+  for (size_t p = 0; p < batch.size(); ++p) {
+    const VecT& values = get(batch[p]);
+    for (size_t i = 0; i < n && i < size_of(values); ++i) {
+      char *item = data + (p * n + i) * itemsize;
+      if (type == NPY_DOUBLE)
+        *(double *)item = (double)values[i];
+      else
+        *(int *)item = (int)values[i];
+    }
+  }
+  return out;
+}
+
+bp::object pack_all(const std::vector<Point>& batch, bool stacked,
+                    size_t ncv, size_t ndiv, size_t ndrv)
+{
+  size_t nav = ncv + ndiv + ndrv;
+  npy_intp dims[2] = {(npy_intp)batch.size(), (npy_intp)nav};
+  PyObject *arr = stacked ? PyArray_ZEROS(2, dims, NPY_DOUBLE, 0)
+                          : PyArray_ZEROS(1, dims + 1, NPY_DOUBLE, 0);
+  bp::object out = to_object(arr);
+  double *data = (double *)PyArray_DATA((PyArrayObject *)arr);
+  for (size_t p = 0; p < batch.size(); ++p) {
+    double *row = data + p * nav;
+    const Variables& vars = *batch[p].vars;
+    for (size_t i = 0; i < ncv; ++i)
+      row[i] = vars.continuous_variables()[i];
+    for (size_t i = 0; i < ndiv; ++i)
+      row[ncv + i] = vars.discrete_int_variables()[i];
+    for (size_t i = 0; i < ndrv; ++i)
+      row[ncv + ndiv + i] = vars.discrete_real_variables()[i];
+  }
+  return out;
+}
+
+/// Fetch `key` from the returned dictionary as a C-contiguous double array
+/// with `ndim` dimensions, or None when the key is absent.
+bp::object returned_array(const bp::dict& result, const char *key, int ndim)
+{
+  if (!result.has_key(key))
+    return bp::object();
+  bp::object value = result[key];
+  return to_object(PyArray_FROMANY(value.ptr(), NPY_DOUBLE, ndim, ndim,
+                                   NPY_ARRAY_IN_ARRAY));
+}
+
+/// Return a pointer to the block of `row` holding `block` values, checking
+/// that the array has the expected shape.
+const double *row_data(const bp::object& arr, const char *key, size_t npts,
+                       bool stacked, size_t row, size_t block)
+{
+  PyArrayObject *a = (PyArrayObject *)arr.ptr();
+  size_t size = (size_t)PyArray_SIZE(a);
+  if ((stacked && (size_t)PyArray_DIM(a, 0) != npts) || size != npts * block)
+    raise(PyExc_ValueError, std::string("Returned '") + key +
+          "' does not match the number of points and functions requested");
+  return (const double *)PyArray_DATA(a) + row * block;
+}
+
+void unpack(const bp::object& result_obj, std::vector<Point>& batch,
+            bool stacked)
+{
+  if (!PyDict_Check(result_obj.ptr()))
+    raise(PyExc_TypeError, "The callback must return a dictionary of responses");
+  bp::dict result = bp::extract<bp::dict>(result_obj);
+
+  int extra = stacked ? 1 : 0;
+  bp::object fns = returned_array(result, "fns", 1 + extra);
+  bp::object grads = returned_array(result, "fnGrads", 2 + extra);
+  bp::object hessians = returned_array(result, "fnHessians", 3 + extra);
+
+  // Optional mask of the evaluations that failed
+  size_t npts = batch.size();
+  if (result.has_key("failed")) {
+    bp::object failed = to_object(PyArray_FROMANY(bp::object(result["failed"]).ptr(), NPY_BOOL,
+                                                  extra, extra, NPY_ARRAY_IN_ARRAY));
+    if ((size_t)PyArray_SIZE((PyArrayObject *)failed.ptr()) != npts)
+      raise(PyExc_ValueError, "Returned 'failed' does not match the number of points");
+    const npy_bool *mask = (const npy_bool *)PyArray_DATA((PyArrayObject *)failed.ptr());
+    for (size_t p = 0; p < npts; ++p)
+      batch[p].failed = mask[p] != 0;
+  }
+
+  for (size_t p = 0; p < npts; ++p) {
+    Point& point = batch[p];
+    if (point.failed)
+      continue;
+    const ShortArray& asv = point.set->request_vector();
+    size_t nfns = asv.size();
+    size_t nder = point.set->derivative_vector().size();
+
+    for (size_t i = 0; i < nfns; ++i) {
+      if ((asv[i] & 1) && fns.is_none())
+        raise(PyExc_ValueError, "Function values requested but 'fns' not returned");
+      if ((asv[i] & 2) && grads.is_none())
+        raise(PyExc_ValueError, "Gradients requested but 'fnGrads' not returned");
+      if ((asv[i] & 4) && hessians.is_none())
+        raise(PyExc_ValueError, "Hessians requested but 'fnHessians' not returned");
+    }
+
+    const double *f = fns.is_none() ? NULL :
+      row_data(fns, "fns", npts, stacked, p, nfns);
+    const double *g = grads.is_none() ? NULL :
+      row_data(grads, "fnGrads", npts, stacked, p, nfns * nder);
+    const double *h = hessians.is_none() ? NULL :
+      row_data(hessians, "fnHessians", npts, stacked, p, nfns * nder * nder);
+
+    for (size_t i = 0; i < nfns; ++i) {
+      if (asv[i] & 1)
+        point.response.function_value(f[i], i);
+      if (asv[i] & 2) {
+        RealVector fn_grad = point.response.function_gradient_view(i);
+        for (size_t j = 0; j < nder; ++j)
+          fn_grad[j] = g[i * nder + j];
+      }
+      if (asv[i] & 4) {
+        RealSymMatrix fn_hess = point.response.function_hessian_view(i);
+        const double *hi = h + i * nder * nder;
+        for (size_t j = 0; j < nder; ++j)
+          for (size_t k = 0; k <= j; ++k)
+            fn_hess(j, k) = hi[j * nder + k];
+      }
+    }
+  }
+}
+
+size_t num_variables(const Variables& vars)
+{
+  return vars.continuous_variables().length() +
+    vars.discrete_int_variables().length() +
+    vars.discrete_real_variables().length();
+}
+
+/// Copy the continuous, discrete integer and discrete real values to `out`.
+void variable_values(const Variables& vars, double *out)
+{
+  const RealVector& cv = vars.continuous_variables();
+  const IntVector& div = vars.discrete_int_variables();
+  const RealVector& drv = vars.discrete_real_variables();
+  for (int i = 0; i < cv.length(); ++i)
+    *out++ = cv[i];
+  for (int i = 0; i < div.length(); ++i)
+    *out++ = div[i];
+  for (int i = 0; i < drv.length(); ++i)
+    *out++ = drv[i];
+}
+
+/// Read-only array of `n` values of `type` at `data`, without a copy.  The
+/// array must not outlive the callback it is passed to.
+bp::object view(const void *data, npy_intp n, int type)
+{
+  if (n == 0)
+    return to_object(PyArray_ZEROS(1, &n, type, 0));
+  return to_object(PyArray_New(&PyArray_Type, 1, &n, type, NULL, (void *)data,
+                               0, NPY_ARRAY_C_CONTIGUOUS | NPY_ARRAY_ALIGNED,
+                               NULL));
+}
+
+/// Writable array of doubles at `data` with the given dimensions and
+/// strides in bytes, without a copy.  Same lifetime rule as view().
+bp::object writable_view(double *data, int nd, npy_intp *dims,
+                         npy_intp *strides)
+{
+  if (!data || PyArray_MultiplyList(dims, nd) == 0)
+    return to_object(PyArray_ZEROS(nd, dims, NPY_DOUBLE, 0));
+  return to_object(PyArray_New(&PyArray_Type, nd, dims, NPY_DOUBLE, strides,
+                               data, 0, NPY_ARRAY_WRITEABLE | NPY_ARRAY_ALIGNED,
+                               NULL));
+}
+
+/// True if any function of `asv` requests `bit`.
+bool requested(const ShortArray& asv, short bit)
+{
+  for (short request : asv)
+    if (request & bit)
+      return true;
+  return false;
+}
+
+/// Writable views on the response storage of a single point: 'fns' of shape
+/// (nfns,), 'fnGrads' of shape (nfns, nder) and a list of nfns (nder, nder)
+/// 'fnHessians', the latter two only when requested by the active set.
+void response_views(Point& point, bp::object& fns, bp::object& grads,
+                    bp::object& hessians)
+{
+  const ShortArray& asv = point.set->request_vector();
+  npy_intp item = sizeof(double);
+
+  RealVector values = point.response.function_values_view();
+  npy_intp nfns = values.length();
+  fns = writable_view(values.values(), 1, &nfns, &item);
+
+  // Gradients are the columns of a column-major (nder, nfns) matrix.
+  if (requested(asv, 2)) {
+    RealMatrix gradients = point.response.function_gradients_view();
+    npy_intp dims[2] = {gradients.numCols(), gradients.numRows()};
+    npy_intp strides[2] = {gradients.stride() * item, item};
+    grads = writable_view(gradients.values(), 2, dims, strides);
+  }
+
+  // Each Hessian is stored in full, the driver must fill both triangles.
+  if (requested(asv, 4)) {
+    bp::list views;
+    for (npy_intp i = 0; i < nfns; ++i) {
+      RealSymMatrix hessian = point.response.function_hessian_view(i);
+      npy_intp dims[2] = {hessian.numRows(), hessian.numRows()};
+      npy_intp strides[2] = {item, hessian.stride() * item};
+      views.append(writable_view(hessian.values(), 2, dims, strides));
+    }
+    hessians = views;
+  }
+}
+
+bp::object new_array(int nd, npy_intp *dims, int type)
+{
+  return to_object(PyArray_ZEROS(nd, dims, type, 0));
+}
+
+template <typename T>
+T *array_data(const bp::object& arr)
+{
+  return (T *)PyArray_DATA((PyArrayObject *)arr.ptr());
+}
+
+} // namespace
+
+
+/// Number of CarolinaInterface instances alive, see live_interfaces
+static std::atomic<int> liveInterfaces(0);
+
+int live_interfaces()
+{
+  return liveInterfaces;
+}
+
+
+CarolinaInterface::CarolinaInterface(const ProblemDescDB& problem_db,
+                                     PyObject *run):
+  DirectApplicInterface(problem_db), run(run), cacheLimit(0)
+{
+  ++liveInterfaces;
+  if (!run)
+    return;
+  GILAcquire gil;
+  PyObject *limit = PyObject_GetAttrString(run, "cache_limit");
+  if (limit && limit != Py_None)
+    cacheLimit = PyLong_AsSize_t(limit);
+  Py_XDECREF(limit);
+  if (PyErr_Occurred()) {
+    PyErr_Clear();
+    cacheLimit = 0;
+  }
+}
+
+
+void CarolinaInterface::trim_cache()
+{
+  // The default index of the cache is ordered by evaluation ID.
+  while (cacheLimit > 0 && data_pairs.size() > cacheLimit)
+    data_pairs.erase(data_pairs.begin());
+}
+
+
+CarolinaInterface::~CarolinaInterface()
+{
+  --liveInterfaces;
+  if (!fast[0].bound && !fast[1].bound)
+    return;
+  GILAcquire gil;
+  for (FastPath& fp : fast) {
+    Py_XDECREF(fp.callback);
+    Py_XDECREF(fp.evaluation_type);
+  }
+}
+
+
+/// The entries of the callback arguments that are the same for every
+/// evaluation of the batch: sizes, labels and analysis components.
+static bp::dict metadata(const std::vector<Point>& batch,
+                         const StringArray& an_comps)
+{
+  const Variables& vars0 = *batch.front().vars;
+  bp::dict kwargs;
+  kwargs["functions"] = batch.front().set->request_vector().size();
+  kwargs["variables"] = num_variables(vars0);
+
+  bp::list cv_labels = labels(vars0.continuous_variable_labels());
+  bp::list div_labels = labels(vars0.discrete_int_variable_labels());
+  bp::list drv_labels = labels(vars0.discrete_real_variable_labels());
+  kwargs["cv_labels"] = cv_labels;
+  kwargs["div_labels"] = div_labels;
+  kwargs["drv_labels"] = drv_labels;
+  kwargs["av_labels"] = cv_labels + div_labels + drv_labels;
+
+  bp::list fn_labels;
+  for (const String& label : batch.front().response.function_labels())
+    fn_labels.append(bp::str(label.c_str()));
+  kwargs["fn_labels"] = fn_labels;
+
+  bp::list comps;
+  for (const String& comp : an_comps)
+    comps.append(bp::str(comp.c_str()));
+  kwargs["analysis_components"] = comps;
+  return kwargs;
+}
+
+
+/// Hand `batch` to the callable bound by dakota_bind as one evaluation
+/// object.  A single point gets read-only views on the buffers of its
+/// variables and active set and writable views on its response, a batch
+/// gets stacked copies and zeroed response arrays.  When the callable
+/// returns None, the responses are taken from these views and arrays.
+/// Called with the GIL.
+static void evaluate_fast(std::vector<Point>& batch, bool stacked,
+                          const FastPath& fp)
+{
+  bp::object type(bp::handle<>(bp::borrowed(fp.evaluation_type)));
+  bp::object callback(bp::handle<>(bp::borrowed(fp.callback)));
+
+  bp::object evaluation;
+  bp::object fns, grads, hessians;
+  if (stacked) {
+    const Variables& vars0 = *batch.front().vars;
+    size_t nfns = batch.front().set->request_vector().size();
+    size_t nder = batch.front().set->derivative_vector().size();
+    bool any_grads = false, any_hessians = false;
+    for (const Point& p : batch) {
+      any_grads = any_grads || requested(p.set->request_vector(), 2);
+      any_hessians = any_hessians || requested(p.set->request_vector(), 4);
+    }
+    npy_intp dims[4] = {(npy_intp)batch.size(), (npy_intp)nfns,
+                        (npy_intp)nder, (npy_intp)nder};
+    fns = new_array(2, dims, NPY_DOUBLE);
+    if (any_grads)
+      grads = new_array(3, dims, NPY_DOUBLE);
+    if (any_hessians)
+      hessians = new_array(4, dims, NPY_DOUBLE);
+
+    bp::list ids;
+    for (const Point& p : batch)
+      ids.append(p.evalId);
+    evaluation = type(ids,
+      pack<RealVector>(batch, true, NPY_DOUBLE, vars0.continuous_variables().length(),
+        [](const Point& p) -> const RealVector& { return p.vars->continuous_variables(); }),
+      pack<IntVector>(batch, true, NPY_INT, vars0.discrete_int_variables().length(),
+        [](const Point& p) -> const IntVector& { return p.vars->discrete_int_variables(); }),
+      pack<RealVector>(batch, true, NPY_DOUBLE, vars0.discrete_real_variables().length(),
+        [](const Point& p) -> const RealVector& { return p.vars->discrete_real_variables(); }),
+      pack<ShortArray>(batch, true, NPY_INT, nfns,
+        [](const Point& p) -> const ShortArray& { return p.set->request_vector(); }),
+      pack<SizetArray>(batch, true, NPY_INT, nder,
+        [](const Point& p) -> const SizetArray& { return p.set->derivative_vector(); }),
+      fns, grads, hessians);
+  }
+  else {
+    Point& p = batch.front();
+    response_views(p, fns, grads, hessians);
+    const RealVector& cv = p.vars->continuous_variables();
+    const IntVector& div = p.vars->discrete_int_variables();
+    const RealVector& drv = p.vars->discrete_real_variables();
+    // The short and size_t vectors are copied to ints, as on the other paths
+    evaluation = type(p.evalId,
+                      view(cv.values(), cv.length(), NPY_DOUBLE),
+                      view(div.values(), div.length(), NPY_INT),
+                      view(drv.values(), drv.length(), NPY_DOUBLE),
+                      pack<ShortArray>(batch, false, NPY_INT, p.set->request_vector().size(),
+                        [](const Point& p) -> const ShortArray& { return p.set->request_vector(); }),
+                      pack<SizetArray>(batch, false, NPY_INT, p.set->derivative_vector().size(),
+                        [](const Point& p) -> const SizetArray& { return p.set->derivative_vector(); }),
+                      fns, grads, hessians);
+  }
+
+  bp::object result;
+  try {
+    result = callback(evaluation);
+  }
+  catch (const bp::error_already_set&) {
+    if (!evaluation_failed())
+      throw;
+    for (Point& p : batch)
+      p.failed = true;
+    return;
+  }
+  if (!result.is_none())
+    unpack(result, batch, stacked);
+  else if (stacked) {
+    bp::dict filled;
+    filled["fns"] = fns;
+    if (!grads.is_none())
+      filled["fnGrads"] = grads;
+    if (!hessians.is_none())
+      filled["fnHessians"] = hessians;
+    unpack(filled, batch, stacked);
+  }
+  // else the response views were filled in place
+}
+
+
+/// Report the conversion times of one evaluation to a run that is being
+/// profiled, on every exit of evaluate(): the evaluation is failed unless
+/// its response was unpacked.  Constructed and destroyed with the GIL held.
+class MarshalReport
+{
+public:
+  MarshalReport(PyObject *run, Clock::time_point pack_start) :
+    pack_start(pack_start), call_start(pack_start), call_end(pack_start)
+  {
+    if (!run)
+      return;
+    bp::object target(bp::handle<>(bp::borrowed(run)));
+    if (!target.attr("profile").is_none())
+      this->target = target;
+  }
+
+  ~MarshalReport()
+  {
+    if (target.is_none())
+      return;
+    // An error leaving evaluate() stays pending for the caller.
+    PyObject *type, *value, *traceback;
+    PyErr_Fetch(&type, &value, &traceback);
+    try {
+      std::chrono::duration<double> pack = call_start - pack_start;
+      std::chrono::duration<double> unpacking(0);
+      if (returned)
+        unpacking = Clock::now() - call_end;
+      target.attr("dakota_marshalled")(pack.count(), unpacking.count(), failed);
+    }
+    catch (const bp::error_already_set&) {
+      PyErr_WriteUnraisable(target.ptr());
+    }
+    catch (...) {
+    }
+    PyErr_Restore(type, value, traceback);
+  }
+
+  void calling() { call_start = Clock::now(); }
+  void called() { call_end = Clock::now(); returned = true; }
+  void unpacked() { failed = false; }
+
+private:
+  bp::object target;
+  Clock::time_point pack_start, call_start, call_end;
+  bool returned = false;
+  bool failed = true;
+};
+
+
+/// Marshal `batch` into one keyword dictionary, call Python and copy the
+/// returned responses back.  When `stacked`, every per-point entry gets a
+/// leading axis of length batch.size() and dakota_batch_callback is called,
+/// otherwise the single point is passed to dakota_callback as Dakota's own
+/// Python interface would.  Drivers bound by dakota_bind take the fast path
+/// instead.  Called without the GIL.
+static void evaluate(std::vector<Point>& batch, bool stacked,
+                     const StringArray& an_comps, PyObject *run, FastPath& fp)
+{
+  GILAcquire gil;
+  Clock::time_point pack_start = Clock::now();
+
+  if (run && !fp.bound) {
+    // Labels and sizes are delivered once, the driver is looked up once.
+    fp.bound = true;
+    bp::dict meta = metadata(batch, an_comps);
+    meta["batch"] = stacked;
+    bp::object bound = bp::object(bp::handle<>(bp::borrowed(run))).attr("dakota_bind")(meta);
+    if (!bound.is_none()) {
+      fp.callback = bp::incref(bp::object(bound[0]).ptr());
+      fp.evaluation_type = bp::incref(bp::object(bound[1]).ptr());
+    }
+  }
+  if (fp.callback) {
+    evaluate_fast(batch, stacked, fp);
+    return;
+  }
+  MarshalReport report(run, pack_start);
+
+  const Variables& vars0 = *batch.front().vars;
+  size_t ncv = vars0.continuous_variables().length();
+  size_t ndiv = vars0.discrete_int_variables().length();
+  size_t ndrv = vars0.discrete_real_variables().length();
+  size_t nfns = batch.front().set->request_vector().size();
+  size_t nder = batch.front().set->derivative_vector().size();
+
+  bp::dict kwargs = metadata(batch, an_comps);
+  kwargs["cv"] = pack<RealVector>(batch, stacked, NPY_DOUBLE, ncv,
+    [](const Point& p) -> const RealVector& { return p.vars->continuous_variables(); });
+  kwargs["div"] = pack<IntVector>(batch, stacked, NPY_INT, ndiv,
+    [](const Point& p) -> const IntVector& { return p.vars->discrete_int_variables(); });
+  kwargs["drv"] = pack<RealVector>(batch, stacked, NPY_DOUBLE, ndrv,
+    [](const Point& p) -> const RealVector& { return p.vars->discrete_real_variables(); });
+  kwargs["av"] = pack_all(batch, stacked, ncv, ndiv, ndrv);
+
+  kwargs["asv"] = pack<ShortArray>(batch, stacked, NPY_INT, nfns,
+    [](const Point& p) -> const ShortArray& { return p.set->request_vector(); });
+  kwargs["dvv"] = pack<SizetArray>(batch, stacked, NPY_INT, nder,
+    [](const Point& p) -> const SizetArray& { return p.set->derivative_vector(); });
+
+  if (stacked) {
+    bp::list ids;
+    for (const Point& p : batch)
+      ids.append(p.evalId);
+    kwargs["currEvalId"] = ids;
+  }
+  else
+    kwargs["currEvalId"] = batch.front().evalId;
+
+  bp::object target = run ? bp::object(bp::handle<>(bp::borrowed(run)))
+                         : bp::import("dakota");
+  bp::object callback = target.attr(stacked ? "dakota_batch_callback"
+                                            : "dakota_callback");
+
+  report.calling();
+  bp::object result;
+  try {
+    result = callback(kwargs);
+  }
+  catch (const bp::error_already_set&) {
+    // Failed evaluations are handed to Dakota's failure capture.
+    if (!evaluation_failed())
+      throw;
+    for (Point& p : batch)
+      p.failed = true;
+    return;
+  }
+  report.called();
+  unpack(result, batch, stacked);
+  report.unpacked();
+}
+
+
+void CarolinaInterface::
+derived_map(const Variables& vars, const ActiveSet& set, Response& response,
+            int fn_eval_id)
+{
+  trim_cache();
+  std::vector<Point> batch(1, Point{&vars, &set, response, fn_eval_id});
+  evaluate(batch, false, analysisComponents.empty() ? StringArray()
+                                                    : analysisComponents[0],
+           run, fast[0]);
+  // Dakota's map manages the failure as set by failure_capture.
+  if (batch.front().failed)
+    throw FunctionEvalFailure("evaluation " + std::to_string(fn_eval_id) + " failed");
+}
+
+
+void CarolinaInterface::derived_map_asynch(const ParamResponsePair& pair)
+{ }
+
+
+void CarolinaInterface::wait_local_evaluations(PRPQueue& prp_queue)
+{
+  if (prp_queue.empty())
+    return;
+
+  trim_cache();
+  std::vector<Point> batch;
+  batch.reserve(prp_queue.size());
+  for (PRPQueueIter prp_iter = prp_queue.begin();
+       prp_iter != prp_queue.end(); ++prp_iter)
+    batch.push_back(Point{&prp_iter->variables(), &prp_iter->active_set(),
+                          prp_iter->response(), prp_iter->eval_id()});
+
+  evaluate(batch, true, analysisComponents.empty() ? StringArray()
+                                                   : analysisComponents[0],
+           run, fast[1]);
+
+  for (Point& point : batch) {
+    if (point.failed)
+      manage_failure(*point.vars, *point.set, point.response, point.evalId);
+    completionSet.insert(point.evalId);
+  }
+}
+
+
+void CarolinaInterface::test_local_evaluations(PRPQueue& prp_queue)
+{
+  wait_local_evaluations(prp_queue);
+}
+
+
+void CarolinaInterface::set_communicators_checks(int max_eval_concurrency)
+{ }
+
+
+int plugin_interfaces(LibraryEnvironment& env, PyObject *run)
+{
+  ProblemDescDB& problem_db = env.problem_description_db();
+  ModelList& models = problem_db.model_list();
+  int plugged_in = 0;
+  for (ModelLIter m_iter = models.begin(); m_iter != models.end(); ++m_iter) {
+    if (m_iter->model_type() != "simulation")
+      continue;
+    Interface& model_interface = m_iter->derived_interface();
+    const StringArray& drivers = model_interface.analysis_drivers();
+    if (std::find(drivers.begin(), drivers.end(), DRIVER_NAME) == drivers.end())
+      continue;
+    // The DirectApplicInterface constructor reads the active DB node.
+    problem_db.set_db_interface_node(model_interface.interface_id());
+    model_interface.assign_rep(std::make_shared<CarolinaInterface>(problem_db, run));
+    ++plugged_in;
+  }
+  return plugged_in;
+}
+
+
+static void store_history(bp::object& results, npy_intp nvars, npy_intp nfns);
+
+void store_results(LibraryEnvironment& env, PyObject *run)
+{
+  if (!run)
+    return;
+
+  GILAcquire gil;
+  bp::object target(bp::handle<>(bp::borrowed(run)));
+  bp::object results = target.attr("results");
+  if (results.is_none())
+    return;
+
+  // Final point of the top level iterator
+  const Variables& vars = env.variables_results();
+  const Response& resp = env.response_results();
+  npy_intp nvars = num_variables(vars);
+  bp::object final_vars = new_array(1, &nvars, NPY_DOUBLE);
+  variable_values(vars, array_data<double>(final_vars));
+  results.attr("final_variables") = final_vars;
+  results.attr("variable_labels") =
+    labels(vars.continuous_variable_labels()) +
+    labels(vars.discrete_int_variable_labels()) +
+    labels(vars.discrete_real_variable_labels());
+
+  const RealVector& fn_vals = resp.function_values();
+  npy_intp nfns = fn_vals.length();
+  bp::object final_fns = new_array(1, &nfns, NPY_DOUBLE);
+  std::copy(fn_vals.values(), fn_vals.values() + nfns, array_data<double>(final_fns));
+  results.attr("final_responses") = final_fns;
+  bp::list fn_labels;
+  for (const String& label : resp.function_labels())
+    fn_labels.append(bp::str(label.c_str()));
+  results.attr("response_labels") = fn_labels;
+
+  store_history(results, nvars, nfns);
+}
+
+
+/// Fill the history attributes of `results` with the evaluations held in
+/// Dakota's evaluation cache, in evaluation order.  Only evaluations with
+/// `nvars` variables and `nfns` functions are kept.
+static void store_history(bp::object& results, npy_intp nvars, npy_intp nfns)
+{
+  npy_intp npts = 0;
+  for (const ParamResponsePair& prp : data_pairs)
+    if ((npy_intp)num_variables(prp.variables()) == nvars &&
+        (npy_intp)prp.response().num_functions() == nfns)
+      ++npts;
+
+  npy_intp var_dims[2] = {npts, nvars};
+  npy_intp fn_dims[2] = {npts, nfns};
+  bp::object ids = new_array(1, &npts, NPY_INT);
+  bp::object history_vars = new_array(2, var_dims, NPY_DOUBLE);
+  bp::object history_fns = new_array(2, fn_dims, NPY_DOUBLE);
+  bp::object history_asv = new_array(2, fn_dims, NPY_SHORT);
+
+  int *id = array_data<int>(ids);
+  double *x = array_data<double>(history_vars);
+  double *f = array_data<double>(history_fns);
+  short *a = array_data<short>(history_asv);
+  for (const ParamResponsePair& prp : data_pairs) {
+    const Response& prp_resp = prp.response();
+    if ((npy_intp)num_variables(prp.variables()) != nvars ||
+        (npy_intp)prp_resp.num_functions() != nfns)
+      continue;
+    *id++ = prp.eval_id();
+    variable_values(prp.variables(), x);
+    x += nvars;
+    const RealVector& values = prp_resp.function_values();
+    std::copy(values.values(), values.values() + nfns, f);
+    f += nfns;
+    const ShortArray& asv = prp.active_set().request_vector();
+    std::copy(asv.begin(), asv.end(), a);
+    a += nfns;
+  }
+
+  results.attr("eval_ids") = ids;
+  results.attr("variables") = history_vars;
+  results.attr("responses") = history_fns;
+  results.attr("asv") = history_asv;
+}
+
+
+void store_partial_results(PyObject *run)
+{
+  if (!run || data_pairs.empty())
+    return;
+
+  GILAcquire gil;
+  // The error ending the run stays pending for the caller.
+  PyObject *type, *value, *traceback;
+  PyErr_Fetch(&type, &value, &traceback);
+  try {
+    bp::object target(bp::handle<>(bp::borrowed(run)));
+    bp::object results = target.attr("results");
+    if (!results.is_none()) {
+      // Labels and sizes of the last evaluation
+      const ParamResponsePair& last = *data_pairs.rbegin();
+      const Variables& vars = last.variables();
+      results.attr("variable_labels") =
+        labels(vars.continuous_variable_labels()) +
+        labels(vars.discrete_int_variable_labels()) +
+        labels(vars.discrete_real_variable_labels());
+      bp::list fn_labels;
+      for (const String& label : last.response().function_labels())
+        fn_labels.append(bp::str(label.c_str()));
+      results.attr("response_labels") = fn_labels;
+      store_history(results, num_variables(vars), last.response().num_functions());
+    }
+  }
+  catch (const bp::error_already_set&) {
+    PyErr_WriteUnraisable(run);
+  }
+  PyErr_Restore(type, value, traceback);
+}
+
+
+/// The callback arguments of the evaluation of `prp` that identify it, as
+/// used by the evaluation cache, and its response.
+static bp::tuple restart_entry(const ParamResponsePair& prp)
+{
+  const Variables& vars = prp.variables();
+  const ActiveSet& set = prp.active_set();
+  const Response& resp = prp.response();
+
+  bp::dict point;
+  point["currEvalId"] = prp.eval_id();
+  npy_intp nvars = num_variables(vars);
+  bp::object av = new_array(1, &nvars, NPY_DOUBLE);
+  variable_values(vars, array_data<double>(av));
+  point["av"] = av;
+  point["av_labels"] =
+    labels(vars.continuous_variable_labels()) +
+    labels(vars.discrete_int_variable_labels()) +
+    labels(vars.discrete_real_variable_labels());
+
+  const ShortArray& asv = set.request_vector();
+  const SizetArray& dvv = set.derivative_vector();
+  npy_intp nfns = asv.size(), nder = dvv.size();
+  bp::object asv_arr = new_array(1, &nfns, NPY_INT);
+  std::copy(asv.begin(), asv.end(), array_data<int>(asv_arr));
+  bp::object dvv_arr = new_array(1, &nder, NPY_INT);
+  std::copy(dvv.begin(), dvv.end(), array_data<int>(dvv_arr));
+  point["asv"] = asv_arr;
+  point["dvv"] = dvv_arr;
+
+  bp::dict response;
+  const RealVector& values = resp.function_values();
+  bp::object fns = new_array(1, &nfns, NPY_DOUBLE);
+  std::copy(values.values(), values.values() + std::min<npy_intp>(nfns, values.length()),
+            array_data<double>(fns));
+  response["fns"] = fns;
+
+  if (requested(asv, 2)) {
+    npy_intp dims[2] = {nfns, nder};
+    bp::object grads = new_array(2, dims, NPY_DOUBLE);
+    double *g = array_data<double>(grads);
+    for (npy_intp i = 0; i < nfns; ++i) {
+      const Real *column = resp.function_gradients()[i];
+      std::copy(column, column + nder, g + i * nder);
+    }
+    response["fnGrads"] = grads;
+  }
+  if (requested(asv, 4)) {
+    npy_intp dims[3] = {nfns, nder, nder};
+    bp::object hessians = new_array(3, dims, NPY_DOUBLE);
+    double *h = array_data<double>(hessians);
+    for (npy_intp i = 0; i < nfns; ++i) {
+      const RealSymMatrix& hessian = resp.function_hessians()[i];
+      for (npy_intp j = 0; j < nder; ++j)
+        for (npy_intp k = 0; k < nder; ++k)
+          h[(i * nder + j) * nder + k] = hessian(j, k);
+    }
+    response["fnHessians"] = hessians;
+  }
+  return bp::make_tuple(point, response);
+}
+
+
+bp::list read_restart(const std::string& path, int stop_restart)
+{
+  std::vector<ParamResponsePair> pairs;
+  bool opened = true;
+  {
+    GILRelease nogil;
+    std::ifstream restart_input_fs(path.c_str(), std::ios::binary);
+    if (!restart_input_fs.good())
+      opened = false;
+    else {
+      // Read records until the end of the file, as Dakota's restart utility
+      // does: a truncated last record ends the replay.
+      try {
+        boost::archive::binary_iarchive restart_input_archive(restart_input_fs);
+        while (restart_input_fs.good() && !restart_input_fs.eof() &&
+               (stop_restart <= 0 || (int)pairs.size() < stop_restart)) {
+          ParamResponsePair current_pair;
+          try {
+            restart_input_archive & current_pair;
+          }
+          catch (const boost::archive::archive_exception&) {
+            break;
+          }
+          pairs.push_back(current_pair);
+          restart_input_fs.peek();
+        }
+      }
+      catch (const boost::archive::archive_exception&) {
+        // Not a restart file, or an empty one.
+      }
+    }
+  }
+  if (!opened)
+    raise(PyExc_FileNotFoundError, "Cannot open restart file '" + path + "'");
+
+  bp::list entries;
+  for (const ParamResponsePair& prp : pairs)
+    entries.append(restart_entry(prp));
+  return entries;
+}
+
+
+const std::chrono::milliseconds PythonStreamBuf::FLUSH_INTERVAL(100);
+
+PythonStreamBuf::PythonStreamBuf(PyObject *callable, const char *stream):
+  callable(callable), stream(stream), buffer(1 << 16), lastFlush(Clock::now())
+{
+  setp(buffer.data(), buffer.data() + buffer.size());
+}
+
+bool PythonStreamBuf::hand_over(bool lines)
+{
+  char *begin = pbase(), *end = pptr();
+  if (lines)
+    while (end > begin && end[-1] != '\n')
+      --end;
+  if (end == begin)
+    return false;
+
+  {
+    GILAcquire gil;
+    PyObject *text = PyUnicode_DecodeUTF8(begin, end - begin, "replace");
+    PyObject *result = text ? PyObject_CallFunction(callable, "sO", stream, text) : NULL;
+    // Output cannot fail, errors of the callable are reported and ignored.
+    if (!result)
+      PyErr_WriteUnraisable(callable);
+    Py_XDECREF(result);
+    Py_XDECREF(text);
+  }
+
+  // Keep the incomplete last line.
+  size_t rest = pptr() - end;
+  std::copy(end, pptr(), buffer.data());
+  setp(buffer.data(), buffer.data() + buffer.size());
+  pbump((int)rest);
+  lastFlush = Clock::now();
+  return true;
+}
+
+PythonStreamBuf::int_type PythonStreamBuf::overflow(int_type c)
+{
+  // The buffer is full: hand over its lines, or all of it if it holds a
+  // single line.
+  if (!hand_over(true))
+    hand_over(false);
+  if (!traits_type::eq_int_type(c, traits_type::eof()))
+    return sputc(traits_type::to_char_type(c));
+  return traits_type::not_eof(c);
+}
+
+int PythonStreamBuf::sync()
+{
+  if (Clock::now() - lastFlush >= FLUSH_INTERVAL)
+    hand_over(true);
+  return 0;
+}
+
+
+OutputCapture::OutputCapture(PyObject *run):
+  callable(NULL), out(NULL), err(NULL), savedOut(NULL), savedErr(NULL)
+{
+  if (!run)
+    return;
+  {
+    GILAcquire gil;
+    PyObject *output = PyObject_GetAttrString(run, "output");
+    if (!output)
+      PyErr_Clear();
+    else if (output == Py_None)
+      Py_DECREF(output);
+    else
+      callable = output;
+  }
+  if (!callable)
+    return;
+
+  std::cout.flush();
+  std::cerr.flush();
+  out = new PythonStreamBuf(callable, "stdout");
+  err = new PythonStreamBuf(callable, "stderr");
+  savedOut = std::cout.rdbuf(out);
+  savedErr = std::cerr.rdbuf(err);
+}
+
+OutputCapture::~OutputCapture()
+{
+  if (!callable)
+    return;
+
+  std::cout.flush();
+  std::cerr.flush();
+  std::cout.rdbuf(savedOut);
+  std::cerr.rdbuf(savedErr);
+  out->flush();
+  err->flush();
+  delete out;
+  delete err;
+
+  GILAcquire gil;
+  Py_DECREF(callable);
+}
+
+} // namespace carolina
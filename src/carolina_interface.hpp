@@ -0,0 +1,201 @@
+// Copyright 2023 Equinor ASA
+//
+//    Licensed under the Apache License, Version 2.0 (the "License");
+//    you may not use this file except in compliance with the License.
+//    You may obtain a copy of the License at
+//
+//        http://www.apache.org/licenses/LICENSE-2.0
+//
+//    Unless required by applicable law or agreed to in writing, software
+//    distributed under the License is distributed on an "AS IS" BASIS,
+//    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+//    See the License for the specific language governing permissions and
+//    limitations under the License.
+//
+// ++==++==++==++==++==++==++==++==++==++==
+#ifndef _CAROLINA_INTERFACE_H_
+#define _CAROLINA_INTERFACE_H_
+
+#include <boost/python/detail/wrap_python.hpp>
+#include <boost/python/list.hpp>
+
+#include <chrono>
+#include <streambuf>
+#include <string>
+#include <vector>
+
+#include "DirectApplicInterface.hpp"
+#include "LibraryEnvironment.hpp"
+
+namespace carolina {
+
+/// Name of the direct analysis driver served by CarolinaInterface.
+extern const char *DRIVER_NAME;
+
+/// Releases the GIL for the lifetime of the object.
+class GILRelease
+{
+public:
+  GILRelease(): state(PyEval_SaveThread()) {}
+  ~GILRelease() { PyEval_RestoreThread(state); }
+private:
+  PyThreadState *state;
+};
+
+/// Holds the GIL for the lifetime of the object, in any thread.
+class GILAcquire
+{
+public:
+  GILAcquire(): state(PyGILState_Ensure()) {}
+  ~GILAcquire() { PyGILState_Release(state); }
+private:
+  PyGILState_STATE state;
+};
+
+/// Callback bound once per interface and evaluation mode by the fast path,
+/// see CarolinaInterface.
+struct FastPath
+{
+  /// dakota_bind has been called
+  bool bound = false;
+  /// owned references to the bound callable and the evaluation type, NULL
+  /// when the driver does not use the fast path
+  PyObject *callback = NULL;
+  PyObject *evaluation_type = NULL;
+};
+
+/// Direct application interface that hands evaluations to Python.
+///
+/// Synchronous evaluations are forwarded one at a time, asynchronous ones
+/// are collected by Dakota's scheduler and forwarded as a single batch of
+/// stacked arrays.  The callbacks are the dakota_callback and
+/// dakota_batch_callback methods of the run object, or the functions of the
+/// dakota module if there is none.  The GIL is only held during the callbacks.
+///
+/// Before the first evaluation of each mode, the dakota_bind method of the run
+/// object is called once with the labels and sizes of the evaluations.  If it
+/// returns a (callable, evaluation type) pair, every evaluation is handed to
+/// the callable as an instance of the evaluation type instead of a keyword
+/// dictionary, single points holding views on Dakota's own buffers.
+///
+/// Evaluations raising dakota_failures.EvaluationFailure, or marked in the
+/// 'failed' entry of the returned dictionary, are handed to Dakota's failure
+/// capture instead of aborting the run.
+///
+/// If the run object has a positive cache_limit, Dakota's evaluation cache is
+/// trimmed to that many evaluations before each call, so that it holds at
+/// most the limit plus the evaluations of one batch.
+class CarolinaInterface: public Dakota::DirectApplicInterface
+{
+public:
+  CarolinaInterface(const Dakota::ProblemDescDB& problem_db, PyObject *run);
+  ~CarolinaInterface();
+
+protected:
+  /// evaluate a single point synchronously
+  void derived_map(const Dakota::Variables& vars,
+                   const Dakota::ActiveSet& set,
+                   Dakota::Response& response, int fn_eval_id);
+
+  /// no-op hides base error; job batching occurs in wait_local_evaluations()
+  void derived_map_asynch(const Dakota::ParamResponsePair& pair);
+
+  /// evaluate all queued jobs with a single Python call
+  void wait_local_evaluations(Dakota::PRPQueue& prp_queue);
+
+  /// batches are evaluated to completion, so this is the same as waiting
+  void test_local_evaluations(Dakota::PRPQueue& prp_queue);
+
+  /// no-op hides default run-time error checks at DirectApplicInterface level
+  void set_communicators_checks(int max_eval_concurrency);
+
+private:
+  /// drop the evaluations with the smallest IDs from Dakota's evaluation
+  /// cache until it holds at most cacheLimit of them
+  void trim_cache();
+
+  /// borrowed reference, owned by the caller of run_dakota
+  PyObject *run;
+
+  /// the cache_limit attribute of the run object, 0 if unlimited
+  size_t cacheLimit;
+
+  /// fast path of single points [0] and of batches [1]
+  FastPath fast[2];
+};
+
+/// Replace the interface of every simulation model using DRIVER_NAME by a
+/// CarolinaInterface.  Returns the number of interfaces plugged in.
+int plugin_interfaces(Dakota::LibraryEnvironment& env, PyObject *run);
+
+/// Number of CarolinaInterface instances alive, that is plugged in the
+/// environments of the runs in progress and of the open sessions.
+int live_interfaces();
+
+/// Fill the results attribute of the run object, if set, with the final
+/// variables and responses of `env` and the evaluations held in Dakota's
+/// evaluation cache.  Called without the GIL.
+void store_results(Dakota::LibraryEnvironment& env, PyObject *run);
+
+/// Fill the results attribute of the run object, if set, with the labels
+/// and the evaluation history of a run that ended with an error, such as a
+/// budget stopping it, leaving the final point unset.  Called without the
+/// GIL, the pending Python error is kept.
+void store_partial_results(PyObject *run);
+
+/// Stream buffer handing the text written to it to a Python callable as
+/// `callable(stream, text)`.  Text is collected without the GIL and handed
+/// over when the buffer is full, on a flush at least FLUSH_INTERVAL after the
+/// previous one, and on destruction, so that verbose output does not take the
+/// GIL for every line.
+class PythonStreamBuf: public std::streambuf
+{
+public:
+  PythonStreamBuf(PyObject *callable, const char *stream);
+
+  /// hand all the pending text to the callable
+  void flush() { hand_over(false); }
+
+protected:
+  int_type overflow(int_type c);
+  int sync();
+
+private:
+  static const std::chrono::milliseconds FLUSH_INTERVAL;
+
+  /// hand the pending text to the callable, up to the end of its last line
+  /// only if `lines`, returns whether any text was handed over
+  bool hand_over(bool lines);
+
+  /// borrowed reference, owned by the OutputCapture
+  PyObject *callable;
+  const char *stream;
+  std::vector<char> buffer;
+  std::chrono::steady_clock::time_point lastFlush;
+};
+
+/// Redirects std::cout and std::cerr to the `output` attribute of the run
+/// object for the lifetime of the object, when it is not None.  Dakota
+/// writes to these streams unless its output is sent to a file.  Constructed
+/// and destroyed with dakota_mutex held and without the GIL.
+class OutputCapture
+{
+public:
+  OutputCapture(PyObject *run);
+  ~OutputCapture();
+
+private:
+  /// owned reference to the output callable, NULL when not capturing
+  PyObject *callable;
+  PythonStreamBuf *out, *err;
+  std::streambuf *savedOut, *savedErr;
+};
+
+/// Return the evaluations of the restart file `path`, the first
+/// `stop_restart` ones only if positive, as a list of (point, response)
+/// dictionaries.  Called with the GIL, which is released while reading.
+boost::python::list read_restart(const std::string& path, int stop_restart);
+
+} // namespace carolina
+
+#endif // _CAROLINA_INTERFACE_H_
@@ -25,7 +25,12 @@
 // Replaces Python.h according to boost_python docs.
 #include <boost/python/detail/wrap_python.hpp>
 
+#include <chrono>
 #include <iostream>
+#include <mutex>
+#ifdef __GLIBC__
+#include <malloc.h>
+#endif
 
 #include "dakota_system_defs.hpp"
 #include "ProgramOptions.hpp"
@@ -40,6 +45,7 @@
 #include "LibraryEnvironment.hpp"
 
 #include "dakface.hpp"
+#include "carolina_interface.hpp"
 
 #include <boost/python/def.hpp>
 namespace bp = boost::python;
@@ -56,18 +62,25 @@ using namespace Dakota;
   extern "C" void fpinit_ASL();
 #endif
 
-static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_on_error=false);
+static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_on_error, void *run,
+                 const char *input_string);
+
+// Dakota keeps process wide state (the evaluation cache, output streams, the
+// abort mode), so only one environment may be constructed and executed at a
+// time, whatever thread it runs in.
+static std::mutex dakota_mutex;
 
-int all_but_actual_main(int argc, char* argv[], void *exc, bool throw_on_error=false)
+int all_but_actual_main(int argc, char* argv[], void *exc, bool throw_on_error, void *run,
+                        const char *input_string)
 {
-  return _main(argc, argv, NULL, exc, throw_on_error);
+  return _main(argc, argv, NULL, exc, throw_on_error, run, input_string);
 }
 
-static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_on_error)
+static void initialize()
 {
   static bool initialized = false;
   if (!initialized) 
- {
+  {
 
 #ifdef HAVE_AMPL
     // Switch to 53-bit rounding if appropriate, to eliminate some
@@ -80,24 +93,31 @@ static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_
 
     initialized = true;
   }
+}
 
+/// Parse the input and construct the environment, with the carolina
+/// interface plugged in.  Called with dakota_mutex held and without the GIL.
+static Dakota::LibraryEnvironment *make_environment(int argc, char* argv[], MPI_Comm *pcomm,
+                                                    bool throw_on_error, void *run,
+                                                    const char *input_string)
+{
   // Parse input and construct Dakota LibraryEnvironment, performing
   // input data checks.  Assumes comm rank 0.
-  //Dakota::ProgramOptions opts(argc, argv, 0);
-  //Dakota::ParallelLibrary(argc, argv);
   Dakota::ProgramOptions opts(argc, argv, 0);
 
+  // Parse the input from memory rather than from an input file.
+  if (input_string)
+    opts.input_string(input_string);
+
   if(throw_on_error)
      // Have Dakota throw an exception rather than aborting the process when error occurs
      opts.exit_mode("throw");
 
-  Dakota::LibraryEnvironment* env = 0;
   Dakota::data_pairs.clear();
+  Dakota::LibraryEnvironment *env;
   if (pcomm) 
   {
     MPI_Comm comm = *pcomm;
-    //MPI_Barrier(comm);
-    //Dakota::ParallelLibrary();
     env = new Dakota::LibraryEnvironment(comm, opts);
   } 
   else 
@@ -105,28 +125,198 @@ static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_
     env = new Dakota::LibraryEnvironment(opts);
   }
 
-  // Execute the environment.
-  int retval = 0;
-  try 
+  // Serve the 'carolina' direct analysis driver from Python.
+  try
   {
-    Dakota::data_pairs.clear();
-    env->execute();
-    Dakota::data_pairs.clear();
+    carolina::plugin_interfaces(*env, (PyObject *)run);
   }
-  catch (...) 
+  catch (...)
   {
-    if (PyErr_Occurred()) {
+    delete env;
+    throw;
+  }
+  return env;
+}
+
+/// Execute the environment and hand the results to Python before the
+/// evaluation cache is cleared.  Called with dakota_mutex held and without
+/// the GIL.
+static void execute_environment(Dakota::LibraryEnvironment& env, void *run)
+{
+  Dakota::data_pairs.clear();
+  try
+  {
+    env.execute();
+  }
+  catch (...)
+  {
+    // Keep the evaluations of a run stopped early.
+    carolina::store_partial_results((PyObject *)run);
+    throw;
+  }
+  carolina::store_results(env, (PyObject *)run);
+}
+
+/// Move a pending Python error into the exception info object `exc`.  Called
+/// with the GIL.
+static void fetch_error(void *exc)
+{
+  if (PyErr_Occurred()) {
+    if (exc) {
       PyObject *type = NULL, *value = NULL, *traceback = NULL;
       PyErr_Fetch(&type, &value, &traceback);
       bp::object *tmp = (bp::object *)exc;
       PyObject_SetAttrString(tmp->ptr(), "type", type ? type : Py_None);
       PyObject_SetAttrString(tmp->ptr(), "value", value ? value : Py_None);
       PyObject_SetAttrString(tmp->ptr(), "traceback", traceback ? traceback : Py_None);
-      PyErr_Clear();
+      Py_XDECREF(type);
+      Py_XDECREF(value);
+      Py_XDECREF(traceback);
     }
-    retval = 1;
+    PyErr_Clear();
   }
+}
 
-  delete env;
+int release_memory()
+{
+  carolina::GILRelease nogil;
+  std::unique_lock<std::mutex> lock(dakota_mutex, std::try_to_lock);
+  if (!lock.owns_lock())
+    return -1;
+
+  int cleared = (int)Dakota::data_pairs.size();
+  Dakota::data_pairs.clear();
+#ifdef __GLIBC__
+  // The environments of the previous runs were freed, but glibc keeps the
+  // memory in its arenas unless asked to give it back.
+  malloc_trim(0);
+#endif
+  return cleared;
+}
+
+static int _main(int argc, char* argv[], MPI_Comm *pcomm, void *exc, bool throw_on_error, void *run,
+                 const char *input_string)
+{
+  int retval = 0;
+  {
+    // Dakota runs without the GIL, the carolina interface takes it back for
+    // the Python callbacks only.  The GIL is released before waiting for the
+    // lock, as the thread holding the lock may need the GIL to finish.
+    carolina::GILRelease nogil;
+    std::lock_guard<std::mutex> lock(dakota_mutex);
+    initialize();
+    // Dakota's output goes to the output callable of the run, if it has one.
+    carolina::OutputCapture capture((PyObject *)run);
+
+    Dakota::LibraryEnvironment* env = 0;
+    try 
+    {
+      env = make_environment(argc, argv, pcomm, throw_on_error, run, input_string);
+      execute_environment(*env, run);
+    }
+    catch (...) 
+    {
+      retval = 1;
+    }
+
+    Dakota::data_pairs.clear();
+    delete env;
+  }
+
+  fetch_error(exc);
+  return retval;
+}
+
+
+DakotaSession::DakotaSession(int argc, char* argv[], void *exc, bool throw_on_error, void *run,
+                             const char *input_string):
+  env(NULL), run((PyObject *)run), constructionTime(0.0)
+{
+  Py_XINCREF(this->run);
+  {
+    carolina::GILRelease nogil;
+    std::lock_guard<std::mutex> lock(dakota_mutex);
+    initialize();
+    carolina::OutputCapture capture(this->run);
+
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+    try
+    {
+      env = make_environment(argc, argv, NULL, throw_on_error, run, input_string);
+    }
+    catch (...)
+    {
+      env = NULL;
+    }
+    constructionTime =
+      std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+  }
+  fetch_error(exc);
+}
+
+DakotaSession::~DakotaSession()
+{
+  close();
+  Py_XDECREF(run);
+}
+
+int DakotaSession::execute(void *exc)
+{
+  if (!env)
+    return 1;
+
+  int retval = 0;
+  {
+    carolina::GILRelease nogil;
+    std::lock_guard<std::mutex> lock(dakota_mutex);
+    carolina::OutputCapture capture(run);
+    try
+    {
+      execute_environment(*env, run);
+    }
+    catch (...)
+    {
+      retval = 1;
+    }
+    Dakota::data_pairs.clear();
+  }
+
+  fetch_error(exc);
   return retval;
 }
+
+int DakotaSession::update(const RealVector *lower, const RealVector *upper, const RealVector *initial)
+{
+  if (!env)
+    return 0;
+
+  // Every simulation model of the size of the update gets it, the models
+  // built on top of them read their variables and bounds from them.
+  int updated = 0;
+  ModelList& models = env->problem_description_db().model_list();
+  for (ModelLIter m_iter = models.begin(); m_iter != models.end(); ++m_iter) {
+    size_t ncv = m_iter->cv();
+    if ((lower && (size_t)lower->length() != ncv) || (upper && (size_t)upper->length() != ncv) ||
+        (initial && (size_t)initial->length() != ncv))
+      continue;
+    if (lower)
+      m_iter->continuous_lower_bounds(*lower);
+    if (upper)
+      m_iter->continuous_upper_bounds(*upper);
+    if (initial)
+      m_iter->continuous_variables(*initial);
+    ++updated;
+  }
+  return updated;
+}
+
+void DakotaSession::close()
+{
+  if (!env)
+    return;
+  carolina::GILRelease nogil;
+  std::lock_guard<std::mutex> lock(dakota_mutex);
+  carolina::OutputCapture capture(run);
+  delete env;
+  env = NULL;
+}
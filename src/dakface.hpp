@@ -17,10 +17,59 @@
 #ifndef _DAKFACE_H_
 #define _DAKFACE_H_
 
+#include <boost/python/detail/wrap_python.hpp>
+
 #include "ParallelLibrary.hpp"
+#include "dakota_data_types.hpp"
 
 using namespace Dakota;
 
-extern int all_but_actual_main(int argc, char* argv[], void *exc, bool throw_on_error);
+extern int all_but_actual_main(int argc, char* argv[], void *exc, bool throw_on_error, void *run,
+                               const char *input_string);
+
+/// Clear Dakota's evaluation cache and return the memory freed by previous
+/// runs to the system.  Returns the number of evaluations cleared, or -1
+/// without doing anything while a run is in progress.
+extern int release_memory();
+
+namespace Dakota {
+  class LibraryEnvironment;
+}
+
+/// A parsed Dakota environment kept alive between executions, so that the
+/// same study can be run repeatedly without constructing it again.  Only the
+/// continuous bounds and initial point of its models can change between
+/// executions.
+class DakotaSession
+{
+public:
+  /// Construct the environment as all_but_actual_main does.  On failure the
+  /// session is closed and the error is recorded in `exc`.
+  DakotaSession(int argc, char* argv[], void *exc, bool throw_on_error, void *run,
+                const char *input_string);
+  ~DakotaSession();
+
+  /// Execute the environment, returns 0 on success.
+  int execute(void *exc);
+
+  /// Set the continuous lower and upper bounds and initial point, when not
+  /// NULL, of the models with that many continuous variables.  Returns the
+  /// number of models updated.
+  int update(const RealVector *lower, const RealVector *upper, const RealVector *initial);
+
+  /// Delete the environment.
+  void close();
+
+  bool is_open() const { return env != NULL; }
+
+  /// Seconds spent constructing the environment.
+  double construction_time() const { return constructionTime; }
+
+private:
+  Dakota::LibraryEnvironment *env;
+  /// owned reference to the run object receiving the callbacks
+  PyObject *run;
+  double constructionTime;
+};
 
 #endif // _DAKFACE_H_
@@ -20,23 +20,35 @@ This uses the standard version of DAKOTA as a library (libdakota_src.so).
 
 :class:`DakotaInput` holds DAKOTA input strings and can write them to a file.
 
-:meth:`run_dakota` runs dakota.
+:meth:`run_dakota` runs dakota and returns its :class:`DakotaResults`.
 
 :meth:`dakota_callback` can be invoked by DAKOTA's Python interface to
-evaluate the model.
+evaluate the model, :meth:`dakota_batch_callback` by the ``carolina``
+interface with a batch of evaluations when asynchronous evaluations are enabled.
 
 There is no other information passed to DAKOTA, so DAKOTA otherwise acts like
 the command line version, in particular, all other inputs go through the input
 file (typically generated by :class:`DakotaInput`).
 
-:class:`DakotaBase` ties these together for a basic 'driver'.
+:class:`DakotaBase` ties these together for a basic 'driver'. The ``dakota_*``
+modules next to this one extend its runs, see the README.
 """
 
+import copy
 import logging
 import os
-import carolina
+import pickle
+import tempfile
+import time
+import traceback
+import numpy
 import weakref
 
+# The carolina extension, loaded by preload(). It pulls in DAKOTA and all its
+# libraries, so it is only loaded when a run starts. For the same reason,
+# asyncio, inspect and the process pool are imported where they are used.
+_CAROLINA = None
+
 # This will hold a reference to the DakotaDriver instance or
 # the user specified custom model instance
 _USER_DATA = weakref.WeakValueDictionary()
@@ -45,19 +57,49 @@ _USER_DATA = weakref.WeakValueDictionary()
 class DakotaBase:
     """ Base class for a DAKOTA 'driver'. """
 
-    def __init__(self, dakota_input):
+    def __init__(self, dakota_input, executor=None, cache=None, finite_differences=None, failure_policy=None,
+                 interfaces=None):
         """
         The main constructor of the Base dakota driver. It sets the problem definition.
         :param dakota_input: The object that contains the problem definition and is the source of information
         for writing the configuration file for dakota
         :type dakota_input: DakotaInput
+        :param executor: Optional executor used by :meth:`dakota_batch_callback` to run the evaluations
+        of a batch concurrently. The input should set an evaluation concurrency for batches to be formed.
+        With a :class:`dakota_remote.RemoteExecutor`, the driver is pickled with each point.
+        :type executor: concurrent.futures.Executor
+        :param cache: Optional cache consulted before evaluating a point and updated with its response
+        :type cache: dakota_cache.EvaluationCache
+        :param finite_differences: Optional finite differences computing the gradients requested by DAKOTA
+        from stencils evaluated with :meth:`dakota_stencil`. The responses should declare analytic gradients.
+        :type finite_differences: dakota_gradients.FiniteDifferences
+        :param failure_policy: Optional timeout, retries and failure capture of the evaluations
+        :type failure_policy: dakota_failures.FailurePolicy
+        :param interfaces: The drivers of the named interfaces of the input, by name. Their own input
+        is not used, their evaluations are dispatched to their callbacks as for this driver.
+        :type interfaces: Mapping[str, DakotaBase]
         """
         if dakota_input is None:
             raise RuntimeError("The problem definition is required - None value received")
 
         self.input = dakota_input
+        self.executor = executor
+        self.cache = cache
+        self.finite_differences = finite_differences
+        self.failure_policy = failure_policy
+        self.interfaces = dict(interfaces or {})
+
+    def __getstate__(self):
+        # Executors and caches can not be pickled, drivers sent to a process pool evaluate without them
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['cache'] = None
+        return state
 
-    def run_dakota(self, infile='dakota.in', stdout=None, stderr=None, restart=0, throw_on_error=True):
+    def run_dakota(self, infile='dakota.in', stdout=None, stderr=None, restart=0, throw_on_error=True,
+                   profile=None, write_restart=True, listener=None, loop=None, read_restart=None,
+                   stop_restart=0, output=None, evaluation_cache=True, store=None, budget=None,
+                   study_cache=None):
         """
         This will create the configuration file for dakota,
         will set the driver instance that should handle dakota's requests and start dakota.
@@ -66,7 +108,8 @@ class DakotaBase:
         such that the callback Python based interface is used. If this is the case then dakota will call the
         'dakota.dakota_callback' function defined in this module.
 
-        :param infile: The name used for the configuration file
+        :param infile: The name used for the configuration file. If None, the configuration is
+        passed to dakota as a string and no file is written
         :type infile: str
         :param stdout: The stream to be used for redirecting the standard output
         :param stderr: The stream to be used for redirecting the standard error
@@ -77,24 +120,221 @@ class DakotaBase:
         in the working directory with the name 'dakota.rst'
         :type restart: int
         :param throw_on_error: Dakota throws on error instead of aborting
+        :param profile: Optional profile recording the timings of the callbacks,
+        a summary is logged at the end of the run
+        :type profile: dakota_profile.RunProfile
+        :param write_restart: If False, dakota does not write a restart file. If a path,
+        the restart file is written there instead of 'dakota.rst' in the working directory
+        :type write_restart: bool or str
+        :param read_restart: The restart file to replay, implies `restart`
+        :type read_restart: str
+        :param stop_restart: If positive, only this many evaluations of the restart file are replayed
+        :type stop_restart: int
+        :param output: Optional callable receiving the output of dakota not redirected
+        to a file, see :meth:`run_dakota`
+        :type output: dakota_output.OutputCapture
+        :param evaluation_cache: If False, dakota does not keep the evaluations in memory. If a number,
+        it keeps about this many of the last ones. The evaluation history of the results only holds
+        the evaluations kept.
+        :type evaluation_cache: bool or int
+        :param store: Optional store, or the directory of a new one, receiving every completed evaluation,
+        see :meth:`run_dakota`
+        :type store: dakota_store.EvaluationStore or str
+        :param budget: Optional time, evaluation and stop predicate limits of the run, see :meth:`run_dakota`
+        :type budget: dakota_budget.Budget
+        :param study_cache: Optional cache of whole studies. If it holds a study with the same rendered input,
+        :meth:`study_version`, restart and evaluation cache options and driver caches, its results, output
+        and tabular data are returned without running dakota. Otherwise the study is run and stored, unless
+        its budget stopped it. The output is only recorded if sent to `output`, `stdout` or `stderr`.
+        :type study_cache: dakota_cache.StudyCache
+        :param listener: Optional callable notified of the completed evaluations, see :meth:`run_dakota`
+        :param loop: The event loop awaiting coroutine callbacks, set by :meth:`run_dakota_async`.
+        If None, each callback returning a coroutine runs it to completion in a new event loop.
+        :type loop: asyncio.AbstractEventLoop
+        :return: The final point and evaluation history of the run, with the counters of the failure
+        policy of the driver for this run
+        :rtype: DakotaResults
+
+        Drivers may be run from several threads, provided they use different input files, but
+        the runs are serialized: one executes at a time, see :func:`run_dakota`.
         """
 
-        # Write dakota config file and set the driver_instance to self
-        self.input.write_input(infile, driver_instance=self)
+        cache_limit = 0
+        if not isinstance(evaluation_cache, bool):
+            if evaluation_cache < 1:
+                raise RuntimeError("The evaluation cache limit must be a positive number")
+            cache_limit = evaluation_cache
+
+        # Write dakota config file, or keep it in memory, and set the driver_instance to self
+        input_string = None
+        if infile is None:
+            input_string = self.input.render(driver_instance=self, write_restart=write_restart is not False,
+                                             evaluation_cache=evaluation_cache is not False)
+        else:
+            self.input.write_input(infile, driver_instance=self, write_restart=write_restart is not False,
+                                   evaluation_cache=evaluation_cache is not False)
+
+        # Return an identical study from the study cache, or record the output of this one
+        if study_cache is not None:
+            from dakota_cache import OutputRecorder, StudyRecord
+
+            content = input_string
+            if content is None:
+                with open(infile) as config:
+                    content = config.read()
+            version = _study_version(self)
+            study_key = study_cache.key(content, version, _study_options(self, restart, read_restart, write_restart,
+                                                                         stop_restart, evaluation_cache))
+            record = study_cache.lookup(study_key)
+            if record is not None:
+                logging.info(f'dakota ({os.getpid()}): study {study_key} found in {study_cache}')
+                results = record.restore(output, stdout, stderr)
+                results.from_cache = True
+                return results
+            # The output sent to the process streams keeps its path, unrecorded
+            if output is not None:
+                output = OutputRecorder(output)
 
         # Run dakota
-        run_dakota(infile, stdout, stderr, restart=restart, throw_on_error=throw_on_error)
+        if self.failure_policy is not None:
+            self.failure_policy.reset()
+        try:
+            results = run_dakota(infile, stdout, stderr, restart=restart, throw_on_error=throw_on_error,
+                       drivers=_drivers(self), profile=profile, input_string=input_string,
+                       listener=listener, loop=loop, read_restart=read_restart,
+                       write_restart=None if isinstance(write_restart, bool) else write_restart,
+                       stop_restart=stop_restart, output=output, cache_limit=cache_limit, store=store,
+                       budget=budget)
+            if self.failure_policy is not None:
+                results.failures = self.failure_policy.counters()
+            if study_cache is not None and not results.stopped_early:
+                results.study_key = study_key
+                recorder = output if isinstance(output, OutputRecorder) else None
+                study_cache.store(study_key, version, StudyRecord.capture(results, recorder, content, stdout, stderr))
+            return results
+        finally:
+            if self.failure_policy is not None:
+                logging.info(f'dakota ({os.getpid()}): {self.failure_policy}')
+            if self.cache is not None:
+                logging.info(f'dakota ({os.getpid()}): {self.cache}')
+            if profile is not None:
+                logging.info(f'dakota ({os.getpid()}): {profile.format_summary()}')
+
+    def study_version(self):
+        """
+        Return the version of the driver, part of the key of its studies in a
+        :class:`dakota_cache.StudyCache`. Defaults to the qualified name of its
+        class: override it to include the version of the code and data the
+        driver evaluates, so that a new version does not reuse stale studies.
+
+        :rtype: str
+        """
+        return f'{type(self).__module__}.{type(self).__qualname__}'
+
+    async def run_dakota_async(self, **kwargs):
+        """
+        Coroutine running :meth:`run_dakota` in the default executor of the running
+        event loop, which keeps serving other tasks in the meantime. Coroutine
+        callbacks of the driver are awaited on this loop.
+
+        The loop must keep running until the study is over: cancelling the
+        awaiting task does not stop DAKOTA.
+
+        :param kwargs: Arguments passed to :meth:`run_dakota`
+        :rtype: DakotaResults
+        """
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.run_dakota, loop=loop, **kwargs))
 
     def dakota_callback(self, **kwargs):
-        """ Invoked from global :meth:`dakota_callback`, must be overridden. """
+        """
+        Invoked from global :meth:`dakota_callback`, must be overridden.
+        May be a coroutine function, see :meth:`run_dakota_async`.
+        """
         raise NotImplementedError('dakota_callback')
 
+    def dakota_bind(self, metadata):
+        """
+        Called once per run and evaluation mode, before the first evaluation, to
+        select the fast path. Return a callable taking an :class:`Evaluation` and
+        returning the responses dictionary to use it instead of :meth:`dakota_callback`
+        and :meth:`dakota_batch_callback`, or None (the default) to keep them.
+
+        `metadata` holds the entries of the callback arguments that do not change
+        between evaluations: ``functions``, ``variables``, the ``*_labels`` and
+        ``analysis_components``, and ``batch`` telling whether the evaluations of
+        this mode are batches with stacked arrays.
+
+        The fast path is not taken for drivers with a cache or a failure policy, nor for profiled,
+        listened to, budgeted or asynchronous runs.
+        """
+        return None
+
+    def dakota_batch_callback(self, **kwargs):
+        """
+        Invoked from global :meth:`dakota_batch_callback` with a batch of evaluations.
+
+        The per-evaluation entries of `kwargs` are stacked with one row per evaluation
+        and the returned 'fns', 'fnGrads' and 'fnHessians' must be stacked the same way.
+        The default implementation evaluates the rows with :meth:`dakota_callback`, concurrently
+        if an executor was given or if it is a coroutine function, in which case a coroutine
+        gathering the rows is returned. Override it to evaluate the whole batch at once.
+
+        The responses may hold a boolean 'failed' array marking the evaluations that failed,
+        which DAKOTA handles with the failure capture of the interface. With a failure policy,
+        the default implementation marks the rows failing every attempt.
+        """
+        import inspect
+
+        points = list(_split_batch(kwargs))
+        if inspect.iscoroutinefunction(self.dakota_callback):
+            return self._gather(kwargs, points)
+        if self.executor is None:
+            responses = [_call_driver(self, point) for point in points]
+        else:
+            futures = {point['currEvalId']: self.executor.submit(_call_driver, self, point) for point in points}
+            try:
+                responses = [futures[eval_id].result() for eval_id in kwargs['currEvalId']]
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+        if self.failure_policy is not None:
+            responses = self.failure_policy.collect(responses)
+        return _stack_responses(kwargs, responses)
+
+    def dakota_stencil(self, **kwargs):
+        """
+        Invoked with the finite difference stencils of the points of a callback when
+        the driver has finite differences, as one batch requesting function values only.
+
+        `kwargs` and the returned responses are stacked as for :meth:`dakota_batch_callback`,
+        which the default implementation calls. Override it to evaluate stencils differently
+        from the batches of DAKOTA.
+        """
+        return self.dakota_batch_callback(**kwargs)
+
+    async def _gather(self, kwargs, points):
+        """ Await the coroutine callbacks of the points of a batch concurrently. """
+        import asyncio
+
+        if self.failure_policy is None:
+            responses = await asyncio.gather(*(self.dakota_callback(**point) for point in points))
+        else:
+            responses = self.failure_policy.collect(await asyncio.gather(
+                *(self.failure_policy.run_async(self.dakota_callback, point) for point in points)))
+        return _stack_responses(kwargs, responses)
+
 
 class DakotaInput:
     """
     Simple mechanism where we store the strings that will go in each section
     of the DAKOTA input file.  The ``interface`` section defaults to a
-    configuration that will use Python and set :meth:`dakota_callback` as driver.
+    configuration that will use the ``carolina`` direct interface, which calls
+    :meth:`dakota_callback` or :meth:`dakota_batch_callback`.
 
     The :meth:'write' is expected to receive a reference
     to the actual driver instance that should handle the requests from dakota.
@@ -103,25 +343,40 @@ class DakotaInput:
         # e.g.: DakotaInput(method=["multidim_parameter_study",
         #                           "partitions = %d %d" % (nx, nx)])
 
+    Multi-fidelity, hierarchical and nested models use further interfaces,
+    declared by name in `interfaces` and bound to the drivers of the same
+    names in :attr:`DakotaBase.interfaces`. A section holding several blocks,
+    such as the models of these studies, repeats its keyword as a line:
+
+        DakotaInput(interfaces={'lofi': 50},
+                    model=["id_model 'HF'", "single", "interface_pointer = 'carolina'",
+                           "model", "id_model 'LF'", "single", "interface_pointer = 'lofi'", ...])
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, evaluation_concurrency=None, interfaces=None, **kwargs):
+        """
+        :param evaluation_concurrency: If set, dakota is allowed to schedule this many evaluations at once
+        and hands them over as one batch to :meth:`DakotaBase.dakota_batch_callback`
+        :type evaluation_concurrency: int
+        :param interfaces: The evaluation concurrency, or None, of further ``carolina`` interfaces by name
+        :type interfaces: Mapping[str, int]
+        """
         # Hard code the only acceptable interface
-        self.interface = [
-            "id_interface 'carolina'",
-            "python",
-            "  numpy",
-            "  analysis_drivers = 'dakota:dakota_callback'",
-            ]
+        self.interface = _interface_lines('carolina', evaluation_concurrency)
+        self.interfaces = {}
+        for name, concurrency in (interfaces or {}).items():
+            if name == 'carolina' or "'" in name:
+                raise RuntimeError(f"Invalid interface name '{name}'")
+            self.interfaces[name] = _interface_lines(name, concurrency)
 
         # Set all other sections
         for key in kwargs:
             if key == "interface":
                 raise RuntimeError("It is not allowed to change the interface. "
-                                   "This has been preset to the Python interface with dakota:dakota_callback as driver.")
+                                   "This has been preset to the carolina interface calling dakota_callback.")
             setattr(self, key, kwargs[key])
 
-    def write_input(self, infile, driver_instance=None):
+    def write_input(self, infile, driver_instance=None, write_restart=True, evaluation_cache=True):
         """
         Write input file sections in standard order.
 
@@ -134,34 +389,151 @@ class DakotaInput:
         :type infile: str
         :param driver_instance: The reference to the driver instance that will handle the requests from dakota
         :type driver_instance: DakotaBase
+        :param write_restart: If False, dakota does not write a restart file
+        :type write_restart: bool
+        :param evaluation_cache: If False, dakota does not keep the evaluations in memory
+        :type evaluation_cache: bool
 
+        """
+        content = self.render(driver_instance, write_restart=write_restart, evaluation_cache=evaluation_cache)
+
+        # Write the configuration file
+        with open(infile, 'w') as out:
+            out.write(content)
+
+    def render(self, driver_instance=None, write_restart=True, evaluation_cache=True):
+        """
+        Return the input sections in standard order as a string, as written by :meth:`write_input`.
+
+        Save the driver_instance for later use and write its id as ``analysis_components``,
+        and likewise for the drivers of the named interfaces.
+
+        :param driver_instance: The reference to the driver instance that will handle the requests from dakota
+        :type driver_instance: DakotaBase
+        :param write_restart: If False, dakota does not write a restart file
+        :type write_restart: bool
+        :param evaluation_cache: If False, dakota does not keep the evaluations in memory,
+        nor detects duplicate evaluations
+        :type evaluation_cache: bool
+        :rtype: str
         """
         if driver_instance is None:
             raise RuntimeError("The driver instance is not set")
 
-        # Store the reference to the driver instance
-        ident = str(id(driver_instance))
-        _USER_DATA[ident] = driver_instance
+        # The drivers of the interfaces, the driver instance for the default one
+        blocks = [(self.interface, driver_instance)]
+        bound = getattr(driver_instance, 'interfaces', {})
+        for name, interface in self.interfaces.items():
+            if name not in bound:
+                raise RuntimeError(f"No driver is bound to the interface '{name}'")
+            blocks.append((interface, bound[name]))
 
-        # Write the configuration file
-        with open(infile, 'w') as out:
-            for section in ('environment', 'method', 'model', 'variables', 'interface', 'responses'):
+        lines = []
+        for section in ('environment', 'method', 'model', 'variables', 'interface', 'responses'):
+            if section != 'interface':
                 # Write the section and all its sub keywords
-                out.write(f'{section}\n')
+                lines.append(f'{section}\n')
                 for line in getattr(self, section):
-                    out.write(f"\t{line}\n")
+                    lines.append(f"\t{line}\n")
+                continue
+
+            for interface, driver in blocks:
+                lines.append(f'{section}\n')
+                for line in interface:
+                    lines.append(f"\t{line}\n")
+
+                # Check if there was already some other analysis component set
+                for line in interface:
+                    if 'analysis_components' in line:
+                        raise RuntimeError('The analysis_components is only allowed to contain '
+                                           'the id of the driver instance. Any additional data should be stored '
+                                           'in the driver object.')
+
+                # Store the reference to the driver and write its id to the interface section
+                ident = _driver_id(driver)
+                _USER_DATA[ident] = driver
+                lines.append(f"\t  analysis_components = '{ident}'\n")
+
+                policy = getattr(driver, 'failure_policy', None)
+                capture = None if policy is None else policy.failure_capture()
+                if capture is not None:
+                    lines.append(f"\t{capture}\n")
+
+                deactivate = [name for name, active in (('evaluation_cache', evaluation_cache),
+                                                        ('restart_file', write_restart)) if not active]
+                if deactivate:
+                    lines.append(f"\tdeactivate {' '.join(deactivate)}\n")
 
-                # Write the driver instance id as analysis_components
-                if section == 'interface':
-                    # Check if there was already some other analysis component set
-                    for line in getattr(self, section):
-                        if 'analysis_components' in line:
-                            raise RuntimeError('The analysis_components is only allowed to contain '
-                                               'the id of the driver instance. Any additional data should be stored '
-                                               'in the driver object.')
+        return ''.join(lines)
 
-                    # Write the id of the driver instance to the interface section
-                    out.write(f"\t  analysis_components = '{ident}'\n")
+
+def _interface_lines(name, evaluation_concurrency):
+    """ Return the lines of a ``carolina`` interface section named `name`. """
+    lines = [f"id_interface '{name}'"]
+    if evaluation_concurrency is not None:
+        if evaluation_concurrency < 1:
+            raise RuntimeError("The evaluation concurrency must be a positive number")
+        lines.append(f"asynchronous evaluation_concurrency = {evaluation_concurrency}")
+    lines += [
+        "analysis_drivers = 'carolina'",
+        "  direct",
+        ]
+    return lines
+
+
+def _drivers(driver_instance):
+    """ Return the drivers called by the runs of a driver, by identifier: itself and those of its interfaces. """
+    drivers = {_driver_id(driver_instance): driver_instance}
+    for driver in getattr(driver_instance, 'interfaces', {}).values():
+        drivers[_driver_id(driver)] = driver
+    return drivers
+
+
+def _study_version(driver_instance):
+    """ Return the version of a driver and of the drivers of its interfaces, for a study cache. """
+    versions = [driver_instance.study_version()]
+    for name, driver in sorted(driver_instance.interfaces.items()):
+        versions.append(f'{name}={driver.study_version()}')
+    return '\x1f'.join(versions)
+
+
+def _study_options(driver_instance, restart, read_restart, write_restart, stop_restart, evaluation_cache):
+    """ Return the options of a run of a driver that change its results or its files, for a study cache. """
+    from dakota_cache import file_digest
+
+    # The restart file replayed, if any, by path and content
+    replayed = read_restart if read_restart is not None else 'dakota.rst' if restart else None
+    options = dict(read_restart=None if replayed is None else os.fspath(replayed),
+                   replayed=file_digest(replayed),
+                   stop_restart=stop_restart,
+                   write_restart=write_restart if isinstance(write_restart, bool) else os.fspath(write_restart),
+                   evaluation_cache=evaluation_cache)
+    drivers = [('', driver_instance)] + sorted(driver_instance.interfaces.items())
+    for name, driver in drivers:
+        if driver.cache is not None:
+            options[f'cache:{name}'] = getattr(driver.cache, 'path', type(driver.cache).__qualname__)
+    return options
+
+
+def _driver_id(driver_instance):
+    """ Return the identifier written as ``analysis_components`` for a driver. """
+    return str(id(driver_instance))
+
+
+def unregister_driver(driver_instance):
+    """
+    Forget a driver registered by :meth:`DakotaInput.render`, and the drivers of its
+    named interfaces, so that module level runs can no longer call them. Drivers are
+    otherwise forgotten when garbage collected.
+    """
+    for ident, driver in _drivers(driver_instance).items():
+        if _USER_DATA.get(ident) is driver:
+            del _USER_DATA[ident]
+
+
+def registered_drivers():
+    """ Return the number of drivers registered by :meth:`DakotaInput.render`. """
+    return len(_USER_DATA)
 
 
 def fetch_data(ident, dat):
@@ -175,6 +547,194 @@ def fetch_data(ident, dat):
     return dat[ident]
 
 
+class _Run:
+    """
+    Per-run state handed to the extension. The ``carolina`` interface calls
+    the methods of this object rather than the module level callbacks, so that
+    each run only dispatches to its own drivers.
+    """
+
+    def __init__(self, drivers, profile=None, results=None, listener=None, loop=None, output=None,
+                 cache_limit=0, budget=None):
+        """
+        :param drivers: The drivers of the run, by identifier
+        :type drivers: Mapping[str, DakotaBase]
+        :param profile: Optional profile recording the timings of the callbacks
+        :type profile: dakota_profile.RunProfile
+        :param results: The results filled in by the extension at the end of the run
+        :type results: DakotaResults
+        :param listener: Optional callable notified of the completed evaluations
+        :param loop: The event loop awaiting coroutine callbacks
+        :type loop: asyncio.AbstractEventLoop
+        :param output: Optional callable receiving the output of DAKOTA as ``output(stream, text)``
+        :param cache_limit: If positive, the number of evaluations the ``carolina`` interface leaves
+        in DAKOTA's evaluation cache before each callback
+        :type cache_limit: int
+        :param budget: Optional budget checked before each callback, which also listens to the run
+        :type budget: dakota_budget.Budget
+        """
+        self.drivers = drivers
+        self.profile = profile
+        self.results = results
+        self.listener = listener
+        self.loop = loop
+        self.output = output
+        self.cache_limit = cache_limit
+        self.budget = budget
+
+    def dakota_callback(self, kwargs):
+        driver = _fetch_driver(kwargs, 'dakota_callback', self.drivers)
+        if self.budget is not None:
+            self.budget.check()
+        if self.profile is None and self.listener is None:
+            return _evaluate(driver, kwargs, self.loop)
+        return self._timed(_evaluate, driver, kwargs, (kwargs['currEvalId'],), False)
+
+    def dakota_batch_callback(self, kwargs):
+        driver = _fetch_driver(kwargs, 'dakota_batch_callback', self.drivers)
+        if self.budget is not None:
+            self.budget.check()
+        if self.profile is None and self.listener is None:
+            return _evaluate_batch(driver, kwargs, self.loop)
+        return self._timed(_evaluate_batch, driver, kwargs, tuple(kwargs['currEvalId']), True)
+
+    def _timed(self, evaluate, driver, kwargs, eval_ids, batch):
+        """ Evaluate with timings for the profile and the listener, recording failed callbacks too. """
+        start = time.perf_counter()
+        try:
+            response = evaluate(driver, kwargs, self.loop)
+        except BaseException:
+            if self.profile is not None:
+                self.profile.record(eval_ids, kwargs['asv'], start, time.perf_counter(), failed=True)
+            raise
+        end = time.perf_counter()
+        if self.profile is not None:
+            failed = bool(numpy.any(response.get('failed', False))) if isinstance(response, dict) else False
+            self.profile.record(eval_ids, kwargs['asv'], start, end, failed=failed)
+        if self.listener is not None:
+            self.listener(kwargs, response, start, end, batch)
+        return response
+
+    def dakota_bind(self, metadata):
+        """ Called by the ``carolina`` interface to select the fast path, see :meth:`DakotaBase.dakota_bind`. """
+        if any(value is not None for value in (self.profile, self.listener, self.loop, self.budget)):
+            return None
+        driver = _fetch_driver(metadata, 'dakota_bind', self.drivers)
+        if driver.cache is not None or driver.finite_differences is not None or driver.failure_policy is not None:
+            return None
+        callback = driver.dakota_bind(metadata)
+        return None if callback is None else (callback, Evaluation)
+
+    def dakota_marshalled(self, pack, unpack, failed=False):
+        """
+        Called by the ``carolina`` interface with its conversion times when profiling, on every
+        exit of an evaluation: `failed` is set when the callback raised or its response could not
+        be converted.
+        """
+        self.profile.marshalled(pack, unpack, failed)
+
+
+class Evaluation:
+    """
+    An evaluation handed to the callable returned by :meth:`DakotaBase.dakota_bind`.
+
+    For a single point, :attr:`eval_id` is the evaluation ID and :attr:`cv`,
+    :attr:`div` and :attr:`drv` are read-only views on DAKOTA's own buffers,
+    valid during the call only: copy them to keep them. :attr:`asv` and
+    :attr:`dvv` are int arrays, as in the arguments of :meth:`dakota_callback`.
+    For a batch, :attr:`eval_id` is the list of evaluation IDs and the arrays
+    are stacked with one row per evaluation, as for :meth:`dakota_batch_callback`.
+
+    The responses may be written in place, the callable then returns None
+    instead of a responses dictionary. For a single point, :attr:`fns` and
+    :attr:`fnGrads` are writable views on the storage of DAKOTA's response, so
+    nothing is copied, and :attr:`fnHessians` is a list with a writable view
+    per function, which must be filled symmetrically. For a batch, they are
+    zeroed arrays stacked like the returned responses, copied once into DAKOTA.
+    :attr:`fnGrads` and :attr:`fnHessians` are None when the active set vector
+    does not request them.
+    """
+
+    __slots__ = ('eval_id', 'cv', 'div', 'drv', 'asv', 'dvv', 'fns', 'fnGrads', 'fnHessians')
+
+    def __init__(self, eval_id, cv, div, drv, asv, dvv, fns=None, fnGrads=None, fnHessians=None):
+        self.eval_id = eval_id
+        self.cv = cv
+        self.div = div
+        self.drv = drv
+        self.asv = asv
+        self.dvv = dvv
+        self.fns = fns
+        self.fnGrads = fnGrads
+        self.fnHessians = fnHessians
+
+    @property
+    def av(self):
+        """ All variable values, as a new array. """
+        return numpy.concatenate([self.cv, self.div, self.drv], axis=-1)
+
+
+class DakotaResults:
+    """
+    Results of a run, filled in by the extension from DAKOTA's in-memory data.
+
+    The final point of the top level method is given by :attr:`final_variables`
+    and :attr:`final_responses`, labelled by :attr:`variable_labels` and
+    :attr:`response_labels`. Variables are ordered as continuous, discrete
+    integer and discrete real variables.
+
+    The evaluation history holds one row per evaluation kept in DAKOTA's
+    evaluation cache, in evaluation order: :attr:`eval_ids`, :attr:`variables`,
+    :attr:`responses` and the active set vector :attr:`asv` telling which
+    responses were computed. The history is empty if the evaluation cache has
+    been deactivated and only holds the last evaluations if it is limited.
+
+    :attr:`failures` holds the counters of the failure policy of the driver,
+    see :meth:`dakota_failures.FailurePolicy.counters`, empty without one.
+
+    :attr:`stopped_early` tells whether the budget of the run stopped it, in
+    which case the final point is the best evaluation so far by the key of the
+    budget: the one with the smallest first function value unless the budget
+    was given another key, as a study maximizing its objective must.
+
+    :attr:`study_key` is the key of the study in the study cache of the run, if
+    any, and :attr:`from_cache` tells whether the results were found there.
+    """
+
+    def __init__(self):
+        self.final_variables = numpy.zeros(0)
+        self.final_responses = numpy.zeros(0)
+        self.variable_labels = []
+        self.response_labels = []
+        self.eval_ids = numpy.zeros(0, dtype=numpy.intc)
+        self.variables = numpy.zeros((0, 0))
+        self.responses = numpy.zeros((0, 0))
+        self.asv = numpy.zeros((0, 0), dtype=numpy.short)
+        self.failures = {}
+        self.stopped_early = False
+        self.study_key = None
+        self.from_cache = False
+
+    def __repr__(self):
+        return f"DakotaResults(evaluations={len(self.eval_ids)}, final_responses={self.final_responses})"
+
+    @property
+    def final(self):
+        """
+        The final variables and responses by label: the best point found by DAKOTA or,
+        for a run stopped by its budget, the best evaluation by the key of the budget,
+        the smallest first function value by default, see :class:`dakota_budget.Budget`.
+        """
+        return dict(zip(self.variable_labels + self.response_labels,
+                        numpy.concatenate([self.final_variables, self.final_responses]).tolist()))
+
+    def column(self, label):
+        """ Return the history of the variable or response with the given label. """
+        if label in self.variable_labels:
+            return self.variables[:, self.variable_labels.index(label)]
+        return self.responses[:, self.response_labels.index(label)]
+
+
 class _ExcInfo:
     """ Used to hold exception return information. """
 
@@ -184,16 +744,27 @@ class _ExcInfo:
         self.traceback = None
 
 
-def run_dakota(infile, stdout=None, stderr=None, restart=0, throw_on_error=True):
+def run_dakota(infile, stdout=None, stderr=None, restart=0, throw_on_error=True, drivers=None, profile=None,
+               input_string=None, listener=None, loop=None, read_restart=None, write_restart=None,
+               stop_restart=0, output=None, cache_limit=0, store=None, budget=None):
     """
-    Run DAKOTA with the configuration file as provided as first argument 'infile'.
+    Run DAKOTA with the configuration file as provided as first argument 'infile',
+    or with the configuration given as `input_string`.
 
     `stdout` and `stderr` can be used to direct their respective DAKOTA
-    stream to a filename.
+    stream to a filename. The streams not sent to a file go to `output` if
+    given, for instance an :class:`dakota_output.OutputCapture` keeping them
+    in memory, or to the standard output and error of the process.
 
     Set dakota in restart mode if restart is equal to 1
 
-    :param infile: The name of the configuration file
+    Runs started from several threads are serialized: DAKOTA keeps process wide
+    state, so a run waits for the one in progress to end before starting. The
+    GIL is released while DAKOTA runs and taken back for the callbacks only, so
+    other Python threads keep running during a run. Use :func:`run_many` or
+    separate processes to run studies in parallel.
+
+    :param infile: The name of the configuration file, may be None if `input_string` is given
     :type infile: str
     :param stdout: The stream where to redirect standard output
     :param stderr: The stream where to redirect standard error
@@ -202,7 +773,43 @@ def run_dakota(infile, stdout=None, stderr=None, restart=0, throw_on_error=True)
     expect in this case the restart file dakota.rst to be present in the working directory
     :type restart: int
     :param throw_on_error: Dakota throws on error instead of aborting
+    :param drivers: The drivers that may be called during this run, by identifier.
+    Defaults to all drivers registered by :meth:`DakotaInput.write_input`.
+    :type drivers: Mapping[str, DakotaBase]
+    :param profile: Optional profile recording the timings of the callbacks
+    :type profile: dakota_profile.RunProfile
+    :param input_string: The configuration, as rendered by :meth:`DakotaInput.render`, used instead of `infile`
+    :type input_string: str
+    :param listener: Optional callable invoked after each callback, in the thread running DAKOTA, as
+    ``listener(kwargs, response, start, end, batch)`` with the callback arguments, the response returned
+    to DAKOTA, the :func:`time.perf_counter` times around the driver call and whether it was a batch.
+    :param loop: The event loop, running in another thread, awaiting the coroutines returned by callbacks
+    :type loop: asyncio.AbstractEventLoop
+    :param read_restart: The restart file to replay, instead of 'dakota.rst' when `restart` is set
+    :type read_restart: str
+    :param write_restart: The restart file to write, instead of 'dakota.rst'
+    :type write_restart: str
+    :param stop_restart: If positive, only this many evaluations of the restart file are replayed
+    :type stop_restart: int
+    :param output: Optional callable invoked as ``output(stream, text)`` with the text written by DAKOTA
+    to `stream`, 'stdout' or 'stderr'. The text may end in the middle of a line. If it has a ``flush``
+    method, it is called at the end of the run.
+    :type output: dakota_output.OutputCapture
+    :param cache_limit: If positive, DAKOTA's evaluation cache is trimmed to this many evaluations,
+    the last ones, before each callback
+    :type cache_limit: int
+    :param store: Optional store receiving every completed evaluation as a listener. If a directory,
+    a new :class:`dakota_store.EvaluationStore` is written there and closed at the end of the run.
+    :type store: dakota_store.EvaluationStore or str
+    :param budget: Optional limits of the run, checked before each callback. Once one is reached, the
+    callback raises :class:`dakota_budget.StopStudy` instead of evaluating, which ends the run, and
+    the results are returned with :attr:`DakotaResults.stopped_early` set.
+    :type budget: dakota_budget.Budget
+    :return: The final point and evaluation history of the run
+    :rtype: DakotaResults
     """
+    if (infile is None) == (input_string is None):
+        raise RuntimeError("Exactly one of the configuration file and the configuration string is required")
 
     # Checking for a Python exception via sys.exc_info() doesn't work, for
     # some reason it always returns (None, None, None).  So instead we pass
@@ -210,13 +817,79 @@ def run_dakota(infile, stdout=None, stderr=None, restart=0, throw_on_error=True)
     # it with the exception information so we can re-raise it.
     err = 0
     exc = _ExcInfo()
-    err = carolina.run_dakota(infile,
-                              stdout,
-                              stderr,
-                              exc,
-                              restart,
-                              throw_on_error)
+    results = DakotaResults()
+    owned_store = store is not None and not callable(store)
+    if owned_store:
+        from dakota_store import EvaluationStore
+        store = EvaluationStore(store)
+    if store is not None:
+        listener = _chain_listeners(store, listener)
+    if budget is not None:
+        budget.start()
+        listener = _chain_listeners(budget, listener)
+
+    if profile is not None:
+        profile.start()
+    try:
+        err = preload().run_dakota(infile,
+                                  stdout,
+                                  stderr,
+                                  exc,
+                                  restart,
+                                  throw_on_error,
+                                  _Run(_USER_DATA if drivers is None else drivers, profile, results, listener, loop,
+                                       output, cache_limit, budget),
+                                  input_string,
+                                  None if read_restart is None else os.fspath(read_restart),
+                                  None if write_restart is None else os.fspath(write_restart),
+                                  stop_restart)
+    finally:
+        if profile is not None:
+            profile.finish()
+        _flush(output)
+        if store is not None:
+            if not store.response_labels:
+                store.response_labels = results.response_labels
+            if owned_store:
+                store.close()
+            else:
+                store.flush()
+
+    if err and budget is not None and _stopped(exc):
+        logging.info(f'dakota ({os.getpid()}): {exc.value}')
+        budget.finish(results)
+        return results
+    _check(err, exc)
+    return results
+
+
+def _chain_listeners(first, second):
+    """ Return a listener calling `first`, then `second` if not None. """
+    if second is None:
+        return first
+
+    def listener(*args):
+        first(*args)
+        second(*args)
+    return listener
+
+
+def _flush(output):
+    """ Flush the incomplete last lines of the output callable of a run, if it supports it. """
+    flush = getattr(output, 'flush', None)
+    if flush is not None:
+        flush()
+
 
+def _stopped(exc):
+    """ Tell whether the error recorded in `exc` is the budget of the run stopping it. """
+    from dakota_budget import StopStudy
+
+    return isinstance(exc.type, type) and issubclass(exc.type, StopStudy)
+
+
+def _check(err, exc):
+    """ Raise the error of a failed run, recorded in `exc` by the extension. """
     # Check for errors. We'll get here if Dakota::abort_mode has been set to
     # throw an exception rather than shut down the process.
     if err:
@@ -226,6 +899,279 @@ def run_dakota(infile, stdout=None, stderr=None, restart=0, throw_on_error=True)
             raise exc.type(exc.value).with_traceback(exc.traceback)
 
 
+class DakotaSession:
+    """
+    A study of a driver whose DAKOTA environment is constructed once and
+    executed by every :meth:`run`, e.g. in an outer loop running the same
+    problem many times.
+
+    The continuous bounds and initial point may change between runs. A new
+    seed changes the input of the method, so the environment is constructed
+    again. Methods that read the bounds or initial point only when they are
+    constructed keep their original values. Evaluation IDs keep increasing
+    from one run to the next.
+
+    :attr:`builds` and :attr:`runs` count the constructions and executions,
+    :attr:`construction_time` is the total time spent constructing and
+    :attr:`time_saved` estimates the time saved by not constructing the
+    environment for every run.
+    """
+
+    def __init__(self, driver, stdout=None, stderr=None, throw_on_error=True, profile=None,
+                 read_restart=None, write_restart=None, output=None):
+        """
+        :param driver: The driver of the study
+        :type driver: DakotaBase
+        :param stdout: The file receiving DAKOTA's standard output
+        :param stderr: The file receiving DAKOTA's standard error
+        :param throw_on_error: Dakota throws on error instead of aborting
+        :param profile: Optional profile recording the timings of the callbacks of each run
+        :type profile: dakota_profile.RunProfile
+        :param read_restart: The restart file to replay
+        :param write_restart: The restart file to write, no restart file is written if None
+        :param output: Optional callable receiving the output of DAKOTA not sent to a file,
+        see :meth:`run_dakota`
+        :type output: dakota_output.OutputCapture
+        """
+        self.driver = driver
+        self.stdout = stdout
+        self.stderr = stderr
+        self.throw_on_error = throw_on_error
+        self.profile = profile
+        self.read_restart = read_restart
+        self.write_restart = write_restart
+        self.output = output
+        self.builds = 0
+        self.runs = 0
+        self.construction_time = 0.0
+        self._seed = None
+        self._session = None
+        self._run = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return (f"DakotaSession(builds={self.builds}, runs={self.runs}, "
+                f"construction_time={self.construction_time:.3f}, time_saved={self.time_saved:.3f})")
+
+    @property
+    def time_saved(self):
+        """ The mean construction time, in seconds, times the number of runs that did not construct. """
+        if not self.builds:
+            return 0.0
+        return self.construction_time / self.builds * (self.runs - self.builds)
+
+    def run(self, lower_bounds=None, upper_bounds=None, initial_point=None, seed=None):
+        """
+        Execute the study, after updating the given settings.
+
+        :param lower_bounds: The lower bounds of the continuous variables
+        :param upper_bounds: The upper bounds of the continuous variables
+        :param initial_point: The initial values of the continuous variables
+        :param seed: The seed of the method, constructs the environment again if it changed
+        :return: The final point and evaluation history of the run
+        :rtype: DakotaResults
+        """
+        if seed is not None and seed != self._seed:
+            self.close()
+            self._seed = seed
+        if self._session is None:
+            self._build()
+
+        if lower_bounds is not None or upper_bounds is not None or initial_point is not None:
+            if not self._session.update(lower_bounds, upper_bounds, initial_point):
+                raise RuntimeError("No model has as many continuous variables as the bounds or initial point")
+
+        results = DakotaResults()
+        self._run.results = results
+        if self.driver.failure_policy is not None:
+            self.driver.failure_policy.reset()
+        exc = _ExcInfo()
+        if self.profile is not None:
+            self.profile.start()
+        try:
+            err = self._session.execute(exc)
+        finally:
+            if self.profile is not None:
+                self.profile.finish()
+            _flush(self.output)
+        self.runs += 1
+        _check(err, exc)
+        if self.driver.failure_policy is not None:
+            results.failures = self.driver.failure_policy.counters()
+        return results
+
+    def close(self):
+        """ Delete the environment, the next run constructs it again. """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+            self._run = None
+            _flush(self.output)
+
+    def _build(self):
+        dakota_input = self.driver.input
+        if self._seed is not None:
+            # Replace the seed of the method, on a copy of the input
+            dakota_input = copy.copy(dakota_input)
+            dakota_input.method = [line for line in dakota_input.method
+                                   if not line.strip().startswith('seed')] + [f"  seed = {self._seed}"]
+
+        input_string = dakota_input.render(driver_instance=self.driver, write_restart=self.write_restart is not None)
+        self._run = _Run(_drivers(self.driver), self.profile, output=self.output)
+        exc = _ExcInfo()
+        session = preload().Session(None, self.stdout, self.stderr, exc, self.throw_on_error, self._run,
+                                    input_string,
+                                    None if self.read_restart is None else os.fspath(self.read_restart),
+                                    None if self.write_restart is None else os.fspath(self.write_restart))
+        self.builds += 1
+        self.construction_time += session.construction_time
+        if not session.is_open:
+            _check(1, exc)
+        self._session = session
+        logging.info(f'dakota ({os.getpid()}): environment constructed in {session.construction_time:.3f} s')
+
+
+def read_restart(path, stop_restart=0):
+    """
+    Return the evaluations recorded in a DAKOTA restart file, in evaluation order.
+
+    Each evaluation is a (point, response) pair of dictionaries. The point holds
+    ``currEvalId``, ``av``, ``av_labels``, ``asv`` and ``dvv`` as in the callback
+    arguments and the response holds ``fns``, and ``fnGrads`` and ``fnHessians``
+    when requested. The pairs can be stored in an evaluation cache, so that a
+    study run with another input or in another directory does not evaluate them
+    again::
+
+        cache.store_many(read_restart('dakota.rst'))
+
+    :param path: The restart file
+    :type path: str
+    :param stop_restart: If positive, only this many evaluations are read
+    :type stop_restart: int
+    :rtype: list[tuple[dict, dict]]
+    """
+    return [tuple(entry) for entry in preload().read_restart(os.fspath(path), stop_restart)]
+
+
+def preload():
+    """
+    Load the ``carolina`` extension, and with it DAKOTA, if not done yet and return it.
+
+    Importing this module does not load DAKOTA, the first run does. Call this in
+    a process that forks workers so that the workers inherit the loaded
+    libraries. With the 'forkserver' start method, have the server load them::
+
+        multiprocessing.set_forkserver_preload(['dakota', 'carolina'])
+
+    :return: The carolina extension module
+    """
+    global _CAROLINA
+    if _CAROLINA is None:
+        import carolina
+        _CAROLINA = carolina
+    return _CAROLINA
+
+
+class StudyResult:
+    """ Outcome of one study run by :meth:`run_many`. """
+
+    def __init__(self, index, workdir, status, value=None, driver=None, error=None, traceback=None):
+        """
+        :param index: The position of the driver in the list given to :meth:`run_many`
+        :param workdir: The working directory of the study
+        :param status: 'ok' if the study completed, 'failed' otherwise
+        :param value: The value returned by :meth:`DakotaBase.run_dakota`
+        :param driver: The driver as it was at the end of the study in the worker process
+        :param error: The exception raised by a failed study
+        :param traceback: The formatted traceback of a failed study
+        """
+        self.index = index
+        self.workdir = workdir
+        self.status = status
+        self.value = value
+        self.driver = driver
+        self.error = error
+        self.traceback = traceback
+
+    def __repr__(self):
+        return f"StudyResult(index={self.index}, status={self.status!r}, workdir={self.workdir!r})"
+
+
+def run_many(drivers, max_workers=None, workdir=None, mp_context=None, **kwargs):
+    """
+    Run independent studies in a pool of worker processes.
+
+    Each study runs in a working directory of its own, ``study_<index>`` under
+    `workdir`, holding its input file ``dakota.in``, restart file ``dakota.rst``
+    and the ``dakota.out`` and ``dakota.err`` output streams.
+
+    Failing studies do not stop the others, the exception raised in the worker
+    is returned in their :class:`StudyResult`.
+
+    :param drivers: The drivers to run, they must be picklable
+    :type drivers: Sequence[DakotaBase]
+    :param max_workers: The number of worker processes, defaults to the number of CPUs
+    :type max_workers: int
+    :param workdir: The directory holding the study directories, a new temporary directory if None
+    :type workdir: str
+    :param mp_context: The multiprocessing context used to start the workers
+    :param kwargs: Additional arguments passed to :meth:`DakotaBase.run_dakota`, except the
+    `infile`, `stdout` and `stderr` set for each study
+    :return: One result per driver, in the order of `drivers`
+    :rtype: list[StudyResult]
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    reserved = sorted(set(kwargs) & {'infile', 'stdout', 'stderr'})
+    if reserved:
+        raise RuntimeError(f"run_many sets the {', '.join(reserved)} of each study, "
+                           f"they can not be given as arguments")
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='dakota_')
+
+    workdirs = [os.path.join(workdir, f'study_{index:04d}') for index in range(len(drivers))]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        futures = [executor.submit(_run_study, index, driver, workdirs[index], kwargs)
+                   for index, driver in enumerate(drivers)]
+
+        results = []
+        for index, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                # The worker died, e.g. when dakota aborted the process
+                results.append(StudyResult(index, workdirs[index], 'failed', error=exc,
+                                           traceback=traceback.format_exc()))
+        return results
+
+
+def _run_study(index, driver, workdir, kwargs):
+    """ Run one study of :meth:`run_many` in its working directory, in a worker process. """
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        value = driver.run_dakota(infile='dakota.in', stdout='dakota.out', stderr='dakota.err', **kwargs)
+        return StudyResult(index, workdir, 'ok', value=value, driver=driver)
+
+    except Exception as exc:
+        # Exceptions must get through pickling to reach the parent process
+        try:
+            pickle.dumps(exc)
+        except Exception:
+            exc = RuntimeError(repr(exc))
+        return StudyResult(index, workdir, 'failed', error=exc, traceback=traceback.format_exc())
+
+    finally:
+        os.chdir(cwd)
+
+
 def dakota_callback(kwargs):
     """
     Generic callback from DAKOTA, forwards parameters to driver provided as
@@ -258,6 +1204,8 @@ def dakota_callback(kwargs):
     ------------------- ----------------------------------------------
     av_labels           all variable labels
     ------------------- ----------------------------------------------
+    fn_labels           function labels
+    ------------------- ----------------------------------------------
     asv                 active set vector (bit1=f, bit2=df, bit3=d^2f)
     ------------------- ----------------------------------------------
     dvv                 derivative variables vector
@@ -270,19 +1218,185 @@ def dakota_callback(kwargs):
     =================== ==============================================
 
     """
+    return _evaluate(_fetch_driver(kwargs, 'dakota_callback'), kwargs)
+
+
+def _evaluate(driver, kwargs, loop=None):
+    """ Evaluate a single point with `driver`, going through its cache if it has one. """
+    if driver.cache is None:
+        return _call_driver_single(driver, kwargs, loop)
+
+    response = driver.cache.lookup(kwargs)
+    if response is None:
+        response = _call_driver_single(driver, kwargs, loop)
+        driver.cache.store(kwargs, response)
+    return response
+
+
+def _call_driver_single(driver, kwargs, loop):
+    """ Evaluate a single point, as a batch of one if the driver has finite differences. """
+    if driver.finite_differences is None:
+        if driver.failure_policy is None:
+            return _resolve(driver.dakota_callback(**kwargs), loop)
+        return driver.failure_policy.call(lambda **point: _resolve(driver.dakota_callback(**point), loop), kwargs)
+
+    batch = dict(kwargs)
+    for key in _BATCH_KEYS:
+        batch[key] = [kwargs[key]] if key == 'currEvalId' else numpy.asarray(kwargs[key])[None]
+    response = _call_driver_batch(driver, batch, loop)
+    return {key: value[0] for key, value in response.items()}
+
+
+def _call_driver_batch(driver, kwargs, loop):
+    """
+    Evaluate a batch, computing the gradients if the driver has finite differences. The failure
+    policy of the driver applies to the whole batch, unless :meth:`DakotaBase.dakota_batch_callback`
+    applies it to each row.
+    """
+    if driver.finite_differences is None:
+        def call(**batch):
+            return _resolve(driver.dakota_batch_callback(**batch), loop)
+        if driver.failure_policy is None or type(driver).dakota_batch_callback is DakotaBase.dakota_batch_callback:
+            return call(**kwargs)
+    else:
+        def call(**batch):
+            return driver.finite_differences.evaluate_batch(
+                batch, lambda stencil: _resolve(driver.dakota_stencil(**stencil), loop))
+        if driver.failure_policy is None:
+            return call(**kwargs)
+    return driver.failure_policy.call(call, kwargs)
+
+
+def dakota_batch_callback(kwargs):
+    """
+    Generic batch callback from the ``carolina`` interface, forwards a batch of
+    evaluations to :meth:`DakotaBase.dakota_batch_callback` of the driver
+    provided as the ``driver_instance`` argument to :meth:`DakotaInput.write`.
+
+    `kwargs` contains the same keys as for :meth:`dakota_callback`. The per
+    evaluation entries ``cv``, ``div``, ``drv``, ``av``, ``asv`` and ``dvv`` are
+    2-D arrays with one row per evaluation and ``currEvalId`` is the list of
+    evaluation IDs of the rows.
+
+    The driver should return a responses dictionary where ``fns``, ``fnGrads``
+    and ``fnHessians`` are stacked along a leading axis in the same order.
+    """
+    return _evaluate_batch(_fetch_driver(kwargs, 'dakota_batch_callback'), kwargs)
+
+
+def _evaluate_batch(driver, kwargs, loop=None):
+    """ Evaluate a batch with `driver`, going through its cache if it has one. """
+    if driver.cache is None:
+        return _call_driver_batch(driver, kwargs, loop)
+
+    # Only evaluate the rows that are not cached
+    points = list(_split_batch(kwargs))
+    responses = [driver.cache.lookup(point) for point in points]
+    missing = [row for row, response in enumerate(responses) if response is None]
+    if missing:
+        computed = _call_driver_batch(driver, _select_rows(kwargs, missing), loop)
+        failed = computed.get('failed', numpy.zeros(len(missing), dtype=bool))
+        for index, row in enumerate(missing):
+            if not failed[index]:
+                responses[row] = {key: numpy.asarray(value)[index] for key, value in computed.items()
+                                  if key in ('fns', 'fnGrads', 'fnHessians')}
+        driver.cache.store_many([(points[row], responses[row]) for row in missing if responses[row] is not None])
+    return _stack_responses(kwargs, responses)
+
+
+def _resolve(response, loop):
+    """
+    Return the `response` of a callback, awaiting it on `loop` if it is awaitable.
+    Without a loop, the awaitable runs in a new event loop of the calling thread.
+    """
+    if isinstance(response, dict):
+        return response
+
+    import asyncio
+    import inspect
+
+    if not inspect.isawaitable(response):
+        return response
+    if loop is None:
+        return asyncio.run(_await(response))
+    return asyncio.run_coroutine_threadsafe(_await(response), loop).result()
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _fetch_driver(kwargs, caller, drivers=_USER_DATA):
+    """ Return the driver identified by the analysis_components in `kwargs`. """
     acs = kwargs['analysis_components']
     if not acs:
-        msg = f'dakota_callback ({os.getpid()}): No analysis_components'
+        msg = f'{caller} ({os.getpid()}): No analysis_components'
         logging.error(msg)
         raise RuntimeError(msg)
 
     # Get the instance of the driver - currently only a Python based driver is allowed
     try:
-        driver = fetch_data(acs[0], _USER_DATA)
+        return fetch_data(acs[0], drivers)
 
     except KeyError:
-        msg = f'dakota_callback ({os.getpid()}): identifier {acs[0]} not found in user data'
+        msg = f'{caller} ({os.getpid()}): identifier {acs[0]} not found in the drivers of this run'
         logging.error(msg)
         raise RuntimeError(msg)
 
-    return driver.dakota_callback(**kwargs)
+
+# Entries of the callback arguments holding one row per evaluation in a batch
+_BATCH_KEYS = ('cv', 'div', 'drv', 'av', 'asv', 'dvv', 'currEvalId')
+
+
+def _split_batch(kwargs):
+    """ Yield the callback arguments of each single evaluation in a batch. """
+    for row in range(len(kwargs['currEvalId'])):
+        point = dict(kwargs)
+        for key in _BATCH_KEYS:
+            point[key] = kwargs[key][row]
+        yield point
+
+
+def _select_rows(kwargs, rows):
+    """ Return the callback arguments of a batch reduced to the given rows. """
+    selected = dict(kwargs)
+    for key in _BATCH_KEYS:
+        value = kwargs[key]
+        selected[key] = value[rows] if isinstance(value, numpy.ndarray) else [value[row] for row in rows]
+    return selected
+
+
+def _call_driver(driver, kwargs):
+    """
+    Evaluate a single point, module level so that it can be sent to a process pool.
+    With a failure policy, return the (response, counts) pair of :meth:`dakota_failures.FailurePolicy.run`.
+    """
+    if driver.failure_policy is None:
+        return driver.dakota_callback(**kwargs)
+    return driver.failure_policy.run(driver.dakota_callback, kwargs)
+
+
+def _stack_responses(kwargs, responses):
+    """
+    Stack the responses of single evaluations into the responses of a batch, the
+    evaluations whose response is None being marked as failed.
+    """
+    nrows = len(responses)
+    nfns = kwargs['functions']
+    nder = numpy.shape(kwargs['dvv'])[-1]
+    shapes = {'fns': (nfns,), 'fnGrads': (nfns, nder), 'fnHessians': (nfns, nder, nder)}
+
+    failed = [response is None for response in responses]
+    if any(failed):
+        responses = [{} if response is None else response for response in responses]
+
+    retval = dict()
+    for key, shape in shapes.items():
+        if any(key in response for response in responses):
+            retval[key] = numpy.zeros((nrows,) + shape)
+            for row, response in enumerate(responses):
+                if key in response:
+                    retval[key][row] = response[key]
+    if any(failed):
+        retval['failed'] = numpy.array(failed)
+    return retval
@@ -0,0 +1,147 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Wall-clock and evaluation budgets of a run.
+
+Given as the `budget` of :meth:`dakota.DakotaBase.run_dakota`, a
+:class:`Budget` stops the study once its time or number of evaluations is
+used up, or once its stop predicate returns True. The evaluations in flight
+complete first, the restart file and the output are flushed, and the run
+returns the best evaluation so far rather than raising:
+
+    results = driver.run_dakota(infile=None, budget=Budget(time=3600, evaluations=5000))
+    if results.stopped_early:
+        print(results.final)
+"""
+
+import time
+
+import numpy
+
+# Reasons of a stop, see Budget.reason
+REASONS = ('time', 'evaluations', 'predicate', 'cancelled')
+
+
+class StopStudy(Exception):
+    """ Raised by a callback of a run whose budget is used up, ending the run early. """
+
+
+class Budget:
+    """
+    Limits of a run, checked before each callback: a run is stopped between
+    callbacks, so the batch in flight when a limit is reached completes and
+    may exceed the number of evaluations.
+
+    The budget records the best evaluation, which becomes the final point of
+    a stopped run. It assumes a minimization of the first function unless
+    given a `key`: for instance, to maximize it, ``key=lambda fns: -fns[0]``.
+
+    The budget is a listener of :meth:`dakota.run_dakota`, so like any
+    listener it disables the fast path of :meth:`dakota.DakotaBase.dakota_bind`.
+    """
+
+    def __init__(self, time=None, evaluations=None, stop=None, key=None):
+        """
+        :param time: The wall-clock time of the run, in seconds, no limit if None
+        :type time: float
+        :param evaluations: The number of evaluations of the run, no limit if None
+        :type evaluations: int
+        :param stop: Optional predicate called after each callback as ``stop(kwargs, response)``,
+        with the arguments and the response of the callback, the run stops once it returns True
+        :param key: Optional callable returning the value to minimize for the function values of an
+        evaluation, the first function value if None
+        """
+        if evaluations is not None and evaluations < 1:
+            raise RuntimeError("The evaluation budget must be a positive number")
+
+        self.time = time
+        self.max_evaluations = evaluations
+        self.stop = stop
+        self.key = key
+        self.start()
+
+    def __repr__(self):
+        return (f"Budget(time={self.time}, evaluations={self.max_evaluations}, "
+                f"used={self.evaluations}, elapsed={self.elapsed:.3f}, reason={self.reason!r})")
+
+    def start(self):
+        """ Start the clock and forget the evaluations of a previous run. """
+        self.started = time.monotonic()
+        self.evaluations = 0
+        self.reason = None
+        self.variable_labels = []
+        self.best_variables = None
+        self.best_responses = None
+        self.best_value = None
+
+    @property
+    def elapsed(self):
+        """ The wall-clock time since the start of the run, in seconds. """
+        return time.monotonic() - self.started
+
+    def __call__(self, kwargs, response, start, end, batch):
+        """ Record the evaluations of a callback, with the arguments of a listener of :meth:`dakota.run_dakota`. """
+        eval_ids = numpy.atleast_1d(kwargs['currEvalId'])
+        nrows, nfns = len(eval_ids), kwargs['functions']
+        self.evaluations += nrows
+        self.variable_labels = list(kwargs['av_labels'])
+
+        fns = response.get('fns')
+        if fns is not None and nfns:
+            fns = numpy.asarray(fns, dtype=float).reshape(nrows, nfns)
+            valid = numpy.asarray(kwargs['asv']).reshape(nrows, nfns)[:, 0] & 1 != 0
+            if 'failed' in response:
+                valid &= ~numpy.asarray(response['failed'], dtype=bool).reshape(nrows)
+            if valid.any():
+                rows = numpy.flatnonzero(valid)
+                if self.key is None:
+                    values = fns[rows, 0]
+                else:
+                    values = numpy.array([self.key(fns[row]) for row in rows], dtype=float)
+                best = numpy.argmin(values)
+                if self.best_value is None or values[best] < self.best_value:
+                    row = rows[best]
+                    self.best_variables = numpy.asarray(kwargs['av'], dtype=float).reshape(nrows, -1)[row].copy()
+                    self.best_responses = fns[row].copy()
+                    self.best_value = values[best]
+
+        if self.stop is not None and self.reason is None and self.stop(kwargs, response):
+            self.reason = 'predicate'
+
+    def cancel(self):
+        """ Stop the run at its next callback, whatever is left of the budget. """
+        if self.reason is None:
+            self.reason = 'cancelled'
+
+    def check(self):
+        """ Raise :class:`StopStudy` if the budget is used up, called before each callback. """
+        if self.reason is None:
+            if self.time is not None and self.elapsed >= self.time:
+                self.reason = 'time'
+            elif self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+                self.reason = 'evaluations'
+        if self.reason is not None:
+            raise StopStudy(f"budget used up ({self.reason}) after {self.evaluations} evaluations "
+                            f"and {self.elapsed:.1f} s")
+
+    def finish(self, results):
+        """ Mark the results of a stopped run, with the best evaluation recorded as final point. """
+        results.stopped_early = True
+        if not results.variable_labels:
+            results.variable_labels = self.variable_labels
+        if self.best_variables is not None:
+            results.final_variables = self.best_variables
+            results.final_responses = self.best_responses
@@ -0,0 +1,447 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Persistent caches for DAKOTA drivers.
+
+:class:`EvaluationCache` stores evaluated points on disk so that later runs,
+or restarts of the same optimizer, do not pay for them again. It is passed to
+:class:`dakota.DakotaBase` and consulted before the driver's callbacks.
+
+:class:`StudyCache` stores whole studies, keyed on their rendered input and
+the version of their drivers, so that running an identical study again
+returns its results without running DAKOTA. It is passed to
+:meth:`dakota.DakotaBase.run_dakota`.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy
+
+# Response entries stored for a point
+_RESPONSE_KEYS = ('fns', 'fnGrads', 'fnHessians')
+
+# The driver identifiers written to the input, which change from one process to the next
+_ANALYSIS_COMPONENTS = re.compile(r"analysis_components\s*=\s*'\d+'")
+
+_TABULAR = re.compile(r"^\s*tabular_(graphics_)?data\b")
+_TABULAR_FILE = re.compile(r"tabular_(?:graphics|data)_file\s*=?\s*['\"]([^'\"]+)['\"]")
+
+
+class EvaluationCache:
+    """
+    On-disk cache of evaluations, backed by an SQLite database.
+
+    Entries are keyed on the variable labels, the active set vector and the
+    variable values. Values match when no variable differs by more than
+    `tolerance`. When `max_entries` is set, the least recently used entries are
+    evicted once the cache grows beyond it.
+
+    The counters :attr:`hits`, :attr:`misses` and :attr:`evictions` count the
+    lookups and evictions done through this instance.
+    """
+
+    def __init__(self, path, tolerance=0.0, max_entries=None):
+        """
+        :param path: The file holding the cache, created if it does not exist
+        :type path: str
+        :param tolerance: The largest absolute difference of a variable for two points to match
+        :type tolerance: float
+        :param max_entries: The maximum number of entries kept, no limit if None
+        :type max_entries: int
+        """
+        if tolerance < 0:
+            raise RuntimeError("The cache tolerance can not be negative")
+        if max_entries is not None and max_entries < 1:
+            raise RuntimeError("The maximum number of cache entries must be a positive number")
+
+        self.path = path
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS evaluations (
+                id INTEGER PRIMARY KEY,
+                signature TEXT NOT NULL,
+                x0 REAL NOT NULL,
+                point BLOB NOT NULL,
+                response BLOB NOT NULL,
+                used INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS lookup ON evaluations (signature, x0);
+            CREATE INDEX IF NOT EXISTS lru ON evaluations (used);
+            """)
+        self._clock, self._size = self._db.execute(
+            "SELECT COALESCE(MAX(used), 0), COUNT(*) FROM evaluations").fetchone()
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return (f"EvaluationCache({self.path!r}, entries={self._size}, hits={self.hits}, "
+                f"misses={self.misses}, evictions={self.evictions})")
+
+    def lookup(self, kwargs):
+        """
+        Return the cached response for the evaluation described by the callback
+        arguments `kwargs`, or None if there is no match.
+        """
+        signature, point = _key(kwargs)
+        x0 = point[0] if point.size else 0.0
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, point, response FROM evaluations WHERE signature = ? AND x0 BETWEEN ? AND ?",
+                (signature, x0 - self.tolerance, x0 + self.tolerance)).fetchall()
+
+            best, best_distance = None, None
+            for ident, cached, response in rows:
+                cached = numpy.frombuffer(cached)
+                if cached.shape != point.shape:
+                    continue
+                distance = numpy.max(numpy.abs(cached - point), initial=0.0)
+                if distance <= self.tolerance and (best is None or distance < best_distance):
+                    best, best_distance = (ident, response), distance
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._clock += 1
+            self._db.execute("UPDATE evaluations SET used = ? WHERE id = ?", (self._clock, best[0]))
+            self._db.commit()
+            return pickle.loads(best[1])
+
+    def store(self, kwargs, response):
+        """ Store the `response` of the evaluation described by the callback arguments `kwargs`. """
+        self.store_many([(kwargs, response)])
+
+    def store_many(self, evaluations):
+        """ Store a sequence of (kwargs, response) pairs in a single transaction. """
+        with self._lock:
+            for kwargs, response in evaluations:
+                signature, point = _key(kwargs)
+                response = {key: numpy.asarray(response[key]) for key in _RESPONSE_KEYS if key in response}
+                self._clock += 1
+                self._db.execute(
+                    "INSERT INTO evaluations (signature, x0, point, response, used) VALUES (?, ?, ?, ?, ?)",
+                    (signature, point[0] if point.size else 0.0, point.tobytes(),
+                     pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL), self._clock))
+                self._size += 1
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._db.execute("DELETE FROM evaluations")
+            self._db.commit()
+            self._size = 0
+
+    def close(self):
+        """ Close the underlying database. """
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        if self.max_entries is None or self._size <= self.max_entries:
+            return
+        excess = self._size - self.max_entries
+        self._db.execute(
+            "DELETE FROM evaluations WHERE id IN (SELECT id FROM evaluations ORDER BY used LIMIT ?)", (excess,))
+        self._size -= excess
+        self.evictions += excess
+
+
+def _key(kwargs):
+    """ Return the signature (labels and ASV) and the variable values of an evaluation. """
+    labels = '\x1f'.join(str(label) for label in kwargs['av_labels'])
+    asv = ','.join(str(int(bits)) for bits in numpy.ravel(kwargs['asv']))
+    signature = hashlib.sha1(f"{labels}\x1e{asv}".encode()).hexdigest()
+    return signature, numpy.ascontiguousarray(kwargs['av'], dtype=float).ravel()
+
+
+class StudyRecord:
+    """
+    A study stored in a :class:`StudyCache`: its results, the text DAKOTA wrote
+    to 'stdout' and 'stderr' and the files it wrote, by path.
+    """
+
+    __slots__ = ('results', 'streams', 'files')
+
+    def __init__(self, results, streams, files):
+        self.results = results
+        self.streams = streams
+        self.files = files
+
+    @classmethod
+    def capture(cls, results, recorder, input_string, stdout=None, stderr=None):
+        """
+        Return the record of a study run with the output callable `recorder`, reading
+        the text of the streams sent to the `stdout` and `stderr` files and the
+        tabular data files of `input_string`. Without a recorder, the text DAKOTA
+        wrote to the standard output and error of the process is not recorded.
+
+        :type recorder: OutputRecorder
+        :rtype: StudyRecord
+        """
+        streams = {}
+        for stream, path in (('stdout', stdout), ('stderr', stderr)):
+            if path:
+                with open(path) as stream_file:
+                    streams[stream] = stream_file.read()
+            elif recorder is not None:
+                streams[stream] = recorder.text(stream)
+        files = {}
+        for path in tabular_files(input_string):
+            if os.path.exists(path):
+                with open(path, 'rb') as tabular:
+                    files[path] = tabular.read()
+        return cls(results, streams, files)
+
+    def restore(self, output=None, stdout=None, stderr=None):
+        """
+        Write the files of the study and the text of its streams as a run would, to
+        the `stdout` and `stderr` files if given, to `output` or to the standard
+        output and error of the process otherwise, and return its results.
+
+        :rtype: dakota.DakotaResults
+        """
+        for path, content in self.files.items():
+            with open(path, 'wb') as out:
+                out.write(content)
+        for stream, path in (('stdout', stdout), ('stderr', stderr)):
+            text = self.streams.get(stream, '')
+            if path:
+                with open(path, 'w') as out:
+                    out.write(text)
+            elif not text:
+                continue
+            elif output is not None:
+                output(stream, text)
+            else:
+                getattr(sys, stream).write(text)
+        flush = getattr(output, 'flush', None)
+        if flush is not None:
+            flush()
+        return self.results
+
+
+class OutputRecorder:
+    """
+    Output callable of a run keeping the text of each stream, for a
+    :class:`StudyCache`, and forwarding it to the output callable of the run.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.streams = {'stdout': [], 'stderr': []}
+
+    def __call__(self, stream, text):
+        self.streams[stream].append(text)
+        self.output(stream, text)
+
+    def flush(self):
+        flush = getattr(self.output, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def text(self, stream):
+        """ Return the text written to `stream` so far. """
+        return ''.join(self.streams[stream])
+
+
+class StudyCache:
+    """
+    On-disk cache of whole studies, backed by an SQLite database.
+
+    Entries are keyed on the canonical rendered input of the study, see
+    :meth:`key`, and on the version of its drivers, see
+    :meth:`dakota.DakotaBase.study_version`. A study must be deterministic
+    for its entry to be reused: a stochastic method should set its seed.
+
+    When `max_entries` or `max_bytes` is set, the least recently used entries
+    are evicted once the cache grows beyond it, a study larger than
+    `max_bytes` is not kept. The counters :attr:`hits`,
+    :attr:`misses` and :attr:`evictions` count the lookups and evictions done
+    through this instance.
+    """
+
+    def __init__(self, path, max_entries=None, max_bytes=None):
+        """
+        :param path: The file holding the cache, created if it does not exist
+        :type path: str
+        :param max_entries: The maximum number of studies kept, no limit if None
+        :type max_entries: int
+        :param max_bytes: The maximum size of the studies kept, no limit if None
+        :type max_bytes: int
+        """
+        if max_entries is not None and max_entries < 1:
+            raise RuntimeError("The maximum number of cache entries must be a positive number")
+        if max_bytes is not None and max_bytes < 1:
+            raise RuntimeError("The maximum size of the cache must be a positive number")
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS studies (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                record BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                used INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS study_versions ON studies (version);
+            CREATE INDEX IF NOT EXISTS study_lru ON studies (used);
+            """)
+        self._clock, self._size, self._bytes = self._db.execute(
+            "SELECT COALESCE(MAX(used), 0), COUNT(*), COALESCE(SUM(size), 0) FROM studies").fetchone()
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return (f"StudyCache({self.path!r}, entries={self._size}, bytes={self._bytes}, hits={self.hits}, "
+                f"misses={self.misses}, evictions={self.evictions})")
+
+    @staticmethod
+    def key(input_string, version, options=None):
+        """
+        Return the key of a study: a hash of its rendered input, with the driver
+        identifiers replaced by a placeholder and the white space normalized, of
+        the version of its drivers and of the options of the run.
+
+        :param input_string: The input, as rendered by :meth:`dakota.DakotaInput.render`
+        :type input_string: str
+        :param version: The version of the drivers of the study
+        :type version: str
+        :param options: The options of the run changing its results or the files it writes, by name,
+        such as the restart files given to DAKOTA
+        :type options: Mapping[str, object]
+        :rtype: str
+        """
+        text = _ANALYSIS_COMPONENTS.sub("analysis_components = '<driver>'", input_string)
+        lines = (' '.join(line.split()) for line in text.splitlines())
+        canonical = '\n'.join(line for line in lines if line)
+        settings = '\x1f'.join(f'{name}={value!r}' for name, value in sorted((options or {}).items()))
+        return hashlib.sha256(f"{canonical}\x1e{version}\x1e{settings}".encode()).hexdigest()
+
+    def lookup(self, key):
+        """ Return the :class:`StudyRecord` stored under `key`, or None. """
+        with self._lock:
+            row = self._db.execute("SELECT record FROM studies WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._clock += 1
+            self._db.execute("UPDATE studies SET used = ? WHERE key = ?", (self._clock, key))
+            self._db.commit()
+            return pickle.loads(row[0])
+
+    def store(self, key, version, record):
+        """ Store the :class:`StudyRecord` of a study under `key`, replacing any previous one. """
+        blob = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remove("key = ?", (key,))
+            self._clock += 1
+            self._db.execute(
+                "INSERT INTO studies (key, version, record, size, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, version, blob, len(blob), time.time(), self._clock))
+            self._size += 1
+            self._bytes += len(blob)
+            self._evict()
+            self._db.commit()
+
+    def invalidate(self, key=None, version=None):
+        """
+        Remove the study stored under `key`, or all the studies of the drivers
+        at `version`, and return the number of studies removed.
+
+        :rtype: int
+        """
+        if (key is None) == (version is None):
+            raise RuntimeError("Exactly one of the key and the version is required")
+        with self._lock:
+            removed = self._remove("key = ?" if version is None else "version = ?",
+                                   (key if version is None else version,))
+            self._db.commit()
+            return removed
+
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._db.execute("DELETE FROM studies")
+            self._db.commit()
+            self._size = 0
+            self._bytes = 0
+
+    def close(self):
+        """ Close the underlying database. """
+        with self._lock:
+            self._db.close()
+
+    def _remove(self, condition, parameters):
+        count, size = self._db.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM studies WHERE {condition}", parameters).fetchone()
+        self._db.execute(f"DELETE FROM studies WHERE {condition}", parameters)
+        self._size -= count
+        self._bytes -= size
+        return count
+
+    def _evict(self):
+        while self._size > 0 and ((self.max_entries is not None and self._size > self.max_entries) or
+                                  (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            ident = self._db.execute("SELECT key FROM studies ORDER BY used LIMIT 1").fetchone()[0]
+            self._remove("key = ?", (ident,))
+            self.evictions += 1
+
+
+def tabular_files(input_string):
+    """ Return the paths of the tabular data files written by the study of `input_string`. """
+    if not any(_TABULAR.match(line) for line in input_string.splitlines()):
+        return []
+    match = _TABULAR_FILE.search(input_string)
+    return [match.group(1) if match else 'dakota_tabular.dat']
+
+
+def file_digest(path):
+    """ Return the SHA-256 hash of the content of the file `path`, or None if it does not exist. """
+    if path is None or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as content:
+        for block in iter(lambda: content.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
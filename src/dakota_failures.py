@@ -0,0 +1,220 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Handling of failed evaluations.
+
+A driver raising :class:`EvaluationFailure` reports a failed simulation to
+DAKOTA, which handles it as set by the ``failure_capture`` keyword of the
+interface rather than aborting the run. A driver given a
+:class:`FailurePolicy` gets a wall-clock timeout and retries for each
+evaluation, and the ``failure_capture`` of the policy for the evaluations
+that still fail:
+
+    driver = MyDriver(failure_policy=FailurePolicy(timeout=600, retries=2, mode='recover',
+                                                   recover=[1e10]))
+    results = driver.run_dakota(infile=None)
+    print(results.failures)
+"""
+
+import logging
+import os
+import threading
+
+# Counters of a policy, see FailurePolicy.counters
+COUNTERS = ('errors', 'timeouts', 'retried', 'failures')
+
+_MODES = ('abort', 'recover', 'continuation')
+
+
+class EvaluationFailure(RuntimeError):
+    """
+    An evaluation failed: DAKOTA applies the ``failure_capture`` of the
+    interface, which aborts the run by default.
+    """
+
+
+class EvaluationTimeout(TimeoutError):
+    """ An evaluation did not complete within the timeout of its policy. """
+
+
+class FailurePolicy:
+    """
+    Timeout and retries of the evaluations of a driver, and how DAKOTA handles
+    the evaluations failing every attempt:
+
+    * 'abort' re-raises the error of the last attempt, which ends the run,
+    * 'recover' has DAKOTA use the `recover` function values instead,
+    * 'continuation' has DAKOTA step towards the failed point from the last
+      successful one, for the methods supporting it.
+
+    The call of an evaluation that timed out is abandoned: it keeps running in
+    its thread until it returns, a driver running external simulations should
+    stop them itself.
+
+    With the default :meth:`dakota.DakotaBase.dakota_batch_callback`, each point
+    of a batch gets its own timeout and retries, in the worker running it when
+    the driver has an executor. A driver overriding it has the whole batch
+    timed and retried.
+    """
+
+    def __init__(self, timeout=None, retries=0, mode='abort', recover=None):
+        """
+        :param timeout: The wall-clock time allowed to each attempt, in seconds, no limit if None
+        :type timeout: float
+        :param retries: The number of attempts after the first failed one
+        :type retries: int
+        :param mode: 'abort', 'recover' or 'continuation'
+        :type mode: str
+        :param recover: The function values of the failed evaluations, for the 'recover' mode
+        :type recover: Sequence[float]
+        """
+        if mode not in _MODES:
+            raise RuntimeError(f"Unknown failure mode '{mode}'")
+        if (mode == 'recover') != (recover is not None):
+            raise RuntimeError("Recover values are required by, and only allowed for, the 'recover' mode")
+        if retries < 0:
+            raise RuntimeError("The number of retries must not be negative")
+
+        self.timeout = timeout
+        self.retries = retries
+        self.mode = mode
+        self.recover = None if recover is None else [float(value) for value in recover]
+        self.reset()
+
+    def __repr__(self):
+        counters = ', '.join(f'{name}={value}' for name, value in self.counters().items())
+        return f"FailurePolicy(timeout={self.timeout}, retries={self.retries}, mode={self.mode!r}, {counters})"
+
+    def __getstate__(self):
+        # Sent to worker processes without the counters of the parent
+        state = self.__dict__.copy()
+        state.update(dict.fromkeys(COUNTERS, 0))
+        return state
+
+    def reset(self):
+        """ Set the counters to zero. """
+        for name in COUNTERS:
+            setattr(self, name, 0)
+
+    def counters(self):
+        """
+        Return the counters: the attempts that raised and that timed out, the
+        retries and the evaluations that failed every attempt.
+
+        :rtype: dict[str, int]
+        """
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def failure_capture(self):
+        """ Return the ``failure_capture`` line of the interface section, None for the default. """
+        if self.mode == 'recover':
+            return 'failure_capture recover = ' + ' '.join(repr(value) for value in self.recover)
+        if self.mode == 'continuation':
+            return 'failure_capture continuation'
+        return None
+
+    def call(self, fn, kwargs):
+        """
+        Return ``fn(**kwargs)`` with the timeout and retries of the policy, counted
+        by the policy. Raise :class:`EvaluationFailure` if every attempt failed.
+        """
+        response, counts = self.run(fn, kwargs)
+        self.add(counts)
+        if response is None:
+            raise EvaluationFailure(f"evaluation {kwargs['currEvalId']} failed")
+        return response
+
+    def run(self, fn, kwargs):
+        """
+        Return ``fn(**kwargs)``, None if every attempt failed, and the counts of
+        the attempts, which may be made in another process and are added to
+        the counters of the policy by :meth:`add`.
+
+        :rtype: tuple[dict, dict[str, int]]
+        """
+        counts = dict.fromkeys(COUNTERS, 0)
+        for attempt in range(self.retries + 1):
+            try:
+                return self._call(fn, kwargs), counts
+            except Exception as exc:
+                error = self._failed(exc, kwargs, attempt, counts)
+        return self._give_up(error, counts)
+
+    async def run_async(self, fn, kwargs):
+        """ :meth:`run` for a coroutine function `fn`, awaited with the timeout of the policy. """
+        import asyncio
+
+        counts = dict.fromkeys(COUNTERS, 0)
+        for attempt in range(self.retries + 1):
+            try:
+                try:
+                    return await asyncio.wait_for(fn(**kwargs), self.timeout), counts
+                except asyncio.TimeoutError:
+                    raise EvaluationTimeout(f"evaluation {kwargs['currEvalId']} timed out "
+                                            f"after {self.timeout} s") from None
+            except Exception as exc:
+                error = self._failed(exc, kwargs, attempt, counts)
+        return self._give_up(error, counts)
+
+    def add(self, counts):
+        """ Add the counts returned by :meth:`run` to the counters. """
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + counts[name])
+
+    def collect(self, outcomes):
+        """ Add the counts of the (response, counts) pairs returned by :meth:`run` and return the responses. """
+        responses = []
+        for response, counts in outcomes:
+            self.add(counts)
+            responses.append(response)
+        return responses
+
+    def _call(self, fn, kwargs):
+        if self.timeout is None:
+            return fn(**kwargs)
+
+        outcome = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome['response'] = fn(**kwargs)
+            except BaseException as exc:
+                outcome['error'] = exc
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name=f"dakota-evaluation-{kwargs['currEvalId']}", daemon=True).start()
+        if not done.wait(self.timeout):
+            raise EvaluationTimeout(f"evaluation {kwargs['currEvalId']} timed out after {self.timeout} s")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['response']
+
+    def _failed(self, exc, kwargs, attempt, counts):
+        counts['timeouts' if isinstance(exc, EvaluationTimeout) else 'errors'] += 1
+        retry = attempt < self.retries
+        if retry:
+            counts['retried'] += 1
+        logging.warning(f"dakota ({os.getpid()}): evaluation {kwargs['currEvalId']} failed"
+                        f"{', retrying' if retry else ''}: {exc!r}")
+        return exc
+
+    def _give_up(self, error, counts):
+        counts['failures'] += 1
+        if self.mode == 'abort':
+            raise error
+        return None, counts
@@ -0,0 +1,201 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Finite difference gradients computed on the Python side.
+
+With ``numerical_gradients``, DAKOTA evaluates the perturbed points of a
+finite difference stencil one callback at a time. A driver given a
+:class:`FiniteDifferences` instead declares ``analytic_gradients`` in its
+responses: when DAKOTA asks for gradients, the stencils of all points of the
+callback are handed to :meth:`dakota.DakotaBase.dakota_stencil` as a single
+batch, and function values known from earlier evaluations at the same point
+are reused rather than evaluated again.
+"""
+
+from collections import OrderedDict
+
+import numpy
+
+from dakota_failures import EvaluationFailure
+
+# Entries of the callback arguments holding one row per evaluation in a batch
+_ROW_KEYS = ('cv', 'div', 'drv', 'av', 'asv', 'dvv')
+
+
+class FiniteDifferences:
+    """
+    Forward or central finite difference gradients of the function values.
+
+    The step of a variable is `step`, times the magnitude of the variable if
+    `relative` and it is larger than one. Steps do not account for bounds.
+    The function values of the last `memory` evaluated points are remembered,
+    with the functions they hold, to serve as the center of later stencils
+    needing no other function.
+
+    The counters :attr:`stencil_points` and :attr:`reused_centers` count the
+    points evaluated for stencils and the centers that did not need one.
+    """
+
+    def __init__(self, step=1e-6, method='forward', relative=True, memory=64):
+        """
+        :param step: The finite difference step
+        :type step: float
+        :param method: 'forward' (n + 1 points) or 'central' (2 n points, and the center
+        only if its function values are requested)
+        :type method: str
+        :param relative: Scale the step with the magnitude of the variables
+        :type relative: bool
+        :param memory: The number of function values remembered, by point
+        :type memory: int
+        """
+        if step <= 0:
+            raise RuntimeError("The finite difference step must be a positive number")
+        if method not in ('forward', 'central'):
+            raise RuntimeError(f"Unknown finite difference method '{method}'")
+
+        self.step = step
+        self.method = method
+        self.relative = relative
+        self.memory = memory
+        self.stencil_points = 0
+        self.reused_centers = 0
+        self._values = OrderedDict()
+
+    def __repr__(self):
+        return (f"FiniteDifferences(step={self.step}, method={self.method!r}, "
+                f"stencil_points={self.stencil_points}, reused_centers={self.reused_centers})")
+
+    def evaluate_batch(self, kwargs, evaluate):
+        """
+        Return the stacked responses of the batch described by the callback
+        arguments `kwargs`, computing the requested gradients by finite differences.
+
+        :param kwargs: The callback arguments, stacked as for :meth:`dakota.dakota_batch_callback`
+        :param evaluate: Called once with the stacked callback arguments of all points to
+        evaluate, returns their stacked responses
+        """
+        nrows = len(kwargs['currEvalId'])
+        nfns = kwargs['functions']
+        asv = numpy.asarray(kwargs['asv']).reshape(nrows, nfns)
+        ncv = numpy.shape(kwargs['cv'])[-1]
+
+        # Gather the rows to evaluate: plain evaluations, unknown centers and stencils
+        rows, plans = [], []
+        for row in range(nrows):
+            x = numpy.asarray(kwargs['av'])[row]
+            cv = numpy.asarray(kwargs['cv'])[row]
+            center, center_row = None, None
+            # Central differences only need the center for its function values
+            needed = asv[row] & (3 if self.method == 'forward' else 1) != 0
+            if needed.any():
+                center = self._recall(x, needed)
+                if center is not None:
+                    self.reused_centers += 1
+                else:
+                    center_row = len(rows)
+                    rows.append((row, None, 0.0))
+
+            stencil = []
+            if (asv[row] & 2).any():
+                for index in _derivative_columns(kwargs, row, ncv):
+                    h = self.step * max(abs(cv[index]), 1.0) if self.relative else self.step
+                    offsets = (h,) if self.method == 'forward' else (h, -h)
+                    stencil.append((index, h, [len(rows) + k for k in range(len(offsets))]))
+                    rows.extend((row, index, offset) for offset in offsets)
+            plans.append((center, center_row, stencil))
+
+        values = numpy.zeros((len(rows), nfns))
+        if rows:
+            response = evaluate(self._stencil_kwargs(kwargs, rows, asv))
+            if numpy.any(response.get('failed', False)):
+                raise EvaluationFailure(f"finite differences of evaluations {list(kwargs['currEvalId'])} failed")
+            values = numpy.asarray(response['fns'], dtype=float).reshape(len(rows), nfns)
+            self.stencil_points += sum(1 for _, index, _ in rows if index is not None)
+
+        nder = numpy.shape(kwargs['dvv'])[-1]
+        fns = numpy.zeros((nrows, nfns))
+        grads = numpy.zeros((nrows, nfns, nder)) if (asv & 2).any() else None
+        if (asv & 4).any():
+            raise RuntimeError("Finite differences do not provide Hessians")
+
+        for row, (center, center_row, stencil) in enumerate(plans):
+            if center_row is not None:
+                center = values[center_row]
+                self._remember(numpy.asarray(kwargs['av'])[row], center, asv[row] & 3 != 0)
+            if center is not None:
+                fns[row] = center
+            for column, (index, h, stencil_rows) in enumerate(stencil):
+                if self.method == 'forward':
+                    grads[row, :, column] = (values[stencil_rows[0]] - center) / h
+                else:
+                    grads[row, :, column] = (values[stencil_rows[0]] - values[stencil_rows[1]]) / (2 * h)
+
+        response = dict(fns=fns)
+        if grads is not None:
+            response['fnGrads'] = grads
+        return response
+
+    def _stencil_kwargs(self, kwargs, rows, asv):
+        """ Return the stacked callback arguments of the points to evaluate. """
+        stencil = dict(kwargs)
+        for key in _ROW_KEYS:
+            stencil[key] = numpy.array([numpy.asarray(kwargs[key])[row] for row, _, _ in rows])
+        for position, (row, index, offset) in enumerate(rows):
+            if index is not None:
+                stencil['cv'][position, index] += offset
+                stencil['av'][position, index] += offset
+            # Function values only, for the functions with a value or gradient requested
+            stencil['asv'][position] = numpy.where(asv[row] & 3, 1, 0)
+        stencil['dvv'] = stencil['dvv'][:, :0]
+        stencil['currEvalId'] = [kwargs['currEvalId'][row] for row, _, _ in rows]
+        return stencil
+
+    def _recall(self, x, needed):
+        """ Return the function values remembered at `x` if they hold the `needed` functions, None otherwise. """
+        key = numpy.ascontiguousarray(x, dtype=float).tobytes()
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, computed = entry
+        if not computed[needed].all():
+            return None
+        self._values.move_to_end(key)
+        return value
+
+    def _remember(self, x, value, computed):
+        """ Remember the function values at `x`, of which only the `computed` functions were evaluated. """
+        if self.memory < 1:
+            return
+        key = numpy.ascontiguousarray(x, dtype=float).tobytes()
+        value, computed = numpy.array(value), numpy.array(computed)
+        if key in self._values:
+            # Keep the functions evaluated before and not this time
+            known, known_computed = self._values[key]
+            value = numpy.where(computed, value, known)
+            computed = computed | known_computed
+        self._values[key] = (value, computed)
+        self._values.move_to_end(key)
+        while len(self._values) > self.memory:
+            self._values.popitem(last=False)
+
+
+def _derivative_columns(kwargs, row, ncv):
+    """ Return the columns of the continuous variables listed in the derivative variables vector. """
+    dvv = numpy.asarray(kwargs['dvv'])[row]
+    columns = [int(ident) - 1 for ident in dvv]
+    if any(column < 0 or column >= ncv for column in columns):
+        raise RuntimeError("Finite differences are only supported for continuous variables")
+    return columns
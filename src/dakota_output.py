@@ -0,0 +1,154 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Capture of DAKOTA's output in memory.
+
+Given as the `output` of :meth:`dakota.DakotaBase.run_dakota`, an
+:class:`OutputCapture` receives the standard output and error of DAKOTA that
+are not sent to a file. It keeps the last lines in a bounded ring buffer and
+may forward them to a :mod:`logging` logger or a callable, so that verbose
+studies do not write their output to disk:
+
+    output = OutputCapture(maxlen=1000, level=logging.WARNING)
+    driver.run_dakota(infile=None, output=output)
+    print(output.text())
+"""
+
+import logging
+import threading
+from collections import deque
+
+# Line prefixes of DAKOTA's standard output raising the level of the line
+_PREFIX_LEVELS = (('error', logging.ERROR), ('warning', logging.WARNING))
+
+
+class OutputLine:
+    """ A line written by DAKOTA, without its line break. """
+
+    __slots__ = ('stream', 'level', 'text')
+
+    def __init__(self, stream, level, text):
+        self.stream = stream
+        self.level = level
+        self.text = text
+
+    def __repr__(self):
+        return f"OutputLine(stream={self.stream!r}, level={logging.getLevelName(self.level)}, text={self.text!r})"
+
+
+def line_level(stream, text):
+    """
+    Return the :mod:`logging` level of a line written to `stream`: ERROR or
+    WARNING for lines starting with 'Error' or 'Warning', at least WARNING for
+    the standard error and INFO otherwise.
+    """
+    start = text.lstrip()[:7].lower()
+    for prefix, level in _PREFIX_LEVELS:
+        if start.startswith(prefix):
+            return level
+    return logging.WARNING if stream == 'stderr' else logging.INFO
+
+
+class OutputCapture:
+    """
+    Keep the last `maxlen` lines written by DAKOTA, of level `level` or more.
+
+    Lines are also passed to `logger` at their level, and to `callback` as
+    :class:`OutputLine`. The counters :attr:`lines_written` and
+    :attr:`lines_filtered` count all lines and those below `level`.
+    The capture may be read from other threads while DAKOTA writes to it.
+    """
+
+    def __init__(self, maxlen=10000, level=logging.NOTSET, logger=None, callback=None):
+        """
+        :param maxlen: The number of lines kept, all of them if None
+        :type maxlen: int
+        :param level: The lowest level of the lines kept and forwarded
+        :type level: int
+        :param logger: Optional logger receiving the lines
+        :type logger: logging.Logger
+        :param callback: Optional callable receiving each line
+        """
+        self.level = level
+        self.logger = logger
+        self.callback = callback
+        self.lines_written = 0
+        self.lines_filtered = 0
+        self._lines = deque(maxlen=maxlen)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f"OutputCapture(lines={len(self._lines)}, lines_written={self.lines_written}, "
+                f"lines_filtered={self.lines_filtered})")
+
+    def __call__(self, stream, text):
+        """
+        Called by the extension with the text written to `stream`, 'stdout' or
+        'stderr', which may end in the middle of a line.
+        """
+        with self._lock:
+            text = self._pending.pop(stream, '') + text
+            lines = text.split('\n')
+            if lines[-1]:
+                self._pending[stream] = lines[-1]
+        for line in lines[:-1]:
+            self._add(stream, line)
+
+    def flush(self):
+        """ Add the incomplete last lines, called at the end of a run. """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for stream, line in pending.items():
+            self._add(stream, line)
+
+    def lines(self, stream=None):
+        """
+        Return the kept lines, of `stream` only if given.
+
+        :rtype: list[OutputLine]
+        """
+        with self._lock:
+            lines = list(self._lines)
+        return [line for line in lines if stream is None or line.stream == stream]
+
+    def tail(self, n=10, stream=None):
+        """ Return the text of the last `n` kept lines, of `stream` only if given. """
+        return [line.text for line in self.lines(stream)[-n:]] if n > 0 else []
+
+    def text(self, stream=None):
+        """ Return the kept lines, of `stream` only if given, as a single string. """
+        return ''.join(line.text + '\n' for line in self.lines(stream))
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+
+    def _add(self, stream, text):
+        self.lines_written += 1
+        text = text.rstrip('\r')
+        level = line_level(stream, text)
+        if level < self.level:
+            self.lines_filtered += 1
+            return
+
+        line = OutputLine(stream, level, text)
+        with self._lock:
+            self._lines.append(line)
+        if self.logger is not None:
+            self.logger.log(level, '%s', text)
+        if self.callback is not None:
+            self.callback(line)
@@ -0,0 +1,195 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Timing of DAKOTA runs.
+
+:class:`RunProfile` is passed to :meth:`dakota.DakotaBase.run_dakota` and
+records one :class:`EvaluationRecord` per callback: the time spent in the
+driver, the time spent by the ``carolina`` interface converting to and from
+Python objects and the time DAKOTA spent between callbacks.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy
+
+
+class EvaluationRecord:
+    """ Timings of one callback, which covers a single evaluation or a batch. """
+
+    __slots__ = ('eval_ids', 'asv', 'start', 'end', 'pack', 'unpack', 'thread', 'failed')
+
+    def __init__(self, eval_ids, asv, start, end, failed=False):
+        self.eval_ids = eval_ids
+        self.asv = asv
+        self.start = start
+        self.end = end
+        self.pack = 0.0
+        self.unpack = 0.0
+        self.thread = threading.get_ident()
+        # The callback raised, or returned evaluations marked as failed
+        self.failed = failed
+
+    @property
+    def callback(self):
+        """ Wall time spent in the driver, in seconds. """
+        return self.end - self.start
+
+    @property
+    def marshal(self):
+        """ Wall time spent converting arguments and responses, in seconds. """
+        return self.pack + self.unpack
+
+
+class RunProfile:
+    """
+    Collects the timings of the callbacks of a run.
+
+    The optional `hook` is called with every completed :class:`EvaluationRecord`,
+    e.g. to forward the timings to a metrics system. If `trace_file` is set, a
+    Chrome trace (``chrome://tracing``, Perfetto) is written there at the end of
+    the run.
+    """
+
+    def __init__(self, hook=None, trace_file=None):
+        self.hook = hook
+        self.trace_file = trace_file
+        self.records = []
+        self.run_start = None
+        self.run_end = None
+        self._pending = None
+
+    def start(self):
+        """ Mark the start of the run. """
+        self.records = []
+        self._pending = None
+        self.run_start = time.perf_counter()
+        self.run_end = None
+
+    def finish(self):
+        """ Mark the end of the run and write the trace file if requested. """
+        self.run_end = time.perf_counter()
+        if self.trace_file is not None:
+            self.write_trace(self.trace_file)
+
+    def record(self, eval_ids, asv, start, end, failed=False):
+        """
+        Record a callback for the evaluations `eval_ids` that ran from `start` to `end`,
+        whether it succeeded or `failed`.
+        """
+        self._pending = EvaluationRecord(eval_ids, asv, start, end, failed)
+        self.records.append(self._pending)
+
+    def marshalled(self, pack, unpack, failed=False):
+        """
+        Complete the last record with the conversion times measured by the ``carolina``
+        interface, which reports every callback, including those that raised or whose
+        response could not be converted, as `failed`. Callbacks that raised before the
+        driver was called have no record and are ignored.
+        """
+        record, self._pending = self._pending, None
+        if record is None:
+            return
+        record.pack = pack
+        record.unpack = unpack
+        record.failed = record.failed or failed
+        if self.hook is not None:
+            self.hook(record)
+
+    @property
+    def evaluations(self):
+        """ The number of evaluations recorded. """
+        return sum(len(record.eval_ids) for record in self.records)
+
+    def dakota_times(self):
+        """
+        Return the time DAKOTA spent before each callback, excluding the
+        conversion of arguments and responses.
+        """
+        times = []
+        previous_end, previous_unpack = self.run_start, 0.0
+        for record in self.records:
+            times.append(max(record.start - previous_end - previous_unpack - record.pack, 0.0))
+            previous_end, previous_unpack = record.end, record.unpack
+        return numpy.array(times)
+
+    def summary(self):
+        """
+        Return a dictionary with the number of evaluations, callbacks and failed callbacks, the
+        wall time and throughput of the run and, for each of 'callback', 'marshal'
+        and 'dakota', the total and the 50th, 90th and 99th percentile and maximum
+        time per callback in seconds.
+        """
+        end = self.run_end if self.run_end is not None else time.perf_counter()
+        wall = end - self.run_start if self.run_start is not None else 0.0
+        summary = dict(
+            evaluations=self.evaluations,
+            callbacks=len(self.records),
+            failed=sum(record.failed for record in self.records),
+            wall=wall,
+            throughput=self.evaluations / wall if wall > 0 else 0.0,
+        )
+        for name, times in (('callback', numpy.array([record.callback for record in self.records])),
+                            ('marshal', numpy.array([record.marshal for record in self.records])),
+                            ('dakota', self.dakota_times())):
+            if times.size:
+                p50, p90, p99 = numpy.percentile(times, [50, 90, 99])
+                summary[name] = dict(total=float(times.sum()), p50=float(p50), p90=float(p90),
+                                     p99=float(p99), max=float(times.max()))
+            else:
+                summary[name] = dict(total=0.0, p50=0.0, p90=0.0, p99=0.0, max=0.0)
+        return summary
+
+    def format_summary(self):
+        """ Return the summary as human readable text. """
+        summary = self.summary()
+        lines = [f"{summary['evaluations']} evaluations in {summary['callbacks']} callbacks "
+                 f"({summary['failed']} failed), {summary['wall']:.3f} s, "
+                 f"{summary['throughput']:.1f} evaluations/s"]
+        for name in ('callback', 'marshal', 'dakota'):
+            times = summary[name]
+            lines.append(f"  {name:8s} total {times['total']:.6f} s, p50 {times['p50']:.6f} s, "
+                         f"p90 {times['p90']:.6f} s, p99 {times['p99']:.6f} s, max {times['max']:.6f} s")
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """ Return the records as Chrome trace events, timestamps in microseconds from the start of the run. """
+        origin = self.run_start if self.run_start is not None else 0.0
+        pid = os.getpid()
+
+        def event(name, start, duration, tid, **args):
+            return dict(name=name, ph='X', ts=(start - origin) * 1e6, dur=duration * 1e6,
+                        pid=pid, tid=tid, args=args)
+
+        events = []
+        for record in self.records:
+            ids = [int(ident) for ident in record.eval_ids]
+            asv = numpy.asarray(record.asv).tolist()
+            if record.pack:
+                events.append(event('pack', record.start - record.pack, record.pack, record.thread))
+            events.append(event('callback', record.start, record.callback, record.thread, eval_ids=ids, asv=asv,
+                                failed=record.failed))
+            if record.unpack:
+                events.append(event('unpack', record.end, record.unpack, record.thread))
+        return events
+
+    def write_trace(self, path):
+        """ Write the records as a Chrome trace JSON file. """
+        with open(path, 'w') as out:
+            json.dump(dict(traceEvents=self.trace_events(), displayTimeUnit='ms'), out)
@@ -16,16 +16,20 @@
 // ++==++==++==++==++==++==++==++==++==++==
 
 #include <iostream>
+#include <string>
 #include "dakface.hpp"
+#include "carolina_interface.hpp"
 #include <boost/python.hpp>
 namespace bp = boost::python;
 
 #define MAKE_ARGV \
-  char *argv[10]; \
+  char *argv[16]; \
   int argc = 0; \
   argv[argc++] = const_cast<char*>("dakota"); \
-  argv[argc++] = const_cast<char*>("-i"); \
-  argv[argc++] = infile; \
+  if (infile && strlen(infile)) { \
+    argv[argc++] = const_cast<char*>("-i"); \
+    argv[argc++] = infile; \
+  } \
   if (outfile && strlen(outfile)) { \
     argv[argc++] = const_cast<char*>("-o"); \
     argv[argc++] = outfile; \
@@ -35,20 +39,89 @@ namespace bp = boost::python;
     argv[argc++] = errfile; \
   }
 
-int run_dakota(char *infile, char *outfile, char *errfile, bp::object exc, int restart, bool throw_on_error)
+int run_dakota(char *infile, char *outfile, char *errfile, bp::object exc, int restart, bool throw_on_error,
+               bp::object run, char *input_string, char *read_restart, char *write_restart, int stop_restart)
 {
 
   MAKE_ARGV
-  if (restart==1){
+  // An explicit restart file to read takes precedence over the restart flag.
+  if (read_restart && strlen(read_restart)) {
+    argv[argc++] = const_cast<char*>("-r");
+    argv[argc++] = read_restart;
+  }
+  else if (restart==1){
     argv[argc++] = const_cast<char*>("-r"); \
     argv[argc++] = const_cast<char*>("dakota.rst");
   }
+  if (write_restart && strlen(write_restart)) {
+    argv[argc++] = const_cast<char*>("-w");
+    argv[argc++] = write_restart;
+  }
+  // Only the first evaluations of the restart file are replayed.
+  std::string stop = std::to_string(stop_restart);
+  if (stop_restart > 0) {
+    argv[argc++] = const_cast<char*>("-s");
+    argv[argc++] = const_cast<char*>(stop.c_str());
+  }
 
   void *tmp_exc = NULL;
   if (exc)
     tmp_exc = &exc;
 
-  return all_but_actual_main(argc, argv, tmp_exc, throw_on_error);
+  // The run object receives the callbacks of the carolina interface, without
+  // it they go to the module level functions of the dakota module.
+  void *tmp_run = NULL;
+  if (!run.is_none())
+    tmp_run = run.ptr();
+
+  // An input string is parsed by Dakota in place of the input file.
+  if (input_string && !strlen(input_string))
+    input_string = NULL;
+
+  return all_but_actual_main(argc, argv, tmp_exc, throw_on_error, tmp_run, input_string);
+}
+
+// Convert a sequence of floats, or None, to a vector for DakotaSession::update.
+static bool to_vector(bp::object values, RealVector& out)
+{
+  if (values.is_none())
+    return false;
+  int n = (int)bp::len(values);
+  out.sizeUninitialized(n);
+  for (int i = 0; i < n; ++i)
+    out[i] = bp::extract<double>(values[i]);
+  return true;
+}
+
+DakotaSession *make_session(char *infile, char *outfile, char *errfile, bp::object exc, bool throw_on_error,
+                            bp::object run, char *input_string, char *read_restart, char *write_restart)
+{
+  MAKE_ARGV
+  if (read_restart && strlen(read_restart)) {
+    argv[argc++] = const_cast<char*>("-r");
+    argv[argc++] = read_restart;
+  }
+  if (write_restart && strlen(write_restart)) {
+    argv[argc++] = const_cast<char*>("-w");
+    argv[argc++] = write_restart;
+  }
+  if (input_string && !strlen(input_string))
+    input_string = NULL;
+
+  return new DakotaSession(argc, argv, exc ? &exc : NULL, throw_on_error,
+                           run.is_none() ? NULL : run.ptr(), input_string);
+}
+
+int session_execute(DakotaSession& session, bp::object exc)
+{
+  return session.execute(exc ? &exc : NULL);
+}
+
+int session_update(DakotaSession& session, bp::object lower, bp::object upper, bp::object initial)
+{
+  RealVector l, u, x;
+  bool has_l = to_vector(lower, l), has_u = to_vector(upper, u), has_x = to_vector(initial, x);
+  return session.update(has_l ? &l : NULL, has_u ? &u : NULL, has_x ? &x : NULL);
 }
 
 void translator(const int& exc)
@@ -60,6 +133,8 @@ void translator(const int& exc)
 }
 
 
+// Shared with carolina_interface.cpp, which uses the same C-API table.
+#define PY_ARRAY_UNIQUE_SYMBOL CAROLINA_ARRAY_API
 #include <numpy/arrayobject.h>
 using namespace boost::python;
 BOOST_PYTHON_MODULE(carolina)
@@ -68,7 +143,35 @@ BOOST_PYTHON_MODULE(carolina)
 
   register_exception_translator<int>(&translator);
 
-  def("run_dakota", run_dakota, "run dakota");
+  def("run_dakota", run_dakota,
+      (arg("infile"), arg("outfile"), arg("errfile"), arg("exc"),
+       arg("restart")=0, arg("throw_on_error")=false, arg("run")=object(),
+       arg("input_string")=object(), arg("read_restart")=object(), arg("write_restart")=object(),
+       arg("stop_restart")=0),
+      "run dakota");
+
+  class_<DakotaSession, boost::noncopyable>("Session", "a parsed dakota environment", no_init)
+    .def("__init__", make_constructor(&make_session, default_call_policies(),
+         (arg("infile"), arg("outfile"), arg("errfile"), arg("exc"), arg("throw_on_error")=false,
+          arg("run")=object(), arg("input_string")=object(), arg("read_restart")=object(),
+          arg("write_restart")=object())))
+    .def("execute", session_execute, (arg("exc")), "execute the environment")
+    .def("update", session_update, (arg("lower_bounds")=object(), arg("upper_bounds")=object(),
+                                    arg("initial_point")=object()),
+         "set the continuous bounds and initial point")
+    .def("close", &DakotaSession::close, "delete the environment")
+    .add_property("is_open", &DakotaSession::is_open)
+    .add_property("construction_time", &DakotaSession::construction_time);
+
+  def("read_restart", carolina::read_restart,
+      (arg("path"), arg("stop_restart")=0),
+      "read the evaluations of a restart file");
+
+  def("release_memory", release_memory,
+      "clear the evaluation cache and return freed memory to the system, -1 while a run is in progress");
+
+  def("live_interfaces", carolina::live_interfaces,
+      "number of carolina interfaces alive");
 }
 
 
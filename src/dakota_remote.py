@@ -0,0 +1,437 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Evaluation of a study on worker processes connected over sockets.
+
+A :class:`RemoteExecutor` given as the `executor` of a driver listens on a
+TCP or Unix socket. Workers started with :func:`serve`, or from the command
+line on other nodes::
+
+    python -m dakota_remote HOST:PORT --authkey-env DAKOTA_AUTHKEY
+
+connect to it and evaluate the points of the batches handed to
+:meth:`dakota.DakotaBase.dakota_batch_callback`, so that a single study runs
+on many nodes without MPI. Tasks are dispatched in submission order, that is
+by ``currEvalId`` within a batch, to the workers with less than
+`max_in_flight` tasks. Workers send heartbeats: the tasks of a worker that
+disconnects or stays silent longer than `timeout` are dispatched again.
+
+:class:`LocalWorkerPool` is a :class:`RemoteExecutor` whose workers are local
+processes, to run the same protocol on a single machine.
+
+Messages are pickled, so only connect workers to executors you trust: the
+connection is authenticated with `authkey`, which defaults to the
+authentication key of the current process.
+"""
+
+import argparse
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import Client, Listener
+
+
+class WorkerLostError(RuntimeError):
+    """ A task was lost with its worker more often than allowed. """
+
+
+class _Task:
+    """ A submitted call, ordered by submission. """
+
+    __slots__ = ('seq', 'future', 'payload', 'attempts')
+
+    def __init__(self, seq, future, payload):
+        self.seq = seq
+        self.future = future
+        self.payload = payload
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return self.seq < other.seq
+
+
+class _Worker:
+    """ The executor side of a worker connection. """
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.in_flight = {}
+        self.last_seen = time.monotonic()
+        self.send_lock = threading.Lock()
+
+
+class RemoteExecutor(Executor):
+    """
+    Executor dispatching calls to the workers connected to its address.
+
+    Calls wait in the executor until a worker has a free slot, they are not
+    lost if no worker is connected yet, up to :meth:`shutdown`. The counters :attr:`completed` and
+    :attr:`requeued` count the tasks completed and dispatched again after the
+    loss of their worker.
+    """
+
+    def __init__(self, address=None, family=None, authkey=None, max_in_flight=1, heartbeat=1.0,
+                 timeout=10.0, retries=2):
+        """
+        :param address: The address to listen on, a (host, port) pair or the path of a
+        Unix socket, a free local address if None
+        :param family: The address family, 'AF_INET' or 'AF_UNIX', deduced from `address` if None
+        :type family: str
+        :param authkey: The key authenticating the workers, the key of the current process if None
+        :type authkey: bytes
+        :param max_in_flight: The number of tasks dispatched to a worker before it returns one
+        :type max_in_flight: int
+        :param heartbeat: The interval between the heartbeats of the workers, in seconds
+        :type heartbeat: float
+        :param timeout: The time after which a silent worker is considered lost, in seconds
+        :type timeout: float
+        :param retries: The number of times a task lost with its worker is dispatched again
+        :type retries: int
+        """
+        if max_in_flight < 1:
+            raise RuntimeError("max_in_flight must be a positive number")
+
+        self.authkey = bytes(multiprocessing.current_process().authkey if authkey is None else authkey)
+        self.max_in_flight = max_in_flight
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.retries = retries
+        self.completed = 0
+        self.requeued = 0
+
+        self._listener = Listener(address, family, authkey=self.authkey)
+        self._lock = threading.Condition()
+        self._pending = []
+        self._sequence = itertools.count()
+        self._workers = []
+        self._shutdown = False
+        self._closed = False
+        self._accepting = threading.Thread(target=self._accept, name='dakota-remote-accept', daemon=True)
+        self._accepting.start()
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(address={self.address!r}, workers={self.workers}, "
+                f"completed={self.completed}, requeued={self.requeued})")
+
+    @property
+    def address(self):
+        """ The address the workers connect to. """
+        return self._listener.address
+
+    @property
+    def workers(self):
+        """ The number of connected workers. """
+        with self._lock:
+            return len(self._workers)
+
+    def wait_for_workers(self, count, timeout=None):
+        """
+        Wait until at least `count` workers are connected, return whether they are.
+
+        :param timeout: The maximum time to wait in seconds, no limit if None
+        :type timeout: float
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self._workers) >= count, timeout)
+
+    def submit(self, fn, /, *args, **kwargs):
+        payload = pickle.dumps((fn, args, kwargs), pickle.HIGHEST_PROTOCOL)
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            heapq.heappush(self._pending, _Task(next(self._sequence), future, payload))
+        self._dispatch()
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """
+        Stop the executor and its workers. If `wait`, first wait for the submitted
+        calls to complete: once no worker is connected for `timeout` seconds, the
+        calls still pending fail with :class:`WorkerLostError` instead.
+        """
+        abandoned = []
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for task in self._pending:
+                    task.future.cancel()
+                self._pending = []
+            deadline = None
+            while wait and (self._pending or any(worker.in_flight for worker in self._workers)):
+                if self._workers:
+                    deadline = None
+                    self._lock.wait()
+                    continue
+                # Nothing is in flight without workers, give one the time to connect
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    abandoned, self._pending = self._pending, []
+                    break
+                self._lock.wait(remaining)
+            workers, self._closed = list(self._workers), True
+
+        for task in sorted(abandoned):
+            if task.attempts or task.future.set_running_or_notify_cancel():
+                task.future.set_exception(WorkerLostError(
+                    f"no worker connected for {self.timeout} s to evaluate the task at shutdown"))
+
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.connection.send(('stop',))
+            except OSError:
+                pass
+        self._close_listener()
+
+    def _close_listener(self):
+        # Wake up the accepting thread with a connection of our own
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._accepting.join()
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as exc:
+                if self._closed:
+                    return
+                logging.warning(f'dakota_remote: rejected a worker connection: {exc!r}')
+                continue
+            if self._closed:
+                connection.close()
+                return
+            try:
+                _, name = connection.recv()
+            except (OSError, EOFError):
+                # The connection closing the listener, or a worker that went away
+                connection.close()
+                continue
+
+            worker = _Worker(connection, name)
+            with self._lock:
+                self._workers.append(worker)
+                self._lock.notify_all()
+            threading.Thread(target=self._receive, args=(worker,), name=f'dakota-remote-{name}',
+                             daemon=True).start()
+            self._dispatch()
+
+    def _dispatch(self):
+        """ Hand the pending tasks to the workers with free slots, in submission order. """
+        assignments = []
+        with self._lock:
+            for worker in self._workers:
+                while self._pending and len(worker.in_flight) < self.max_in_flight:
+                    task = heapq.heappop(self._pending)
+                    if task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                        continue
+                    task.attempts += 1
+                    worker.in_flight[task.seq] = task
+                    assignments.append((worker, task))
+
+        for worker, task in assignments:
+            try:
+                with worker.send_lock:
+                    worker.connection.send(('task', task.seq, task.payload))
+            except OSError:
+                # The receiving thread of the worker notices the loss and requeues the task
+                pass
+
+    def _receive(self, worker):
+        lost = None
+        try:
+            while True:
+                if not worker.connection.poll(self.heartbeat):
+                    if time.monotonic() - worker.last_seen > self.timeout:
+                        raise WorkerLostError(f"no heartbeat from worker {worker.name} for {self.timeout} s")
+                    continue
+                message = worker.connection.recv()
+                worker.last_seen = time.monotonic()
+                if message[0] == 'result':
+                    _, seq, ok, value = message
+                    with self._lock:
+                        task = worker.in_flight.pop(seq)
+                        self.completed += 1
+                        self._lock.notify_all()
+                    if ok:
+                        task.future.set_result(value)
+                    else:
+                        task.future.set_exception(value)
+                    self._dispatch()
+        except (OSError, EOFError, WorkerLostError) as exc:
+            lost = exc
+        finally:
+            worker.connection.close()
+            self._lose(worker, lost)
+
+    def _lose(self, worker, error):
+        """ Remove a worker and dispatch its tasks again, or fail them. """
+        failed = []
+        with self._lock:
+            self._workers.remove(worker)
+            for task in worker.in_flight.values():
+                if task.attempts > self.retries:
+                    failed.append(task)
+                else:
+                    heapq.heappush(self._pending, task)
+                    self.requeued += 1
+            worker.in_flight = {}
+            self._lock.notify_all()
+            closed = self._closed
+
+        if not closed:
+            logging.warning(f'dakota_remote: lost worker {worker.name}: {error!r}')
+        for task in failed:
+            task.future.set_exception(WorkerLostError(
+                f"task lost with its worker {task.attempts} times, last {worker.name}: {error!r}"))
+        self._dispatch()
+
+
+class LocalWorkerPool(RemoteExecutor):
+    """
+    A :class:`RemoteExecutor` with `processes` local worker processes, started
+    when it is created and stopped on shutdown.
+    """
+
+    def __init__(self, processes=None, mp_context=None, **kwargs):
+        """
+        :param processes: The number of worker processes, defaults to the number of CPUs
+        :type processes: int
+        :param mp_context: The multiprocessing context used to start the workers
+        :param kwargs: Additional arguments passed to :class:`RemoteExecutor`
+        """
+        if 'family' not in kwargs and 'address' not in kwargs:
+            kwargs['family'] = 'AF_UNIX' if hasattr(socket, 'AF_UNIX') else 'AF_INET'
+        super().__init__(**kwargs)
+
+        context = mp_context or multiprocessing.get_context()
+        self.processes = [context.Process(target=serve, args=(self.address,),
+                                          kwargs=dict(authkey=self.authkey, heartbeat=self.heartbeat),
+                                          name=f'dakota-worker-{index}', daemon=True)
+                          for index in range(processes or os.cpu_count() or 1)]
+        for process in self.processes:
+            process.start()
+        self.wait_for_workers(len(self.processes))
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        super().shutdown(wait, cancel_futures=cancel_futures)
+        for process in self.processes:
+            process.join(self.timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def serve(address, authkey=None, heartbeat=1.0, family=None):
+    """
+    Run a worker: connect to the executor at `address` and evaluate its tasks
+    one at a time until it stops or disconnects.
+
+    :param address: The address of the :class:`RemoteExecutor`
+    :param authkey: The key of the executor, the key of the current process if None
+    :type authkey: bytes
+    :param heartbeat: The interval between heartbeats, in seconds
+    :type heartbeat: float
+    :param family: The address family, deduced from `address` if None
+    :return: The number of tasks evaluated
+    :rtype: int
+    """
+    if authkey is None:
+        authkey = multiprocessing.current_process().authkey
+    connection = Client(address, family, authkey=bytes(authkey))
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    def beat():
+        while not stopped.wait(heartbeat):
+            try:
+                send(('heartbeat',))
+            except OSError:
+                return
+
+    send(('hello', f'{socket.gethostname()}:{os.getpid()}'))
+    threading.Thread(target=beat, name='dakota-remote-heartbeat', daemon=True).start()
+    evaluated = 0
+    try:
+        while True:
+            try:
+                message = connection.recv()
+            except (OSError, EOFError):
+                break
+            if message[0] == 'stop':
+                break
+
+            _, seq, payload = message
+            try:
+                fn, args, kwargs = pickle.loads(payload)
+                result = (seq, True, fn(*args, **kwargs))
+            except Exception as exc:
+                result = (seq, False, exc)
+            evaluated += 1
+            try:
+                send(('result',) + result)
+            except (pickle.PicklingError, TypeError, AttributeError) as exc:
+                # Results and exceptions must get through pickling
+                send(('result', seq, False, RuntimeError(f"cannot send the result: {exc!r}")))
+    finally:
+        stopped.set()
+        connection.close()
+    return evaluated
+
+
+def _parse_address(text):
+    """ Return a (host, port) pair for 'HOST:PORT', the path of a Unix socket otherwise. """
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate the tasks of a dakota_remote.RemoteExecutor.')
+    parser.add_argument('address', help='HOST:PORT or the path of a Unix socket')
+    parser.add_argument('--authkey-env', default='DAKOTA_AUTHKEY',
+                        help='environment variable holding the authentication key')
+    parser.add_argument('--heartbeat', type=float, default=1.0, help='seconds between heartbeats')
+    args = parser.parse_args(argv)
+
+    authkey = os.environ.get(args.authkey_env)
+    if authkey is None:
+        parser.error(f"the authentication key must be set in ${args.authkey_env}")
+    serve(_parse_address(args.address), authkey.encode(), args.heartbeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Runs of a long-lived process, with explicit teardown and resource accounting.
+
+A process running thousands of studies runs them through a
+:class:`DakotaService`, which tears down each run explicitly and reports
+the memory and handles of the process after it, so that leaks show up as
+growth between reports rather than as a slowly failing worker:
+
+    service = DakotaService()
+    for request in requests:
+        results = service.run(make_driver(request), infile=None, write_restart=False)
+        if service.report.rss_growth > 2**30:
+            recycle_worker()
+"""
+
+import collections
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+
+import dakota
+
+
+class ResourceReport:
+    """ Memory and handles of the process after a run of a :class:`DakotaService`. """
+
+    __slots__ = ('run', 'duration', 'rss', 'rss_growth', 'open_files', 'threads', 'drivers', 'interfaces',
+                 'gc_objects', 'collected', 'released')
+
+    def __init__(self, run, duration, rss, rss_growth, open_files, threads, drivers, interfaces, gc_objects,
+                 collected, released):
+        self.run = run
+        self.duration = duration
+        # Resident set size in bytes, and its growth since the first report of the service
+        self.rss = rss
+        self.rss_growth = rss_growth
+        # Open file descriptors, None where the platform does not list them
+        self.open_files = open_files
+        self.threads = threads
+        # Drivers still registered by the dakota module and carolina interfaces alive
+        self.drivers = drivers
+        self.interfaces = interfaces
+        self.gc_objects = gc_objects
+        # Objects freed by the garbage collector and evaluations cleared from DAKOTA's cache by the teardown
+        self.collected = collected
+        self.released = released
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f"ResourceReport({fields})"
+
+
+class DakotaService:
+    """
+    Run drivers one after the other in a long-lived process. After each run,
+    successful or not, :meth:`teardown` releases what the run left behind and
+    a :class:`ResourceReport` is logged and kept in :attr:`reports`, the last
+    one being :attr:`report`.
+    """
+
+    def __init__(self, history=100):
+        """
+        :param history: The number of reports kept
+        :type history: int
+        """
+        self.runs = 0
+        self.reports = collections.deque(maxlen=history)
+        self.baseline = None
+
+    def __repr__(self):
+        return f"DakotaService(runs={self.runs}, report={self.report})"
+
+    @property
+    def report(self):
+        """ The report of the last run, None before the first one. """
+        return self.reports[-1] if self.reports else None
+
+    def run(self, driver, **kwargs):
+        """
+        Run `driver`, then tear the run down and report the resources of the process.
+
+        :param driver: The driver to run
+        :type driver: dakota.DakotaBase
+        :param kwargs: Arguments passed to :meth:`dakota.DakotaBase.run_dakota`
+        :rtype: dakota.DakotaResults
+        """
+        start = time.perf_counter()
+        try:
+            return driver.run_dakota(**kwargs)
+        finally:
+            collected, released = self.teardown(driver)
+            self.runs += 1
+            rss = resident_set_size()
+            if self.baseline is None:
+                self.baseline = rss
+            report = ResourceReport(
+                self.runs, time.perf_counter() - start, rss, rss - self.baseline, open_files(),
+                threading.active_count(), dakota.registered_drivers(), _live_interfaces(), len(gc.get_objects()),
+                collected, released)
+            self.reports.append(report)
+            logging.info(f'dakota ({os.getpid()}): {report}')
+
+    @staticmethod
+    def teardown(driver=None):
+        """
+        Unregister `driver` and the drivers of its named interfaces from the
+        dakota module, collect the garbage of the
+        run and, if the extension is loaded, clear DAKOTA's evaluation cache and
+        return the freed memory to the system.
+
+        :return: The number of objects collected and of evaluations cleared,
+        the latter -1 if another thread was running DAKOTA
+        :rtype: tuple[int, int]
+        """
+        if driver is not None:
+            dakota.unregister_driver(driver)
+        collected = gc.collect()
+
+        released = 0
+        carolina = sys.modules.get('carolina')
+        if carolina is not None:
+            released = carolina.release_memory()
+        return collected, released
+
+
+def resident_set_size():
+    """ Return the resident set size of the process in bytes, its peak where the current one is unknown. """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def open_files():
+    """ Return the number of open file descriptors of the process, None if unknown. """
+    for directory in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(directory))
+        except OSError:
+            continue
+    return None
+
+
+def _live_interfaces():
+    carolina = sys.modules.get('carolina')
+    return 0 if carolina is None else carolina.live_interfaces()
@@ -0,0 +1,234 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Append-only storage of the evaluations of a run.
+
+Given as the `store` of :meth:`dakota.DakotaBase.run_dakota`, an
+:class:`EvaluationStore` writes every completed evaluation to ``.npy``
+columns in a directory as soon as the driver returned it. Together with a
+deactivated or limited evaluation cache, the memory used by a large study
+then depends on its concurrency rather than on its number of evaluations:
+
+    driver.run_dakota(infile=None, evaluation_cache=False, store='samples')
+    evaluations = load_store('samples')
+    print(evaluations.column('x1').mean())
+
+:func:`load_store` maps the columns in memory rather than reading them, also
+while the run is going on, up to the last flush.
+"""
+
+import json
+import os
+import struct
+
+import numpy
+
+# Size of the .npy headers, large enough for any shape and rewritten in place
+_HEADER_SIZE = 128
+
+_LABELS = 'labels.json'
+
+# Column name, dtype and whether it holds one value per row
+_COLUMNS = (
+    ('eval_ids', numpy.intc, True),
+    ('variables', numpy.float64, False),
+    ('responses', numpy.float64, False),
+    ('asv', numpy.short, False),
+)
+
+
+def _header(dtype, shape):
+    """ Return a version 1.0 .npy header of `_HEADER_SIZE` bytes. """
+    text = repr(dict(descr=numpy.lib.format.dtype_to_descr(dtype), fortran_order=False, shape=shape))
+    text = text.ljust(_HEADER_SIZE - 11) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(text)) + text.encode('latin1')
+
+
+class _Column:
+    """ A .npy file rows are appended to, its header giving the rows written at the last flush. """
+
+    def __init__(self, path, dtype, width):
+        self.dtype = numpy.dtype(dtype)
+        self.width = width
+        self.rows = 0
+        self.file = open(path, 'w+b')
+        self.flush()
+
+    def append(self, values):
+        values = numpy.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.rows += len(values)
+
+    def flush(self):
+        self.file.seek(0)
+        self.file.write(_header(self.dtype, (self.rows,) if self.width is None else (self.rows, self.width)))
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class EvaluationStore:
+    """
+    Write the evaluations of a run to ``eval_ids.npy``, ``variables.npy``,
+    ``responses.npy`` and ``asv.npy`` in `directory`, one row per evaluation in
+    completion order, with the labels in ``labels.json``, written with the
+    first rows. Only the function values are stored, NaN where they were not
+    requested or the evaluation failed. All rows must have the numbers of
+    variables and functions of the first ones: interfaces of a run returning
+    other numbers of functions need a store of their own.
+
+    The store is a listener of :meth:`dakota.run_dakota`, so like any
+    listener it disables the fast path of :meth:`dakota.DakotaBase.dakota_bind`.
+    Rows are written through as they arrive, the headers giving the number of
+    rows are updated every `flush_every` rows and by :meth:`flush` and
+    :meth:`close`.
+    """
+
+    def __init__(self, directory, flush_every=10000):
+        """
+        :param directory: The directory holding the columns, created if needed. Existing columns
+        are replaced.
+        :type directory: str
+        :param flush_every: The number of rows between updates of the headers
+        :type flush_every: int
+        """
+        self.directory = os.fspath(directory)
+        self.flush_every = flush_every
+        self.variable_labels = []
+        self.response_labels = []
+        self._columns = None
+        self._unflushed = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return f"EvaluationStore(directory={self.directory!r}, evaluations={len(self)})"
+
+    def __len__(self):
+        return 0 if self._columns is None else self._columns['eval_ids'].rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __call__(self, kwargs, response, start, end, batch):
+        """ Append the evaluations of a callback, with the arguments of a listener of :meth:`dakota.run_dakota`. """
+        eval_ids = numpy.atleast_1d(kwargs['currEvalId'])
+        nrows, nfns = len(eval_ids), kwargs['functions']
+        variables = numpy.asarray(kwargs['av'], dtype=float).reshape(nrows, -1)
+        asv = numpy.asarray(kwargs['asv']).reshape(nrows, nfns)
+        fns = response.get('fns')
+        if fns is None:
+            fns = numpy.full((nrows, nfns), numpy.nan)
+        else:
+            fns = numpy.where(asv & 1, numpy.asarray(fns, dtype=float).reshape(nrows, nfns), numpy.nan)
+        if 'failed' in response:
+            fns[numpy.asarray(response['failed'], dtype=bool).reshape(nrows)] = numpy.nan
+
+        if self._columns is None:
+            self.variable_labels = list(kwargs['av_labels'])
+            self.response_labels = list(kwargs.get('fn_labels', self.response_labels))
+            widths = dict(variables=variables.shape[1], responses=nfns, asv=nfns)
+            self._columns = {name: _Column(os.path.join(self.directory, f'{name}.npy'), dtype,
+                                           None if single else widths[name])
+                             for name, dtype, single in _COLUMNS}
+            self._write_labels()
+        elif (variables.shape[1], nfns) != (self._columns['variables'].width, self._columns['responses'].width):
+            raise RuntimeError(f"Evaluations with {variables.shape[1]} variables and {nfns} functions can not be "
+                               f"stored with evaluations of {self._columns['variables'].width} variables and "
+                               f"{self._columns['responses'].width} functions")
+
+        for name, values in zip(('eval_ids', 'variables', 'responses', 'asv'), (eval_ids, variables, fns, asv)):
+            self._columns[name].append(values)
+        self._unflushed += nrows
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """ Update the headers and the labels, so that readers see all rows written so far. """
+        if self._columns is not None:
+            for column in self._columns.values():
+                column.flush()
+        self._unflushed = 0
+        self._write_labels()
+
+    def _write_labels(self):
+        with open(os.path.join(self.directory, _LABELS), 'w') as out:
+            json.dump(dict(variables=self.variable_labels, responses=self.response_labels), out)
+
+    def close(self):
+        """ Flush the store and close its files. """
+        self.flush()
+        if self._columns is not None:
+            for column in self._columns.values():
+                column.close()
+            self._columns = None
+
+
+class StoredEvaluations:
+    """
+    The evaluations of an :class:`EvaluationStore`, with the attributes of
+    the history of :class:`dakota.DakotaResults` as read-only memory maps.
+    """
+
+    def __init__(self, eval_ids, variables, responses, asv, variable_labels, response_labels):
+        self.eval_ids = eval_ids
+        self.variables = variables
+        self.responses = responses
+        self.asv = asv
+        self.variable_labels = variable_labels
+        self.response_labels = response_labels
+
+    def __repr__(self):
+        return f"StoredEvaluations(evaluations={len(self)})"
+
+    def __len__(self):
+        return len(self.eval_ids)
+
+    def column(self, label):
+        """ Return the history of the variable or response with the given label. """
+        if label in self.variable_labels:
+            return self.variables[:, self.variable_labels.index(label)]
+        return self.responses[:, self.response_labels.index(label)]
+
+
+def load_store(directory):
+    """
+    Map the columns of an :class:`EvaluationStore` in memory.
+
+    :param directory: The directory of the store
+    :type directory: str
+    :rtype: StoredEvaluations
+    """
+    directory = os.fspath(directory)
+    labels = dict(variables=[], responses=[])
+    if os.path.exists(os.path.join(directory, _LABELS)):
+        with open(os.path.join(directory, _LABELS)) as labels_file:
+            labels = json.load(labels_file)
+
+    columns = {}
+    for name, dtype, single in _COLUMNS:
+        path = os.path.join(directory, f'{name}.npy')
+        if os.path.exists(path):
+            columns[name] = numpy.load(path, mmap_mode='r')
+        else:
+            columns[name] = numpy.zeros(0 if single else (0, 0), dtype=dtype)
+    return StoredEvaluations(columns['eval_ids'], columns['variables'], columns['responses'], columns['asv'],
+                             labels['variables'], labels['responses'])
@@ -0,0 +1,225 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Streaming of DAKOTA runs.
+
+:class:`DakotaStream` runs :meth:`dakota.DakotaBase.run_dakota` in a
+background thread and delivers one :class:`CompletedEvaluation` per evaluation
+as soon as the driver returned it, so that progress can be followed while the
+study is running:
+
+    with DakotaStream(driver, infile=None) as stream:
+        for evaluation in stream:
+            print(evaluation.eval_id, evaluation.fns)
+    results = stream.result()
+"""
+
+import queue
+import threading
+
+import numpy
+
+from dakota_budget import Budget
+
+# Marks the end of the run in the queue
+_DONE = object()
+
+# Seconds between the checks of a closed stream while DAKOTA waits for room in the queue
+_POLL_INTERVAL = 0.1
+
+
+class CompletedEvaluation:
+    """ An evaluation returned by the driver. """
+
+    __slots__ = ('eval_id', 'labels', 'variables', 'asv', 'fns', 'fnGrads', 'fnHessians', 'start', 'end')
+
+    def __init__(self, eval_id, labels, variables, asv, response, start, end):
+        self.eval_id = eval_id
+        self.labels = labels
+        self.variables = variables
+        self.asv = asv
+        self.fns = response.get('fns')
+        self.fnGrads = response.get('fnGrads')
+        self.fnHessians = response.get('fnHessians')
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"CompletedEvaluation(eval_id={self.eval_id}, variables={self.variables}, fns={self.fns})"
+
+    @property
+    def duration(self):
+        """ Wall time of the driver call that computed this evaluation, in seconds. """
+        return self.end - self.start
+
+
+class DakotaStream:
+    """
+    Run a driver in a background thread and stream its completed evaluations.
+
+    Iterating over the stream blocks until the next evaluation completes and
+    stops at the end of the run, re-raising the exception of a failed run.
+    :meth:`poll` returns the evaluations completed so far without blocking.
+
+    If `maxsize` is set, DAKOTA waits in the callback once that many
+    evaluations are pending, so that a slow consumer throttles the study
+    rather than accumulating its history in memory.
+
+    :meth:`close` stops the study at its next callback through the budget of
+    the run, as does leaving an iteration over the stream before its end.
+    Leaving the ``with`` block waits for the end of the run.
+    """
+
+    def __init__(self, driver, maxsize=0, **kwargs):
+        """
+        :param driver: The driver to run
+        :type driver: dakota.DakotaBase
+        :param maxsize: The maximum number of pending evaluations, no limit if 0
+        :type maxsize: int
+        :param kwargs: Additional arguments passed to :meth:`dakota.DakotaBase.run_dakota`,
+        except a `listener`, the stream being the listener of the run
+        """
+        if 'listener' in kwargs:
+            raise RuntimeError("A DakotaStream is the listener of its run, it does not take another one")
+
+        self.driver = driver
+        self._queue = queue.Queue(maxsize)
+        self._results = None
+        self._error = None
+        self._done = False
+        self._closed = threading.Event()
+        # Closing the stream goes through the budget of the run
+        if kwargs.get('budget') is None:
+            kwargs['budget'] = Budget()
+        self._budget = kwargs['budget']
+        self._thread = threading.Thread(target=self._run, args=(kwargs,), daemon=True,
+                                        name=f'dakota-stream-{id(driver)}')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wait()
+
+    def __iter__(self):
+        try:
+            while True:
+                evaluation = self.get()
+                if evaluation is None:
+                    return
+                yield evaluation
+        finally:
+            # Nobody consumes the evaluations of an abandoned iteration
+            if not self._done:
+                self.close()
+
+    @property
+    def running(self):
+        """ True while DAKOTA is running. """
+        return self._thread.is_alive()
+
+    def get(self, timeout=None):
+        """
+        Return the next completed evaluation, or None at the end of the run.
+
+        :param timeout: The number of seconds to wait, forever if None
+        :raises queue.Empty: if no evaluation completed within `timeout`
+        """
+        if self._done:
+            return None
+        item = self._queue.get(timeout=timeout)
+        if item is _DONE:
+            self._done = True
+            self._raise()
+            return None
+        return item
+
+    def poll(self):
+        """ Return the evaluations completed since the last call, without waiting. """
+        evaluations = []
+        while not self._done:
+            try:
+                evaluation = self.get(timeout=0)
+            except queue.Empty:
+                break
+            if evaluation is not None:
+                evaluations.append(evaluation)
+        return evaluations
+
+    def wait(self):
+        """ Wait for the end of the run, discarding the evaluations not consumed yet. """
+        while not self._done:
+            # Keep the queue drained, DAKOTA may be waiting for room
+            if self._queue.get() is _DONE:
+                self._done = True
+        self._thread.join()
+
+    def close(self):
+        """
+        Stop the study at its next callback and wait for the end of the run,
+        discarding the evaluations not consumed yet. The run returns the best
+        evaluation so far, see :class:`dakota_budget.Budget`.
+        """
+        self._closed.set()
+        if self.running:
+            self._budget.cancel()
+        self.wait()
+
+    def result(self):
+        """
+        Wait for the end of the run and return its :class:`dakota.DakotaResults`,
+        re-raising the exception of a failed run.
+        """
+        self.wait()
+        self._raise()
+        return self._results
+
+    def _raise(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self, kwargs):
+        try:
+            self._results = self.driver.run_dakota(listener=self._completed, **kwargs)
+        except BaseException as exc:
+            self._error = exc
+        finally:
+            # A closed stream is drained until the end of the run
+            self._queue.put(_DONE)
+
+    def _put(self, evaluation):
+        """ Queue an evaluation, waiting for room unless the stream is closed. """
+        while not self._closed.is_set():
+            try:
+                self._queue.put(evaluation, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _completed(self, kwargs, response, start, end, batch):
+        """ Listener of the run, queues the evaluations of a callback. """
+        labels = kwargs['av_labels']
+        if not batch:
+            self._put(CompletedEvaluation(kwargs['currEvalId'], labels, numpy.array(kwargs['av']),
+                                          numpy.array(kwargs['asv']), response, start, end))
+            return
+
+        for row, eval_id in enumerate(kwargs['currEvalId']):
+            point = {key: numpy.asarray(value)[row] for key, value in response.items()
+                     if key in ('fns', 'fnGrads', 'fnHessians')}
+            self._put(CompletedEvaluation(eval_id, labels, numpy.array(kwargs['av'][row]),
+                                          numpy.array(kwargs['asv'][row]), point, start, end))
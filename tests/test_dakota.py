@@ -18,12 +18,28 @@ Trivial carolina test which runs an optimization on a 'model' which is the
 Rosenbrock function.
 """
 
-from numpy import array
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from numpy import array, dtype, intc, zeros
 from traceback import print_exc
+import os
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
-from dakota import DakotaBase, DakotaInput
+from dakota import DakotaBase, DakotaInput, DakotaSession, read_restart, run_many
+from dakota_budget import Budget
+from dakota_cache import EvaluationCache, StudyCache
+from dakota_failures import FailurePolicy
+from dakota_gradients import FiniteDifferences
+from dakota_output import OutputCapture
+from dakota_remote import LocalWorkerPool
+from dakota_service import DakotaService
+from dakota_store import load_store
+from dakota_profile import RunProfile
+from dakota_stream import DakotaStream
 
 
 class TestDriver(DakotaBase):
@@ -141,6 +157,263 @@ class TestDriver(DakotaBase):
         return retval
 
 
+def parameter_study_input(evaluation_concurrency):
+    """ A 5x5 grid over the Rosenbrock domain. """
+    return DakotaInput(
+        evaluation_concurrency=evaluation_concurrency,
+        environment=[
+            "output_precision = 8", ],
+        method=[
+            "multidim_parameter_study",
+            "  partitions = 4 4", ],
+        model=[
+            "single", ],
+        variables=[
+            "continuous_design = 2",
+            "  lower_bounds   -2.0 -2.0",
+            "  upper_bounds    2.0  2.0",
+            "  descriptors     'x1' 'x2'", ],
+        responses=[
+            "num_objective_functions = 1",
+            "no_gradients",
+            "no_hessians", ]
+    )
+
+
+class BatchTestDriver(DakotaBase):
+
+    def __init__(self):
+        super().__init__(parameter_study_input(25))
+
+        self.batch_sizes = []
+        self.fns = {}
+
+    def dakota_batch_callback(self, **kwargs):
+        """ Vectorized Rosenbrock function, one row of `cv` per evaluation. """
+        cv = kwargs['cv']
+        self.batch_sizes.append(cv.shape[0])
+
+        x0, x1 = cv[:, 0], cv[:, 1]
+        fns = zeros((cv.shape[0], kwargs['functions']))
+        fns[:, 0] = 100*(x1-x0*x0)**2 + (1-x0)**2
+
+        self.fns.update(zip(kwargs['currEvalId'], fns[:, 0]))
+        return dict(fns=fns)
+
+
+class TickingTestDriver(TestDriver):
+    """ Rosenbrock recording the ticks of another thread at the start and end of its callbacks. """
+
+    def __init__(self, ticks):
+        super().__init__()
+        self.ticks = ticks
+        self.calls = []
+
+    def dakota_callback(self, **kwargs):
+        start = self.ticks[0]
+        response = super().dakota_callback(**kwargs)
+        self.calls.append((start, self.ticks[0]))
+        return response
+
+
+class ConcurrentTestDriver(DakotaBase):
+
+    def __init__(self, executor):
+        super().__init__(parameter_study_input(5), executor=executor)
+
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.fns = {}
+
+    def dakota_callback(self, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        x = kwargs['cv']
+        f = 100*(x[1]-x[0]*x[0])**2 + (1-x[0])**2
+        time.sleep(0.05)
+
+        with self.lock:
+            self.active -= 1
+            self.fns[kwargs['currEvalId']] = f
+        return dict(fns=array([f]))
+
+
+class RemoteTestDriver(DakotaBase):
+    """ Rosenbrock evaluated by worker processes, which report their process ID as a second response. """
+
+    def __init__(self, executor):
+        dakota_input = parameter_study_input(5)
+        dakota_input.responses = [
+            "num_response_functions = 2",
+            "  descriptors 'f' 'pid'",
+            "no_gradients",
+            "no_hessians", ]
+        super().__init__(dakota_input, executor=executor)
+
+    def dakota_callback(self, **kwargs):
+        x = kwargs['cv']
+        f = 100*(x[1]-x[0]*x[0])**2 + (1-x[0])**2
+        return dict(fns=array([f, os.getpid()]))
+
+
+class FlakyTestDriver(DakotaBase):
+    """ Rosenbrock failing once at x1 = 2, and every time at (2, 2). """
+
+    def __init__(self):
+        super().__init__(parameter_study_input(5),
+                         failure_policy=FailurePolicy(retries=1, mode='recover', recover=[1e10]))
+        self.attempts = {}
+
+    def dakota_callback(self, **kwargs):
+        x = kwargs['cv']
+        attempt = self.attempts[tuple(x)] = self.attempts.get(tuple(x), 0) + 1
+        if x[0] == 2.0 and (attempt == 1 or x[1] == 2.0):
+            raise RuntimeError(f'simulation crashed at {x}')
+        f = 100*(x[1]-x[0]*x[0])**2 + (1-x[0])**2
+        return dict(fns=array([f]))
+
+
+class FidelityTestDriver(DakotaBase):
+    """ Rosenbrock, or a cheaper approximation of it, counting its evaluations. """
+
+    def __init__(self, dakota_input, scale=1.0, interfaces=None):
+        super().__init__(dakota_input, interfaces=interfaces)
+        self.scale = scale
+        self.evaluations = 0
+
+    def dakota_callback(self, **kwargs):
+        self.evaluations += 1
+        x = kwargs['cv']
+        f = 100*(x[1]-x[0]*x[0])**2 + (1-x[0])**2
+        return dict(fns=array([self.scale * f]))
+
+
+def multifidelity_input():
+    """ Multifidelity sampling of Rosenbrock, the low fidelity model being served by the 'lofi' interface. """
+    return DakotaInput(
+        interfaces={'lofi': None},
+        environment=[
+            "output_precision = 8", ],
+        method=[
+            "model_pointer = 'HIERARCH'",
+            "multifidelity_sampling",
+            "  pilot_samples = 20",
+            "  seed = 1234", ],
+        model=[
+            "id_model = 'HIERARCH'",
+            "surrogate hierarchical",
+            "  ordered_model_fidelities = 'LF' 'HF'",
+            "model",
+            "id_model = 'LF'",
+            "single",
+            "  interface_pointer = 'lofi'",
+            "model",
+            "id_model = 'HF'",
+            "single",
+            "  interface_pointer = 'carolina'", ],
+        variables=[
+            "uniform_uncertain = 2",
+            "  lower_bounds   -2.0 -2.0",
+            "  upper_bounds    2.0  2.0",
+            "  descriptors     'x1' 'x2'", ],
+        responses=[
+            "response_functions = 1",
+            "no_gradients",
+            "no_hessians", ]
+    )
+
+
+class StencilTestDriver(TestDriver):
+    """ Rosenbrock with gradients computed from vectorized finite difference stencils. """
+
+    def __init__(self):
+        super().__init__()
+        self.input.responses = [
+            "num_objective_functions = 1",
+            "analytic_gradients",
+            "no_hessians",
+        ]
+        self.finite_differences = FiniteDifferences(step=1e-7)
+        self.stencil_sizes = []
+
+    def dakota_stencil(self, **kwargs):
+        cv = kwargs['cv']
+        self.stencil_sizes.append(cv.shape[0])
+        x0, x1 = cv[:, 0], cv[:, 1]
+        return dict(fns=(100*(x1-x0*x0)**2 + (1-x0)**2)[:, None])
+
+
+class FastTestDriver(DakotaBase):
+
+    def __init__(self, evaluation_concurrency=None):
+        super().__init__(parameter_study_input(evaluation_concurrency))
+
+        self.metadata = []
+        self.fns = {}
+        self.dtypes = set()
+
+    def dakota_bind(self, metadata):
+        self.metadata.append(metadata)
+        return self.evaluate
+
+    def evaluate(self, evaluation):
+        self.dtypes.add((evaluation.asv.dtype, evaluation.dvv.dtype))
+        x = evaluation.cv
+        f = 100*(x[..., 1]-x[..., 0]**2)**2 + (1-x[..., 0])**2
+        if isinstance(evaluation.eval_id, list):
+            self.fns.update(zip(evaluation.eval_id, f))
+            return dict(fns=f[:, None])
+        self.fns[evaluation.eval_id] = f
+        return dict(fns=array([f]))
+
+
+class InPlaceTestDriver(TestDriver):
+    """ Rosenbrock with analytic derivatives, written into the response views. """
+
+    def dakota_bind(self, metadata):
+        return self.evaluate
+
+    def evaluate(self, evaluation):
+        x = evaluation.cv
+        f0 = x[1]-x[0]*x[0]
+        f1 = 1-x[0]
+        asv = evaluation.asv
+        if asv[0] & 1:
+            evaluation.fns[0] = 100*f0*f0+f1*f1
+        if asv[0] & 2:
+            evaluation.fnGrads[0] = (-400*f0*x[0] - 2*f1, 200*f0)
+        if asv[0] & 4:
+            fx = x[1]-3*x[0]*x[0]
+            evaluation.fnHessians[0][...] = ((-400*fx + 2, -400*x[0]),
+                                             (-400*x[0],    200     ))
+        return None
+
+
+class AsyncTestDriver(DakotaBase):
+
+    def __init__(self):
+        super().__init__(parameter_study_input(25))
+
+        self.active = 0
+        self.max_active = 0
+        self.fns = {}
+
+    async def dakota_callback(self, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+        x = kwargs['cv']
+        await asyncio.sleep(0.05)
+        f = 100*(x[1]-x[0]*x[0])**2 + (1-x[0])**2
+
+        self.active -= 1
+        self.fns[kwargs['currEvalId']] = f
+        return dict(fns=array([f]))
+
+
 class TestCase(unittest.TestCase):
 
     def test_dakota(self):
@@ -148,7 +421,12 @@ class TestCase(unittest.TestCase):
         driver = TestDriver()
 
         print('\n### Check normal run.')
-        driver.run_dakota()
+        results = driver.run_dakota()
+
+        self.assertEqual(results.variable_labels, ['x1', 'x2'])
+        self.assertEqual(results.variables.shape, (len(results.eval_ids), 2))
+        computed = results.responses[results.asv[:, 0] & 1 == 1, 0]
+        self.assertLessEqual(results.final_responses[0], computed.min() + 1e-12)
 
     def test_dakota_exception(self):
         # To exercise recovery from exceptions, all tests are run within this.
@@ -162,6 +440,370 @@ class TestCase(unittest.TestCase):
                 print_exc(file=sys.stdout)
                 raise
 
+    def test_dakota_batch(self):
+        driver = BatchTestDriver()
+
+        print('\n### Check batch run.')
+        driver.run_dakota()
+
+        self.assertEqual(sum(driver.batch_sizes), 25)
+        self.assertLess(len(driver.batch_sizes), 25)
+        self.assertEqual(driver.fns[1], 100*(-2-4)**2 + 9)
+
+    def test_dakota_results(self):
+        driver = BatchTestDriver()
+
+        print('\n### Check results of a run.')
+        results = driver.run_dakota()
+
+        self.assertEqual(len(results.eval_ids), 25)
+        self.assertEqual(results.variables.shape, (25, 2))
+        self.assertEqual(list(results.column('x1')[:5]), [-2.0, -1.0, 0.0, 1.0, 2.0])
+        for eval_id, f in zip(results.eval_ids, results.responses[:, 0]):
+            self.assertEqual(f, driver.fns[eval_id])
+
+    def test_dakota_fast_path(self):
+        for evaluation_concurrency in (None, 25):
+            driver = FastTestDriver(evaluation_concurrency)
+
+            print('\n### Check fast path.')
+            driver.run_dakota()
+
+            self.assertEqual(len(driver.metadata), 1)
+            self.assertEqual(driver.metadata[0]['av_labels'], ['x1', 'x2'])
+            self.assertEqual(driver.metadata[0]['batch'], evaluation_concurrency is not None)
+            self.assertEqual(len(driver.fns), 25)
+            self.assertEqual(driver.fns[1], 100*(-2-4)**2 + 9)
+            # As in the kwargs of dakota_callback and dakota_batch_callback
+            self.assertEqual(driver.dtypes, {(dtype(intc), dtype(intc))})
+
+    def test_dakota_in_place(self):
+        print('\n### Check responses written in place.')
+        results = InPlaceTestDriver().run_dakota()
+        expected = TestDriver().run_dakota()
+
+        self.assertEqual(list(results.final_variables), list(expected.final_variables))
+        self.assertEqual(list(results.final_responses), list(expected.final_responses))
+
+    def test_dakota_stencil(self):
+        driver = StencilTestDriver()
+
+        print('\n### Check finite difference stencils.')
+        results = driver.run_dakota(infile=None, write_restart=False)
+
+        self.assertIn(3, driver.stencil_sizes)
+        self.assertLess(results.final_responses[0], 1e-2)
+
+    def test_dakota_concurrent(self):
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            driver = ConcurrentTestDriver(executor)
+
+            print('\n### Check concurrent run.')
+            driver.run_dakota()
+
+        self.assertEqual(len(driver.fns), 25)
+        self.assertGreater(driver.max_active, 1)
+        self.assertEqual(driver.fns[1], 100*(-2-4)**2 + 9)
+
+    def test_dakota_remote(self):
+        with LocalWorkerPool(processes=2) as pool:
+            driver = RemoteTestDriver(pool)
+
+            print('\n### Check run on remote workers.')
+            results = driver.run_dakota(infile=None, write_restart=False)
+
+        pids = set(results.column('pid').astype(int))
+        self.assertEqual(pool.completed, 25)
+        self.assertEqual(pids, {process.pid for process in pool.processes})
+        self.assertEqual(results.column('f')[0], 100*(-2-4)**2 + 9)
+
+    def test_dakota_async(self):
+        driver = AsyncTestDriver()
+
+        async def main():
+            ticks = 0
+            task = asyncio.ensure_future(driver.run_dakota_async(infile=None))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            return ticks, await task
+
+        print('\n### Check asynchronous run.')
+        ticks, results = asyncio.run(main())
+
+        self.assertEqual(len(driver.fns), 25)
+        self.assertGreater(driver.max_active, 1)
+        self.assertGreater(ticks, 1)
+        self.assertEqual(len(results.eval_ids), 25)
+
+    def test_dakota_threads(self):
+        drivers = [BatchTestDriver(), BatchTestDriver()]
+        errors = []
+
+        def run(driver, infile):
+            try:
+                driver.run_dakota(infile=infile)
+            except Exception as exc:
+                errors.append(exc)
+
+        print('\n### Check runs from several threads.')
+        with tempfile.TemporaryDirectory() as workdir:
+            # The runs are serialized, the second one waits without holding the GIL
+            threads = [threading.Thread(target=run, args=(driver, os.path.join(workdir, f'dakota_{index}.in')))
+                       for index, driver in enumerate(drivers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        for driver in drivers:
+            self.assertEqual(len(driver.fns), 25)
+
+    def test_dakota_releases_gil(self):
+        ticks = [0]
+        done = threading.Event()
+
+        def tick():
+            while not done.is_set():
+                ticks[0] += 1
+
+        print('\n### Check other threads running during a run.')
+        driver = TickingTestDriver(ticks)
+        ticker = threading.Thread(target=tick)
+        ticker.start()
+        try:
+            driver.run_dakota(infile=None, write_restart=False)
+        finally:
+            done.set()
+            ticker.join()
+
+        # The ticker also made progress while DAKOTA ran between the callbacks
+        between = sum(start - end for (_, end), (start, _) in zip(driver.calls, driver.calls[1:]))
+        self.assertGreater(len(driver.calls), 1)
+        self.assertGreater(between, 0)
+
+    def test_dakota_in_memory(self):
+        driver = BatchTestDriver()
+
+        print('\n### Check run without input and restart files.')
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                driver.run_dakota(infile=None, write_restart=False)
+                self.assertEqual(os.listdir(workdir), [])
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(len(driver.fns), 25)
+
+    def test_dakota_output(self):
+        driver = BatchTestDriver()
+        output = OutputCapture(maxlen=20)
+
+        print('\n### Check output captured in memory.')
+        driver.run_dakota(infile=None, write_restart=False, output=output)
+
+        self.assertEqual(len(output.lines()), 20)
+        self.assertGreater(output.lines_written, 20)
+        self.assertTrue(output.text('stdout'))
+
+    def test_dakota_store(self):
+        print('\n### Check run without evaluation cache, stored on disk.')
+        with tempfile.TemporaryDirectory() as workdir:
+            driver = BatchTestDriver()
+            results = driver.run_dakota(infile=None, write_restart=False, evaluation_cache=False,
+                                        store=os.path.join(workdir, 'store'))
+            self.assertEqual(len(results.eval_ids), 0)
+
+            evaluations = load_store(os.path.join(workdir, 'store'))
+            self.assertEqual(sorted(evaluations.eval_ids), list(range(1, 26)))
+            self.assertEqual(evaluations.response_labels, results.response_labels)
+            for eval_id, f in zip(evaluations.eval_ids, evaluations.responses[:, 0]):
+                self.assertEqual(f, driver.fns[eval_id])
+
+        print('\n### Check run with a limited evaluation cache.')
+        driver = BatchTestDriver()
+        driver.input = parameter_study_input(5)
+        results = driver.run_dakota(infile=None, write_restart=False, evaluation_cache=10)
+        # The limit plus one batch
+        self.assertLessEqual(len(results.eval_ids), 15)
+        self.assertEqual(results.eval_ids[-1], 25)
+
+    def test_dakota_failures(self):
+        print('\n### Check failed evaluations, retried then recovered.')
+        driver = FlakyTestDriver()
+        results = driver.run_dakota(infile=None, write_restart=False)
+        self.assertEqual(results.failures, dict(errors=6, timeouts=0, retried=5, failures=1))
+        self.assertEqual(len(results.eval_ids), 25)
+        self.assertIn(1e10, results.responses[:, 0])
+
+    def test_dakota_budget(self):
+        print('\n### Check run stopped by its evaluation budget.')
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'study.rst')
+            driver = BatchTestDriver()
+            driver.input = parameter_study_input(5)
+            results = driver.run_dakota(infile=None, write_restart=path, budget=Budget(evaluations=10))
+            self.assertTrue(results.stopped_early)
+            self.assertEqual(driver.batch_sizes, [5, 5])
+            self.assertEqual(list(results.eval_ids), list(range(1, 11)))
+            self.assertEqual(results.final_responses[0], min(driver.fns.values()))
+            self.assertEqual(len(read_restart(path)), 10)
+
+        print('\n### Check run completing within its budget.')
+        results = BatchTestDriver().run_dakota(infile=None, write_restart=False, budget=Budget(time=3600))
+        self.assertFalse(results.stopped_early)
+
+    def test_dakota_service(self):
+        print('\n### Check memory and handles of many runs in one process.')
+        service = DakotaService()
+        # Warm up allocator pools and caches before taking the baseline
+        for _ in range(20):
+            service.run(BatchTestDriver(), infile=None, write_restart=False)
+        baseline = service.report
+        for _ in range(300):
+            results = service.run(BatchTestDriver(), infile=None, write_restart=False)
+            self.assertEqual(len(results.eval_ids), 25)
+        report = service.report
+        print('   ', baseline)
+        print('   ', report)
+        self.assertLess(report.rss - baseline.rss, 16 * 2**20)
+        self.assertEqual(report.open_files, baseline.open_files)
+        self.assertEqual(report.threads, baseline.threads)
+        self.assertEqual(report.drivers, baseline.drivers)
+        self.assertEqual(report.interfaces, 0)
+
+    def test_dakota_interfaces(self):
+        print('\n### Check interfaces bound to their own drivers.')
+        dakota_input = multifidelity_input()
+        lofi = FidelityTestDriver(dakota_input, scale=0.9)
+        driver = FidelityTestDriver(dakota_input, interfaces={'lofi': lofi})
+        content = dakota_input.render(driver_instance=driver)
+        self.assertIn(f"analysis_components = '{id(lofi)}'", content)
+        self.assertEqual(content.count('analysis_drivers'), 2)
+        with self.assertRaisesRegex(RuntimeError, 'lofi'):
+            dakota_input.render(driver_instance=FidelityTestDriver(dakota_input))
+
+        driver.run_dakota(infile=None, write_restart=False)
+        self.assertGreater(driver.evaluations, 0)
+        self.assertGreaterEqual(lofi.evaluations, driver.evaluations)
+
+    def test_dakota_study_cache(self):
+        print('\n### Check identical studies returned from the study cache.')
+        with tempfile.TemporaryDirectory() as workdir:
+            cache = StudyCache(os.path.join(workdir, 'studies.db'))
+            output = OutputCapture()
+            first = BatchTestDriver()
+            results = first.run_dakota(infile=None, write_restart=False, output=output, study_cache=cache)
+            self.assertFalse(results.from_cache)
+            self.assertEqual(len(cache), 1)
+
+            # A new driver of the same class renders the same study, whatever its id
+            again = OutputCapture()
+            second = BatchTestDriver()
+            cached = second.run_dakota(infile=None, write_restart=False, output=again, study_cache=cache)
+            self.assertTrue(cached.from_cache)
+            self.assertEqual(second.batch_sizes, [])
+            self.assertEqual(cached.study_key, results.study_key)
+            self.assertEqual(list(cached.final_responses), list(results.final_responses))
+            self.assertEqual(again.text(), output.text())
+
+            # So do other restart options
+            restarted = BatchTestDriver().run_dakota(infile=None, write_restart=os.path.join(workdir, 'study.rst'),
+                                                     output=OutputCapture(), study_cache=cache)
+            self.assertFalse(restarted.from_cache)
+            self.assertNotEqual(restarted.study_key, results.study_key)
+
+            # A new driver version runs the study again
+            third = BatchTestDriver()
+            third.study_version = lambda: 'BatchTestDriver 2'
+            self.assertFalse(third.run_dakota(infile=None, write_restart=False, study_cache=cache).from_cache)
+            self.assertEqual(cache.invalidate(key=results.study_key), 1)
+            self.assertEqual(len(cache), 2)
+
+    def test_dakota_restart(self):
+        print('\n### Check restart files.')
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'study.rst')
+            driver = BatchTestDriver()
+            driver.run_dakota(infile=None, write_restart=path)
+
+            evaluations = read_restart(path)
+            self.assertEqual(len(evaluations), 25)
+            self.assertEqual(len(read_restart(path, stop_restart=10)), 10)
+            for point, response in evaluations:
+                self.assertEqual(response['fns'][0], driver.fns[point['currEvalId']])
+
+            # A restarted study replays the evaluations without calling the driver
+            restarted = BatchTestDriver()
+            restarted.run_dakota(infile=None, write_restart=False, read_restart=path)
+            self.assertEqual(sum(restarted.batch_sizes), 0)
+
+            # A preloaded cache serves them too, whatever the restart settings
+            cache = EvaluationCache(os.path.join(workdir, 'cache.db'))
+            cache.store_many(evaluations)
+            cached = BatchTestDriver()
+            cached.cache = cache
+            cached.run_dakota(infile=None, write_restart=False)
+            self.assertEqual(sum(cached.batch_sizes), 0)
+            cache.close()
+
+    def test_dakota_session(self):
+        driver = BatchTestDriver()
+
+        print('\n### Check session.')
+        with DakotaSession(driver) as session:
+            first = session.run()
+            second = session.run(lower_bounds=[-1.0, -1.0], upper_bounds=[1.0, 1.0])
+
+        self.assertEqual((session.builds, session.runs), (1, 2))
+        self.assertGreater(session.time_saved, 0.0)
+        self.assertEqual(first.variables.min(), -2.0)
+        self.assertEqual(second.variables.min(), -1.0)
+        self.assertEqual(len(driver.fns), 50)
+
+    def test_dakota_profile(self):
+        driver = BatchTestDriver()
+        profile = RunProfile()
+
+        print('\n### Check profiled run.')
+        driver.run_dakota(profile=profile)
+
+        summary = profile.summary()
+        self.assertEqual(summary['evaluations'], 25)
+        self.assertEqual(summary['callbacks'], len(driver.batch_sizes))
+        self.assertGreater(summary['marshal']['total'], 0.0)
+
+    def test_dakota_stream(self):
+        driver = BatchTestDriver()
+
+        print('\n### Check streamed run.')
+        with DakotaStream(driver, infile=None) as stream:
+            evaluations = list(stream)
+
+        self.assertEqual(sorted(evaluation.eval_id for evaluation in evaluations), list(range(1, 26)))
+        for evaluation in evaluations:
+            self.assertEqual(evaluation.fns[0], driver.fns[evaluation.eval_id])
+        self.assertEqual(len(stream.result().eval_ids), 25)
+
+    def test_run_many(self):
+        drivers = [TestDriver(), TestDriver(force_exception=True), TestDriver()]
+
+        print('\n### Check running many studies.')
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_many(drivers, max_workers=2, workdir=workdir)
+
+            self.assertEqual([result.status for result in results], ['ok', 'failed', 'ok'])
+            self.assertIsInstance(results[1].error, RuntimeError)
+            self.assertEqual(len({result.workdir for result in results}), 3)
+            for result in results:
+                self.assertTrue(os.path.exists(os.path.join(result.workdir, 'dakota.in')))
+
+        with self.assertRaisesRegex(RuntimeError, 'infile, stdout'):
+            run_many(drivers, infile='study.in', stdout='study.out')
+
 
 if __name__ == '__main__':
     unittest.main()
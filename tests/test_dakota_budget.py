@@ -0,0 +1,88 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the budgets, with callback arguments built by hand.
+"""
+
+import time
+import unittest
+
+from numpy import array
+
+from dakota import DakotaResults
+from dakota_budget import Budget, StopStudy
+
+
+def batch(eval_ids, fns):
+    """ The arguments and response of a batch callback of one function of two variables. """
+    nrows = len(eval_ids)
+    kwargs = dict(currEvalId=eval_ids, functions=1, av=array([[float(i), -float(i)] for i in eval_ids]),
+                  av_labels=['x1', 'x2'], asv=array([[1]] * nrows))
+    return kwargs, dict(fns=array(fns, dtype=float).reshape(nrows, 1))
+
+
+class TestCase(unittest.TestCase):
+
+    def test_evaluations(self):
+        budget = Budget(evaluations=4)
+        budget.check()
+        budget(*batch([1, 2, 3], [5.0, 2.0, 7.0]), 0.0, 0.0, True)
+        budget.check()
+        budget(*batch([4, 5], [3.0, 1.0]), 0.0, 0.0, True)
+        with self.assertRaisesRegex(StopStudy, 'evaluations'):
+            budget.check()
+        self.assertEqual(budget.reason, 'evaluations')
+        self.assertEqual(budget.evaluations, 5)
+
+        results = DakotaResults()
+        budget.finish(results)
+        self.assertTrue(results.stopped_early)
+        self.assertEqual(results.final, dict(x1=5.0, x2=-5.0))
+        self.assertEqual(list(results.final_responses), [1.0])
+
+        budget.start()
+        budget.check()
+        self.assertIsNone(budget.best_responses)
+
+    def test_time_and_predicate(self):
+        budget = Budget(time=0.01)
+        time.sleep(0.02)
+        with self.assertRaisesRegex(StopStudy, 'time'):
+            budget.check()
+
+        budget = Budget(stop=lambda kwargs, response: response['fns'].min() < 1.0)
+        budget(*batch([1], [2.0]), 0.0, 0.0, True)
+        budget.check()
+        kwargs, response = batch([2, 3], [0.5, 4.0])
+        response['failed'] = array([False, True])
+        budget(kwargs, response, 0.0, 0.0, True)
+        with self.assertRaisesRegex(StopStudy, 'predicate'):
+            budget.check()
+        self.assertEqual(list(budget.best_variables), [2.0, -2.0])
+
+        with self.assertRaises(RuntimeError):
+            Budget(evaluations=0)
+
+    def test_key(self):
+        budget = Budget(key=lambda fns: -fns[0])
+        budget(*batch([1, 2, 3], [5.0, 2.0, 7.0]), 0.0, 0.0, True)
+        budget(*batch([4], [6.0]), 0.0, 0.0, True)
+        self.assertEqual(list(budget.best_variables), [3.0, -3.0])
+        self.assertEqual(list(budget.best_responses), [7.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the persistent evaluation and study caches.
+"""
+
+from numpy import array
+import os
+import tempfile
+import unittest
+
+from dakota import DakotaResults
+from dakota_cache import EvaluationCache, OutputRecorder, StudyCache, StudyRecord, file_digest
+
+
+def point(x, asv=1):
+    return dict(av=array(x, dtype=float), av_labels=['x1', 'x2'], asv=array([asv]))
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_persistent(self):
+        cache = EvaluationCache(self.path)
+        self.assertIsNone(cache.lookup(point([1.0, 2.0])))
+        cache.store(point([1.0, 2.0]), dict(fns=array([3.0])))
+        cache.close()
+
+        cache = EvaluationCache(self.path)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.lookup(point([1.0, 2.0]))['fns'][0], 3.0)
+        self.assertIsNone(cache.lookup(point([1.0, 2.0], asv=3)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_tolerance(self):
+        cache = EvaluationCache(self.path, tolerance=1e-6)
+        cache.store(point([1.0, 2.0]), dict(fns=array([3.0])))
+        self.assertIsNotNone(cache.lookup(point([1.0 + 1e-7, 2.0 - 1e-7])))
+        self.assertIsNone(cache.lookup(point([1.0, 2.0 + 1e-5])))
+
+    def test_lru_eviction(self):
+        cache = EvaluationCache(self.path, max_entries=2)
+        cache.store(point([1.0, 1.0]), dict(fns=array([1.0])))
+        cache.store(point([2.0, 2.0]), dict(fns=array([2.0])))
+        cache.lookup(point([1.0, 1.0]))
+        cache.store(point([3.0, 3.0]), dict(fns=array([3.0])))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNotNone(cache.lookup(point([1.0, 1.0])))
+        self.assertIsNone(cache.lookup(point([2.0, 2.0])))
+
+    def test_study_key(self):
+        rendered = "method\n\tsampling\ninterface\n\t  analysis_components = '140230'\n"
+        key = StudyCache.key(rendered, 'v1')
+        self.assertEqual(StudyCache.key(rendered.replace('140230', '99').replace('\t', '    '), 'v1'), key)
+        self.assertNotEqual(StudyCache.key(rendered, 'v2'), key)
+        self.assertNotEqual(StudyCache.key(rendered.replace('sampling', 'sampling seed = 1'), 'v1'), key)
+
+        options = dict(read_restart='dakota.rst', replayed='ab12', stop_restart=0, write_restart=True)
+        self.assertNotEqual(StudyCache.key(rendered, 'v1', options), key)
+        self.assertEqual(StudyCache.key(rendered, 'v1', dict(reversed(options.items()))),
+                         StudyCache.key(rendered, 'v1', options))
+        self.assertNotEqual(StudyCache.key(rendered, 'v1', dict(options, replayed='cd34')),
+                            StudyCache.key(rendered, 'v1', options))
+        self.assertNotEqual(StudyCache.key(rendered, 'v1', dict(options, stop_restart=10)),
+                            StudyCache.key(rendered, 'v1', options))
+
+    def test_file_digest(self):
+        path = os.path.join(self.tmpdir.name, 'dakota.rst')
+        self.assertIsNone(file_digest(path))
+        self.assertIsNone(file_digest(None))
+        with open(path, 'wb') as restart:
+            restart.write(b'restart')
+        digest = file_digest(path)
+        with open(path, 'ab') as restart:
+            restart.write(b' data')
+        self.assertNotEqual(file_digest(path), digest)
+
+    def test_study_store_and_invalidate(self):
+        results = DakotaResults()
+        results.final_responses = array([1.5])
+        cache = StudyCache(self.path)
+        self.assertIsNone(cache.lookup('a'))
+        cache.store('a', 'v1', StudyRecord(results, dict(stdout='text\n', stderr=''), {}))
+        cache.store('b', 'v1', StudyRecord(results, {}, {}))
+        cache.store('c', 'v2', StudyRecord(results, {}, {}))
+        cache.close()
+
+        cache = StudyCache(self.path)
+        self.assertEqual(len(cache), 3)
+        record = cache.lookup('a')
+        self.assertEqual(record.results.final_responses[0], 1.5)
+        self.assertEqual(record.streams['stdout'], 'text\n')
+        self.assertEqual(cache.invalidate(version='v1'), 2)
+        self.assertEqual(cache.invalidate(key='c'), 1)
+        self.assertEqual(len(cache), 0)
+        with self.assertRaises(RuntimeError):
+            cache.invalidate()
+
+    def test_study_eviction(self):
+        record = StudyRecord(DakotaResults(), dict(stdout='x' * 1000), {})
+        cache = StudyCache(self.path, max_bytes=4000)
+        cache.store('a', 'v1', record)
+        cache.store('b', 'v1', record)
+        cache.lookup('a')
+        cache.store('c', 'v1', record)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.lookup('b'))
+
+    def test_study_record(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            recorder = OutputRecorder(output=lambda stream, text: None)
+            recorder('stdout', 'Method: sampling\n')
+            with open('study.err', 'w') as err:
+                err.write('warning\n')
+            with open('samples.dat', 'wb') as tabular:
+                tabular.write(b'%eval_id x1\n1 0.5\n')
+            rendered = "environment\n\ttabular_data\n\t  tabular_data_file = 'samples.dat'\n"
+            record = StudyRecord.capture(DakotaResults(), recorder, rendered, stderr='study.err')
+            self.assertEqual(record.streams, dict(stdout='Method: sampling\n', stderr='warning\n'))
+            os.remove('samples.dat')
+
+            received = []
+            record.restore(output=lambda stream, text: received.append((stream, text)), stdout='study.out')
+            self.assertEqual(received, [('stderr', 'warning\n')])
+            with open('study.out') as out:
+                self.assertEqual(out.read(), 'Method: sampling\n')
+            with open('samples.dat', 'rb') as tabular:
+                self.assertEqual(tabular.read(), b'%eval_id x1\n1 0.5\n')
+
+            # The streams of the process are not recorded without an output callable
+            record = StudyRecord.capture(DakotaResults(), None, rendered, stderr='study.err')
+            self.assertEqual(record.streams, dict(stderr='warning\n'))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the failure policy, with plain functions as evaluations.
+"""
+
+import asyncio
+import threading
+import unittest
+
+from dakota_failures import EvaluationFailure, FailurePolicy
+
+
+class Flaky:
+    """ Raise for the first `failures` calls, then return the point. """
+
+    def __init__(self, failures, delay=None):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.delay is None:
+                raise ValueError(f'attempt {self.calls}')
+            threading.Event().wait(self.delay)
+        return dict(fns=[kwargs['x']])
+
+
+class TestCase(unittest.TestCase):
+
+    def test_retries(self):
+        policy = FailurePolicy(retries=2, mode='recover', recover=[1e10])
+        self.assertEqual(policy.failure_capture(), 'failure_capture recover = 10000000000.0')
+        self.assertEqual(policy.call(Flaky(2), dict(currEvalId=1, x=3.0)), dict(fns=[3.0]))
+        self.assertEqual(policy.counters(), dict(errors=2, timeouts=0, retried=2, failures=0))
+
+        response, counts = policy.run(Flaky(3), dict(currEvalId=2, x=3.0))
+        self.assertIsNone(response)
+        self.assertEqual(counts, dict(errors=3, timeouts=0, retried=2, failures=1))
+        with self.assertRaises(EvaluationFailure):
+            policy.call(Flaky(3), dict(currEvalId=3, x=3.0))
+        self.assertEqual(policy.failures, 1)
+
+        policy.reset()
+        self.assertEqual(policy.counters(), dict(errors=0, timeouts=0, retried=0, failures=0))
+
+    def test_abort(self):
+        policy = FailurePolicy(retries=1)
+        self.assertIsNone(policy.failure_capture())
+        with self.assertRaisesRegex(ValueError, 'attempt 2'):
+            policy.call(Flaky(2), dict(currEvalId=1, x=3.0))
+        with self.assertRaises(RuntimeError):
+            FailurePolicy(mode='recover')
+
+    def test_timeout(self):
+        policy = FailurePolicy(timeout=0.05, retries=1, mode='continuation')
+        self.assertEqual(policy.failure_capture(), 'failure_capture continuation')
+        self.assertEqual(policy.call(Flaky(1, delay=1.0), dict(currEvalId=1, x=3.0)), dict(fns=[3.0]))
+        self.assertEqual(policy.counters(), dict(errors=0, timeouts=1, retried=1, failures=0))
+
+    def test_async(self):
+        calls = []
+
+        async def evaluate(**kwargs):
+            calls.append(kwargs['currEvalId'])
+            if len(calls) == 1:
+                await asyncio.sleep(1.0)
+            return dict(fns=[kwargs['x']])
+
+        policy = FailurePolicy(timeout=0.05, retries=1, mode='recover', recover=[0.0])
+        outcome = asyncio.run(policy.run_async(evaluate, dict(currEvalId=1, x=3.0)))
+        self.assertEqual(policy.collect([outcome]), [dict(fns=[3.0])])
+        self.assertEqual(policy.counters(), dict(errors=0, timeouts=1, retried=1, failures=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the finite difference gradients.
+"""
+
+from numpy import array, stack, where, zeros
+import unittest
+
+from dakota_gradients import FiniteDifferences
+
+
+def batch(points, asv):
+    points = array(points, dtype=float)
+    n = len(points)
+    return dict(functions=1, cv=points, div=zeros((n, 0), dtype=int), drv=zeros((n, 0)), av=points,
+                asv=array([[asv]] * n), dvv=array([[1, 2]] * n), currEvalId=list(range(1, n + 1)),
+                av_labels=['x1', 'x2'])
+
+
+class Rosenbrock:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, kwargs):
+        cv = kwargs['cv']
+        self.calls.append(len(cv))
+        x0, x1 = cv[:, 0], cv[:, 1]
+        return dict(fns=(100*(x1-x0*x0)**2 + (1-x0)**2)[:, None])
+
+
+class TwoFunctions(Rosenbrock):
+    """ Rosenbrock and x1 - x0, zero for the functions not requested. """
+
+    def __call__(self, kwargs):
+        cv = kwargs['cv']
+        self.calls.append(len(cv))
+        x0, x1 = cv[:, 0], cv[:, 1]
+        fns = stack([100*(x1-x0*x0)**2 + (1-x0)**2, x1 - x0], axis=1)
+        return dict(fns=where(kwargs['asv'] & 1, fns, 0.0))
+
+
+def gradient(x0, x1):
+    return [-400*(x1-x0*x0)*x0 - 2*(1-x0), 200*(x1-x0*x0)]
+
+
+class TestCase(unittest.TestCase):
+
+    def test_forward(self):
+        fd = FiniteDifferences(step=1e-7)
+        model = Rosenbrock()
+        response = fd.evaluate_batch(batch([[-1.2, 1.0], [0.5, 0.5]], asv=3), model)
+
+        # Both stencils are evaluated in one call, with their centers
+        self.assertEqual(model.calls, [6])
+        self.assertAlmostEqual(response['fns'][0, 0], 24.2)
+        for row, x in enumerate([[-1.2, 1.0], [0.5, 0.5]]):
+            for computed, expected in zip(response['fnGrads'][row, 0], gradient(*x)):
+                self.assertAlmostEqual(computed, expected, delta=1e-3 * max(abs(expected), 1))
+
+    def test_central(self):
+        fd = FiniteDifferences(step=1e-5, method='central')
+        model = Rosenbrock()
+        response = fd.evaluate_batch(batch([[-1.2, 1.0]], asv=2), model)
+
+        # The center is not evaluated for gradients only
+        self.assertEqual(model.calls, [4])
+        for computed, expected in zip(response['fnGrads'][0, 0], gradient(-1.2, 1.0)):
+            self.assertAlmostEqual(computed, expected, delta=1e-5 * max(abs(expected), 1))
+
+        response = fd.evaluate_batch(batch([[-1.2, 1.0]], asv=3), model)
+        self.assertEqual(model.calls, [4, 5])
+        self.assertAlmostEqual(response['fns'][0, 0], 24.2)
+
+    def test_reused_center(self):
+        fd = FiniteDifferences()
+        model = Rosenbrock()
+        fd.evaluate_batch(batch([[-1.2, 1.0]], asv=1), model)
+        response = fd.evaluate_batch(batch([[-1.2, 1.0]], asv=2), model)
+
+        # The known center is not evaluated again
+        self.assertEqual(model.calls, [1, 2])
+        self.assertEqual(fd.reused_centers, 1)
+        self.assertEqual(fd.stencil_points, 2)
+        self.assertEqual(response['fnGrads'].shape, (1, 1, 2))
+
+    def test_mixed_asv(self):
+        fd = FiniteDifferences(step=1e-7)
+        model = TwoFunctions()
+        kwargs = batch([[-1.2, 1.0]], asv=0)
+        kwargs.update(functions=2, asv=array([[1, 0]]))
+        fd.evaluate_batch(kwargs, model)
+        # The second function was not evaluated at the center, which is evaluated again
+        kwargs['asv'] = array([[1, 3]])
+        response = fd.evaluate_batch(kwargs, model)
+
+        self.assertEqual(model.calls, [1, 3])
+        self.assertEqual(fd.reused_centers, 0)
+        self.assertAlmostEqual(response['fns'][0, 0], 24.2)
+        self.assertAlmostEqual(response['fns'][0, 1], 2.2)
+        self.assertAlmostEqual(response['fnGrads'][0, 1, 0], -1.0, delta=1e-6)
+        self.assertAlmostEqual(response['fnGrads'][0, 1, 1], 1.0, delta=1e-6)
+
+        # Both functions are known at the center now
+        kwargs['asv'] = array([[3, 1]])
+        fd.evaluate_batch(kwargs, model)
+        self.assertEqual(model.calls, [1, 3, 2])
+        self.assertEqual(fd.reused_centers, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the start up cost of the dakota module.
+
+The import time is checked against a generous budget, catching a module
+loaded eagerly again rather than small regressions, which
+benchmarks/bench_dakota.py measures. The DAKOTA_IMPORT_BUDGET environment
+variable sets a tighter budget in seconds on a machine known to meet it.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Seconds allowed for a cold 'import dakota', NumPy included
+IMPORT_BUDGET = float(os.environ.get('DAKOTA_IMPORT_BUDGET', 2.0))
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import dakota
+elapsed = time.perf_counter() - start
+dakota.DakotaInput(method=['multidim_parameter_study'])
+loaded = {name: name in sys.modules for name in ('carolina', 'asyncio', 'concurrent.futures.process')}
+print(json.dumps(dict(elapsed=elapsed, loaded=loaded)))
+"""
+
+
+def measure():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, '-c', MEASURE], env=env, text=True)
+    return json.loads(output.splitlines()[-1])
+
+
+class TestCase(unittest.TestCase):
+
+    def test_lazy_import(self):
+        loaded = measure()['loaded']
+        self.assertEqual(loaded, {'carolina': False, 'asyncio': False, 'concurrent.futures.process': False})
+
+    def test_import_budget(self):
+        # Best of a few runs, to be robust against a busy machine
+        elapsed = min(measure()['elapsed'] for _ in range(3))
+        print(f'\nimport dakota: {elapsed:.3f} s')
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the output capture, with text written by hand.
+"""
+
+import logging
+import unittest
+
+from dakota_output import OutputCapture, line_level
+
+
+class TestCase(unittest.TestCase):
+
+    def test_lines_and_ring_buffer(self):
+        output = OutputCapture(maxlen=3)
+        output('stdout', 'first\nsec')
+        output('stderr', 'Error: oops\n')
+        output('stdout', 'ond\nthird\nfourth\nincomplete')
+        self.assertEqual(output.tail(10), ['second', 'third', 'fourth'])
+        self.assertEqual(output.lines_written, 5)
+
+        output.flush()
+        self.assertEqual(output.tail(2), ['fourth', 'incomplete'])
+        self.assertEqual(output.text('stderr'), '')
+        self.assertEqual(output.lines_written, 6)
+
+        output.clear()
+        self.assertEqual(output.lines(), [])
+
+    def test_level_filtering(self):
+        self.assertEqual(line_level('stdout', 'Method: sampling'), logging.INFO)
+        self.assertEqual(line_level('stdout', '  Warning: bounds'), logging.WARNING)
+        self.assertEqual(line_level('stderr', 'some text'), logging.WARNING)
+        self.assertEqual(line_level('stderr', 'Error in input'), logging.ERROR)
+
+        received = []
+        logger = logging.getLogger('dakota.test_output')
+        with self.assertLogs(logger, logging.WARNING) as logs:
+            output = OutputCapture(level=logging.WARNING, logger=logger, callback=received.append)
+            output('stdout', 'Begin evaluation 1\nWarning: slow\n')
+            output('stderr', 'Error: failed\n')
+        self.assertEqual(output.tail(), ['Warning: slow', 'Error: failed'])
+        self.assertEqual(output.lines_filtered, 1)
+        self.assertEqual([line.level for line in received], [logging.WARNING, logging.ERROR])
+        self.assertEqual(logs.output, ['WARNING:dakota.test_output:Warning: slow',
+                                       'ERROR:dakota.test_output:Error: failed'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the run profile, with callbacks recorded by hand.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from dakota_profile import RunProfile
+
+
+class TestCase(unittest.TestCase):
+
+    def test_summary_and_trace(self):
+        records = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            trace_file = os.path.join(tmpdir, 'trace.json')
+            profile = RunProfile(hook=records.append, trace_file=trace_file)
+            profile.start()
+            origin = profile.run_start
+
+            # Two evaluations, then a batch of two
+            profile.record((1,), [1], origin + 1.0, origin + 2.0)
+            profile.marshalled(0.1, 0.1)
+            profile.record((2,), [3], origin + 3.0, origin + 5.0)
+            profile.marshalled(0.1, 0.1)
+            profile.record((3, 4), [[1], [1]], origin + 6.0, origin + 7.0)
+            profile.marshalled(0.2, 0.2)
+            profile.finish()
+
+            summary = profile.summary()
+            self.assertEqual(summary['evaluations'], 4)
+            self.assertEqual(summary['callbacks'], 3)
+            self.assertAlmostEqual(summary['callback']['total'], 4.0)
+            self.assertAlmostEqual(summary['callback']['max'], 2.0)
+            self.assertAlmostEqual(summary['marshal']['total'], 0.8)
+            self.assertAlmostEqual(summary['dakota']['total'], 2.4)
+            self.assertEqual(len(records), 3)
+
+            with open(trace_file) as trace:
+                events = json.load(trace)['traceEvents']
+            callbacks = [event for event in events if event['name'] == 'callback']
+            self.assertEqual([event['args']['eval_ids'] for event in callbacks], [[1], [2], [3, 4]])
+            self.assertAlmostEqual(callbacks[1]['dur'], 2e6)
+
+    def test_failed_callbacks(self):
+        records = []
+        profile = RunProfile(hook=records.append)
+        profile.start()
+        origin = profile.run_start
+
+        # A callback that raised, one whose response could not be converted, then a success
+        profile.record((1,), [1], origin + 1.0, origin + 2.0, failed=True)
+        profile.marshalled(0.1, 0.0, True)
+        profile.record((2,), [1], origin + 3.0, origin + 4.0)
+        profile.marshalled(0.1, 0.1, True)
+        profile.record((3,), [1], origin + 5.0, origin + 6.0)
+        profile.marshalled(0.1, 0.1)
+        # Raised before the driver was called, nothing is recorded
+        profile.marshalled(0.1, 0.0, True)
+        profile.finish()
+
+        self.assertEqual([record.failed for record in records], [True, True, False])
+        summary = profile.summary()
+        self.assertEqual(summary['callbacks'], 3)
+        self.assertEqual(summary['failed'], 2)
+        self.assertIn('(2 failed)', profile.format_summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the remote executor, with plain functions evaluated by local workers.
+"""
+
+import os
+import threading
+import unittest
+from multiprocessing.connection import Client
+
+from dakota_remote import LocalWorkerPool, RemoteExecutor, WorkerLostError, serve
+
+
+def square(x):
+    return x * x
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def exit_worker():
+    os._exit(1)
+
+
+class TestCase(unittest.TestCase):
+
+    def test_local_workers(self):
+        with LocalWorkerPool(processes=2, max_in_flight=2) as pool:
+            self.assertEqual(pool.workers, 2)
+            self.assertEqual(list(pool.map(square, range(20))), [x * x for x in range(20)])
+            with self.assertRaisesRegex(ValueError, 'bad point'):
+                pool.submit(fail, 'bad point').result()
+        self.assertEqual(pool.completed, 21)
+        self.assertTrue(all(not process.is_alive() for process in pool.processes))
+
+    def test_lost_workers(self):
+        with LocalWorkerPool(processes=2, retries=1) as pool:
+            future = pool.submit(exit_worker)
+            with self.assertRaises(WorkerLostError):
+                future.result(timeout=30)
+            self.assertEqual(pool.requeued, 1)
+            self.assertEqual(pool.workers, 0)
+
+    def test_heartbeat_timeout(self):
+        executor = RemoteExecutor(family='AF_INET', heartbeat=0.05, timeout=0.3)
+        try:
+            # A worker that takes a task and never answers
+            silent = Client(executor.address, authkey=executor.authkey)
+            silent.send(('hello', 'silent'))
+            self.assertTrue(executor.wait_for_workers(1, timeout=5))
+            future = executor.submit(square, 3)
+            self.assertEqual(silent.recv()[0], 'task')
+
+            worker = threading.Thread(target=serve, args=(executor.address, executor.authkey, 0.05))
+            worker.start()
+            self.assertEqual(future.result(timeout=5), 9)
+            self.assertEqual(executor.requeued, 1)
+        finally:
+            executor.shutdown()
+            silent.close()
+        worker.join()
+
+    def test_shutdown_without_workers(self):
+        executor = RemoteExecutor(family='AF_INET', timeout=0.2)
+        future = executor.submit(square, 3)
+        cancelled = executor.submit(square, 4)
+        cancelled.cancel()
+        executor.shutdown()
+        with self.assertRaises(WorkerLostError):
+            future.result(timeout=0)
+        self.assertTrue(cancelled.cancelled())
+        with self.assertRaises(RuntimeError):
+            executor.submit(square, 5)
+
+    def test_shutdown_after_lost_workers(self):
+        pool = LocalWorkerPool(processes=1, retries=2, timeout=0.5)
+        lost = pool.submit(exit_worker)
+        pool.shutdown()
+        # Requeued once its worker exited, then no worker was left to evaluate it
+        self.assertIsInstance(lost.exception(timeout=0), WorkerLostError)
+        self.assertEqual(pool.workers, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
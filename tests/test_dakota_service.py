@@ -0,0 +1,84 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the service mode, with drivers that render their input without running DAKOTA.
+"""
+
+import unittest
+
+import dakota
+from dakota import DakotaBase, DakotaInput, DakotaResults
+from dakota_service import DakotaService, open_files, resident_set_size
+
+
+class RenderingDriver(DakotaBase):
+    """ Register itself as a run would, then return empty results or fail. """
+
+    def __init__(self, fail=False, interfaces=None):
+        dakota_input = DakotaInput(interfaces=dict.fromkeys(interfaces or {}), environment=[],
+                                   method=['multidim_parameter_study'], model=['single'],
+                                   variables=['continuous_design = 1'], responses=['num_objective_functions = 1'])
+        super().__init__(dakota_input, interfaces=interfaces)
+        self.fail = fail
+
+    def run_dakota(self, infile=None, **kwargs):
+        self.input.render(driver_instance=self)
+        if self.fail:
+            raise RuntimeError('DAKOTA analysis failed')
+        return DakotaResults()
+
+
+class TestCase(unittest.TestCase):
+
+    def test_teardown_and_reports(self):
+        service = DakotaService(history=2)
+        # Drivers of earlier tests may still be registered, until collected
+        DakotaService.teardown()
+        drivers = dakota.registered_drivers()
+        results = service.run(RenderingDriver(), infile=None)
+        self.assertIsInstance(results, DakotaResults)
+        with self.assertRaises(RuntimeError):
+            service.run(RenderingDriver(fail=True))
+        service.run(RenderingDriver())
+
+        self.assertEqual(service.runs, 3)
+        self.assertEqual([report.run for report in service.reports], [2, 3])
+        report = service.report
+        self.assertLessEqual(report.drivers, drivers)
+        self.assertGreater(report.rss, 0)
+        self.assertGreater(report.threads, 0)
+        self.assertEqual(report.interfaces, 0)
+
+    def test_teardown_interfaces(self):
+        service = DakotaService()
+        DakotaService.teardown()
+        drivers = dakota.registered_drivers()
+        lofi = RenderingDriver()
+        driver = RenderingDriver(interfaces={'lofi': lofi})
+        for _ in range(3):
+            service.run(driver, infile=None)
+            self.assertEqual(dakota.registered_drivers(), drivers)
+        self.assertEqual(service.report.drivers, drivers)
+
+    def test_measures(self):
+        self.assertGreater(resident_set_size(), 0)
+        count = open_files()
+        with open(__file__):
+            self.assertEqual(open_files(), count + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
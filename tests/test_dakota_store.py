@@ -0,0 +1,75 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the evaluation store, with evaluations listened to by hand.
+"""
+
+import tempfile
+import unittest
+
+import numpy
+
+from dakota_store import EvaluationStore, load_store
+
+
+def point(eval_id, x):
+    return dict(currEvalId=eval_id, functions=2, av=[x, 2 * x], av_labels=['x1', 'x2'], fn_labels=['f', 'g'],
+                asv=[1, 1])
+
+
+def batch(eval_ids, xs):
+    return dict(currEvalId=eval_ids, functions=2, av=[[x, 2 * x] for x in xs], av_labels=['x1', 'x2'],
+                fn_labels=['f', 'g'], asv=[[1, 1], [1, 0]][:len(xs)])
+
+
+class TestCase(unittest.TestCase):
+
+    def test_append_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = EvaluationStore(directory, flush_every=3)
+            store(point(1, 1.0), dict(fns=[1.0, 2.0]), 0.0, 1.0, False)
+            store(point(2, 2.0), dict(fns=numpy.array([4.0, 8.0])), 1.0, 2.0, False)
+            self.assertEqual(len(load_store(directory)), 0)
+
+            store(batch([3, 4], [3.0, 4.0]), dict(fns=numpy.array([[9.0, 27.0], [16.0, 64.0]])), 2.0, 3.0, True)
+            # Flushed after three rows, readable by label while the run goes on
+            self.assertEqual(load_store(directory).column('f').tolist(), [1.0, 4.0, 9.0, 16.0])
+
+            # Rows of another width are rejected
+            other = dict(point(5, 5.0), functions=1, fn_labels=['f'], asv=[1])
+            with self.assertRaisesRegex(RuntimeError, '1 functions'):
+                store(other, dict(fns=[25.0]), 3.0, 4.0, False)
+            store.close()
+
+            evaluations = load_store(directory)
+            self.assertIsInstance(evaluations.variables, numpy.memmap)
+            self.assertEqual(evaluations.eval_ids.tolist(), [1, 2, 3, 4])
+            self.assertEqual(evaluations.column('x2').tolist(), [2.0, 4.0, 6.0, 8.0])
+            self.assertEqual(evaluations.column('f').tolist(), [1.0, 4.0, 9.0, 16.0])
+            # Not requested
+            self.assertTrue(numpy.isnan(evaluations.responses[3, 1]))
+            self.assertEqual(evaluations.asv.tolist(), [[1, 1], [1, 1], [1, 1], [1, 0]])
+
+    def test_empty_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            EvaluationStore(directory).close()
+            evaluations = load_store(directory)
+            self.assertEqual(len(evaluations), 0)
+            self.assertEqual(evaluations.variables.shape, (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
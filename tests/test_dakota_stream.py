@@ -0,0 +1,90 @@
+# Copyright 2023 Equinor ASA
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+# ++==++==++==++==++==++==++==++==++==++==
+"""
+Tests of the streams, with a driver calling the budget and the listener as a run would.
+"""
+
+import unittest
+
+from numpy import array
+
+from dakota import DakotaResults
+from dakota_budget import StopStudy
+from dakota_stream import DakotaStream
+
+
+class LoopDriver:
+    """ Evaluate x ** 2 for x = 1, 2, ... until the budget of the run stops it. """
+
+    def __init__(self, evaluations=1000):
+        self.evaluations = evaluations
+        self.calls = 0
+
+    def run_dakota(self, listener=None, budget=None, **kwargs):
+        budget.start()
+        for eval_id in range(1, self.evaluations + 1):
+            try:
+                budget.check()
+            except StopStudy:
+                results = DakotaResults()
+                budget.finish(results)
+                return results
+            self.calls += 1
+            kwargs = dict(currEvalId=eval_id, functions=1, av=array([float(eval_id)]), av_labels=['x'],
+                          asv=array([1]))
+            response = dict(fns=array([float(eval_id) ** 2]))
+            budget(kwargs, response, 0.0, 0.0, False)
+            listener(kwargs, response, 0.0, 0.0, False)
+        return DakotaResults()
+
+
+class TestCase(unittest.TestCase):
+
+    def test_listener(self):
+        with self.assertRaises(RuntimeError):
+            DakotaStream(LoopDriver(), listener=lambda *args: None)
+
+    def test_complete(self):
+        with DakotaStream(LoopDriver(evaluations=5), maxsize=2) as stream:
+            evaluations = list(stream)
+        self.assertEqual([evaluation.eval_id for evaluation in evaluations], [1, 2, 3, 4, 5])
+        self.assertFalse(stream.result().stopped_early)
+
+    def test_close(self):
+        driver = LoopDriver()
+        stream = DakotaStream(driver, maxsize=2)
+        self.assertEqual(stream.get(timeout=10).eval_id, 1)
+        stream.close()
+        self.assertFalse(stream.running)
+        results = stream.result()
+        self.assertTrue(results.stopped_early)
+        self.assertLess(driver.calls, driver.evaluations)
+        self.assertIsNone(stream.get())
+
+    def test_abandoned_iteration(self):
+        driver = LoopDriver()
+        stream = DakotaStream(driver, maxsize=1)
+        for evaluation in stream:
+            if evaluation.eval_id == 3:
+                break
+        # The run does not wait for room in the queue of an abandoned stream
+        self.assertFalse(stream.running)
+        self.assertTrue(stream.result().stopped_early)
+        self.assertEqual(stream.result().final, dict(x=1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()